@@ -1,303 +1,296 @@
 import os
 import sys
 import time
-import re
+import traceback
 import warnings
-import PyPDF2
-from pdf2image import convert_from_path
-from PIL import Image
-from io import BytesIO
-from docx import Document
-from docx.shared import Inches
-from docx.enum.style import WD_STYLE_TYPE
-from docxcompose.composer import Composer
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, 
     QLabel, QLineEdit, QPushButton, QFileDialog, 
-    QProgressBar, QCheckBox, QMessageBox
+    QProgressBar, QCheckBox, QMessageBox, QComboBox
 )
 from PySide6.QtCore import Qt, QThread, Signal
 import multiprocessing
 from collections import deque
-from qt_material import apply_stylesheet
+from cache import ArtifactCache
+from metrics import MetricsLog
+from parallel import Cancelled
+from renderers import DEFAULT_RENDERER, RENDERER_ENV, RENDERERS, pdfium_available
+from reports import DEFAULT_REPORT, REPORTS_ENV, parse_reports, report_file_name
+from results import save_results
 
 CWD = os.path.dirname(sys.argv[0])
 CWD = os.path.normpath(CWD)
 print(CWD)
 
 # Add pdftoppm.exe and pdfinfo.exe to the path
-os.environ['PATH'] = os.environ['PATH'] + ';' + CWD
+os.environ['PATH'] = os.environ['PATH'] + os.pathsep + CWD
 
 warnings.simplefilter("ignore", UserWarning)
 
-for name, value in os.environ.items():
-    print("{0}: {1}".format(name, value))
-
-def convert_dict_to_csv(data, output_file):
-    with open(output_file, 'w') as file:
-        file.write('Cable,Load Maximum Demand,CB Rating,Current Capacity,MAX EF impedence,EF impedence,Result\n')
-        for cable, values in data.items():
-            result = 'Pass' if float(values['MAX EF impedence']) > float(values['EF impedence']) else 'Fail'
-            file.write(f"{cable},{values['Load Maximum Demand']},{values['CB Rating']},{values['Current Capacity']},{values['MAX EF impedence']},{values['EF impedence']},{result}\n")
-
-def pdf_to_txt(input_path, output_path):
-    basename = os.path.basename(input_path)
-    basename = os.path.splitext(basename)[0]
-    data = {basename: {}}
-    with open(input_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        text = ''
-        for page in range(len(reader.pages)):
-            text += reader.pages[page].extract_text()
-    
-    # Helper: remove thousands separators
-    def _clean(num_str):
-        return num_str.replace(',', '')
-
-    match = re.search(r"Load Maximum Demand\s*:\s*([\d,]+(?:\.\d+)?)", text)
-    if match:
-        data[basename].update({"Load Maximum Demand": _clean(match.group(1))})
-        
-    match = re.search(r"Rating\s*:\s*([\d,]+(?:\.\d+)?)", text)
-    if match:
-        data[basename].update({"CB Rating": _clean(match.group(1))})
-    else:
-        match = re.search(r"Rating \(In\)\s*:\s*([\d,]+(?:\.\d+)?)", text)
-        if match:
-            data[basename].update({"CB Rating": _clean(match.group(1))})
-    
-    match = re.search(r"Trip\s*:\s*([\d,]+(?:\.\d+)?)", text)
-    if match:
-        data[basename].update({"CB Rating": _clean(match.group(1))})
-    
-    match = re.search(r"Current Capacity\s*:\s*([\d,]+(?:\.\d+)?)", text)
-    if match:
-        data[basename].update({"Current Capacity": _clean(match.group(1))})
-    
-    match = re.search(r"Max\. Circuit Impedance \(max\. Zint\)\s*:\s*([\d,]+(?:\.\d+)?)", text)
-    if match:
-        data[basename].update({"MAX EF impedence": _clean(match.group(1))})
-
-    match = re.search(r"Earth Fault Loop Impedance \(Zint\)\s*:\s*([\d,]+(?:\.\d+)?)", text)
-    if match:
-        data[basename].update({"EF impedence": _clean(match.group(1))})
-    
-    return data
-
-def batch_export_process(input_files, output_files, output_folder, progress_queue):
-    import pythoncom
-    import pywinauto
-
-    pythoncom.CoInitialize()
-    
-    try:
-        pwa_app = pywinauto.application.Application()
-        total_files = len(input_files)
-
-        for i, file1 in enumerate(input_files):
-            outfile1 = output_files[i]
-            pwa_app.connect(title_re="PowerCad-5 - Version*")
-            window = pwa_app.window(title_re="PowerCad-5 - Version*")
-            window.menu_item(u'&File->&Open Project...\tCtrl+O').select()
-
-            window = pwa_app.window(title_re="Load Project File")
-            ctrl = window['Edit']
-            ctrl.set_text(file1)
-            ctrl = window['&Open']
-            ctrl.click()
-
-            time.sleep(0.5)
-            window = pwa_app.window(title_re="PowerCad-5 - Version*")
-            window.menu_item(u'&View->Local Mode').select()
-            window.menu_item(u'&File->&Print...').select()
+def batch_export_process(input_files, output_files, output_folder, progress_conn, cancel=None, metrics=None,
+                         driver=None, resume=False, reports=None):
+    from powercad import PowerCadError, PowerCadUnavailable, default_drivers, export_projects
 
-            window = pwa_app.window(title_re="PowerCad-5 Reports")
-            ctrl = window['Earth Fault Loop Impedance'] 
-            ctrl.click()
-
-            ctrl = window['Print...']
-            ctrl.click()
-
-            window = pwa_app.window(title_re="Print")
-            ctrl = window['OK']
-            ctrl.click()
+    # Messages to the GUI: ('instances', count), ('progress', done, total),
+    # ('exported', pdf_path), ('failed', pdf_path, error) and finally
+    # ('failures', {project: error}).
+    # `driver` is one driver or a list to shard the export across; by default
+    # every running PowerCad-5 gets a share.
+    try:
+        driver = driver or default_drivers()
+        progress_conn.send(('instances', len(driver) if isinstance(driver, (list, tuple)) else 1))
+        failures = export_projects(driver, input_files, output_files, output_folder,
+                                   progress=lambda done, total: progress_conn.send(('progress', done, total)),
+                                   cancel=cancel, metrics=metrics, resume=resume, reports=reports,
+                                   exported=lambda pdf_path: progress_conn.send(('exported', pdf_path)),
+                                   failed=lambda pdf_path, error: progress_conn.send(('failed', pdf_path, error)))
+        progress_conn.send(('failures', failures))
+    except PowerCadUnavailable as error:
+        # Projects already exported (e.g. found complete on resume) did not fail
+        print(error)
+        progress_conn.send(('failures', error.failures))
+    except PowerCadError as error:
+        print(error)
+        progress_conn.send(('failures', {project: str(error) for project in input_files}))
+    finally:
+        progress_conn.close()
+
+class StageThread(QThread):
+    # Shared runner for the stages: subclasses implement work(). cancel() asks
+    # the stage to stop after the file in hand, which then emits `cancelled`
+    # instead of its completion signal; a stage that raises emits `failed`
+    # with the error.
+    progress_update = Signal(int, int)
+    page_progress = Signal(str, int)
+    cancelled = Signal()
+    failed = Signal(str)
 
-            window = pwa_app.window(title_re="Save Print Output As")
-            ctrl = window['Toolbar4']
-            ctrl.click()
+    def __init__(self):
+        super().__init__()
+        # A process-safe event so the PowerCad export process can see it too
+        self.cancel_event = multiprocessing.Event()
 
-            window['Edit'].set_text(os.path.normpath(output_folder + '\\' + outfile1))
+    def cancel(self):
+        self.cancel_event.set()
 
-            ctrl = window['&Save']
-            ctrl.click()
+    def run(self):
+        try:
+            self.work()
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as error:
+            traceback.print_exc()
+            self.failed.emit(f"{type(error).__name__}: {error}")
 
-            window = pwa_app.window(title_re="PowerCad-5 Reports")
-            window["Close"].click()
+    def work(self):
+        raise NotImplementedError
 
-            progress_queue.put(int((i + 1) / total_files * 100))
+    def report_progress(self, done, total):
+        self.progress_update.emit(done, total)
 
-    finally:
-        pythoncom.CoUninitialize()
+    def report_page(self, name, page):
+        self.page_progress.emit(name, page)
 
-class BatchExportThread(QThread):
-    progress_update = Signal(int)
+class BatchExportThread(StageThread):
     export_complete = Signal()
+    export_failures = Signal(dict)
+    export_instances = Signal(int)
 
-    def __init__(self, input_files, output_files, output_folder):
+    def __init__(self, input_files, output_files, output_folder, metrics=None, driver=None, resume=False,
+                 reports=None):
         super().__init__()
         self.input_files = input_files
         self.output_files = output_files
         self.output_folder = output_folder
+        self.metrics = metrics
+        self.driver = driver
+        self.resume = resume
+        self.reports = reports or [DEFAULT_REPORT]
+
+    def work(self):
+        for _ in self.exported_pdfs():
+            pass
+        if self.cancel_event.is_set():
+            raise Cancelled
+        self.export_complete.emit()
 
-    def run(self):
-        progress_queue = multiprocessing.Queue()
+    def exported_pdfs(self):
+        # Runs the export process, relaying its progress, and yields
+        # (pdf path, None) as soon as that PDF has been saved and verified, or
+        # (pdf path, error) once its export has failed for good
+        receiver, sender = multiprocessing.Pipe(duplex=False)
         process = multiprocessing.Process(target=batch_export_process, 
-                                          args=(self.input_files, self.output_files, self.output_folder, progress_queue))
+                                          args=(self.input_files, self.output_files, self.output_folder, sender,
+                                                self.cancel_event, self.metrics, self.driver, self.resume,
+                                                self.reports))
         process.start()
+        # Only the export process holds the sending end now, so recv() raises
+        # EOFError as soon as it finishes or dies
+        sender.close()
+
+        try:
+            while True:
+                try:
+                    message = receiver.recv()
+                except EOFError:
+                    break
+                kind = message[0]
+                if kind == 'exported':
+                    yield message[1], None
+                elif kind == 'failed':
+                    yield message[1], message[2]
+                elif kind == 'progress':
+                    self.report_export_progress(*message[1:])
+                elif kind == 'instances':
+                    self.export_instances.emit(message[1])
+                elif kind == 'failures' and message[1]:
+                    self.export_failures.emit(message[1])
+        except GeneratorExit:
+            # The consumer gave up (e.g. conversion failed); stop exporting too
+            self.cancel_event.set()
+            raise
+        finally:
+            # Read what is left so the export process is never stuck sending
+            # on a full pipe while it winds down
+            while True:
+                try:
+                    receiver.recv()
+                except (EOFError, OSError):
+                    break
+            receiver.close()
+            process.join()
+
+    def report_export_progress(self, done, total):
+        self.progress_update.emit(done, total)
+
+class ExportAndConvertThread(BatchExportThread):
+    # Pipelined mode: PDFs go to the conversion workers as soon as the
+    # export process reports them saved, instead of after the whole export
+    export_progress = Signal(int, int)
+    conversion_complete = Signal(dict)
 
-        while process.is_alive():
-            while not progress_queue.empty():
-                progress = progress_queue.get()
-                self.progress_update.emit(progress)
-            time.sleep(0.1)
+    def __init__(self, input_files, output_files, output_folder, word=True, csv=True, max_workers=None, cache=None,
+                 metrics=None, driver=None, resume=False, reports=None):
+        super().__init__(input_files, output_files, output_folder, metrics=metrics, driver=driver, resume=resume,
+                         reports=reports)
+        self.word = word
+        self.csv = csv
+        self.max_workers = max_workers
+        self.cache = cache
 
-        process.join()
-        self.export_complete.emit()
+    def work(self):
+        from pipeline import convert_pdfs_pipelined
 
-class ConvertPDFsThread(QThread):
-    progress_update = Signal(int)
+        template_doc = os.path.join(CWD, 'template.docx')
+        default_doc = os.path.join(CWD, 'default.docx')
+
+        # Everything the outputs may contain, in the same order as the other modes:
+        # PDFs already in the folder plus the ones this export will write
+        existing = {f for f in os.listdir(self.output_folder) if f.endswith('.pdf')}
+        planned = {report_file_name(f, report) + '.pdf' for f in self.output_files for report in self.reports}
+        pdf_paths = [os.path.join(self.output_folder, f) for f in sorted(existing | planned)]
+
+        def exported():
+            # PDFs that are not part of this export are ready straight away
+            for f in sorted(existing - planned):
+                yield os.path.join(self.output_folder, f), None
+            yield from self.exported_pdfs()
+
+        output_path = None
+        if self.word:
+            output_path = os.path.normpath(os.path.join(self.output_folder, 'concatenated.docx'))
+        data = convert_pdfs_pipelined(exported(), pdf_paths, template_doc, default_doc, output_path, csv=self.csv,
+                                      max_workers=self.max_workers, progress=self.report_progress,
+                                      cache=self.cache, metrics=self.metrics, page_progress=self.report_page,
+                                      cancel=self.cancel_event)
+
+        # A cancelled export simply stops producing PDFs
+        if self.cancel_event.is_set():
+            raise Cancelled
+        if self.csv:
+            save_results(self.output_folder, data)
+        self.conversion_complete.emit(data)
+
+    def report_export_progress(self, done, total):
+        self.export_progress.emit(done, total)
+
+class ConvertPDFsThread(StageThread):
     conversion_complete = Signal()
 
-    def __init__(self, pdf_directory):
+    def __init__(self, pdf_directory, max_workers=None, cache=None, metrics=None):
         super().__init__()
         self.pdf_directory = pdf_directory
+        self.max_workers = max_workers
+        self.cache = cache
+        self.metrics = metrics
+
+    def work(self):
+        # Stage modules pull in python-docx, pdf2image and PIL; load them on first use
+        from convert import convert_pdfs_to_word
 
-    def run(self):
-        documents = []
-        
         template_doc = os.path.join(CWD, 'template.docx')
         default_doc = os.path.join(CWD, 'default.docx')
 
-        pdf_files = [f for f in os.listdir(self.pdf_directory) if f.endswith('.pdf')]
-        total_files = len(pdf_files)
+        pdf_files = sorted(f for f in os.listdir(self.pdf_directory) if f.endswith('.pdf'))
+        pdf_paths = [os.path.join(self.pdf_directory, f) for f in pdf_files]
 
-        for i, pdf_file in enumerate(pdf_files):
-            document = Document(template_doc)
+        convert_pdfs_to_word(pdf_paths, template_doc, default_doc,
+                             os.path.normpath(os.path.join(self.pdf_directory, 'concatenated.docx')),
+                             max_workers=self.max_workers, progress=self.report_progress, cache=self.cache,
+                             metrics=self.metrics, page_progress=self.report_page, cancel=self.cancel_event)
 
-            section = document.sections[0]
-            section.page_width = Inches(8.27)
-            section.page_height = Inches(11.69)
+        self.conversion_complete.emit()
 
-            section.left_margin = None
-            section.right_margin = None
-            section.top_margin = None
-            section.bottom_margin = None
-            
-            style = document.styles['Normal'].font.name = 'Arial'
-            style = document.styles['Normal'].font.bold = True
+class ConvertFusedThread(StageThread):
+    conversion_complete = Signal(dict)
 
-            cable_name = os.path.splitext(pdf_file)[0]
-            
-            for table in document.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            if "Cable Name" in paragraph.text:
-                                obj_styles = document.styles
-                                obj_charstyle = obj_styles.add_style('CommentsStyle', WD_STYLE_TYPE.PARAGRAPH)
-                                obj_font = obj_charstyle.font
-                                obj_font.bold = True
-                                obj_font.name = 'Arial'
-                                paragraph.text = paragraph.text.replace("Cable Name", cable_name)
-                                paragraph.style = document.styles['CommentsStyle']
-
-            with open(os.path.join(self.pdf_directory, pdf_file), 'rb') as f:
-                pdf = PyPDF2.PdfReader(f)
-                total_pages = len(pdf.pages)
-                page_height = Inches(9.5)
-                cropped_images = []
-
-                for page_num in range(total_pages):
-                    images = convert_from_path(os.path.join(self.pdf_directory, pdf_file), dpi=150, first_page=page_num+1, last_page=page_num+1)
-                    image = images[0]
-
-                    left = 170//2
-                    top = 782//2
-                    right = image.width - left
-                    bottom = image.height - 140//2
-
-                    image = image.crop((left, top, right, bottom))
-
-                    bottom = image.height
-                    threshold = sum(sum(pixel) for pixel in image.crop((left, bottom - 1, right, bottom)).getdata())
-
-                    bottom -= 1
-                    while bottom > 0:
-                        pixel_row = image.crop((left, bottom - 1, right, bottom))
-                        pixel_sum = sum(sum(pixel) for pixel in pixel_row.getdata())
-
-                        if pixel_sum < threshold:
-                            break
-
-                        bottom -= 1
-                    if bottom < 5:
-                        continue
-                    cropped_image = image.crop((0, 0, image.width, bottom))
-
-                    cropped_images.append(cropped_image)
-
-            max_image_heights = []
-
-            combined_height = 0
-            for cropped_image in cropped_images:
-                combined_height += cropped_image.height
-
-            for cropped_image in cropped_images:
-                max_image_heights.append(cropped_image.height / combined_height * page_height)
-
-            paragraph = document.add_paragraph()
-            for j, cropped_image in enumerate(cropped_images):
-                image_width = max_image_heights[j] * cropped_image.width / cropped_image.height * 0.85
-
-                image_stream = BytesIO()
-                cropped_image.save(image_stream, format='PNG')
-                image_stream.seek(0)
-
-                run = paragraph.add_run()
-                run.add_picture(image_stream, width=image_width)
-
-            documents.append(document)
-            self.progress_update.emit(int((i + 1) / total_files * 100))
-
-        concatenated_document = Document(default_doc)
-        composer = Composer(concatenated_document)
-        for document in documents:
-            composer.append(document)
-        composer.save(os.path.normpath(os.path.join(self.pdf_directory, 'concatenated.docx')))
-        
-        self.conversion_complete.emit()
+    def __init__(self, pdf_directory, max_workers=None, cache=None, metrics=None):
+        super().__init__()
+        self.pdf_directory = pdf_directory
+        self.max_workers = max_workers
+        self.cache = cache
+        self.metrics = metrics
+
+    def work(self):
+        from pipeline import convert_pdfs_fused
+
+        template_doc = os.path.join(CWD, 'template.docx')
+        default_doc = os.path.join(CWD, 'default.docx')
+
+        pdf_files = sorted(f for f in os.listdir(self.pdf_directory) if f.endswith('.pdf'))
+        pdf_paths = [os.path.join(self.pdf_directory, f) for f in pdf_files]
+
+        data = convert_pdfs_fused(pdf_paths, template_doc, default_doc,
+                                  os.path.normpath(os.path.join(self.pdf_directory, 'concatenated.docx')),
+                                  max_workers=self.max_workers, progress=self.report_progress, cache=self.cache,
+                                  metrics=self.metrics, page_progress=self.report_page, cancel=self.cancel_event)
+
+        save_results(self.pdf_directory, data)
+        self.conversion_complete.emit(data)
 
-class ConvertToCSVThread(QThread):
-    progress_update = Signal(int)
+class ConvertToCSVThread(StageThread):
     conversion_complete = Signal(dict)
 
-    def __init__(self, input_dir, output_dir):
+    def __init__(self, input_dir, output_dir, cache=None, max_workers=None, metrics=None):
         super().__init__()
         self.input_dir = input_dir
         self.output_dir = output_dir
+        self.cache = cache
+        self.max_workers = max_workers
+        self.metrics = metrics
 
-    def run(self):
-        data = {}
-        pdf_files = [f for f in os.listdir(self.input_dir) if f.endswith('.pdf')]
-        total_files = len(pdf_files)
+    def work(self):
+        from extract import collect_cable_info
+
+        pdf_files = sorted(f for f in os.listdir(self.input_dir) if f.endswith('.pdf'))
+        pdf_paths = [os.path.join(self.input_dir, f) for f in pdf_files]
 
-        for i, file in enumerate(pdf_files):
-            input_path = os.path.normpath(os.path.join(self.input_dir, file))
-            output_path = os.path.normpath(os.path.join(self.output_dir, file))
-            temp = pdf_to_txt(input_path, output_path)
-            data.update(temp)
-            self.progress_update.emit(int((i + 1) / total_files * 100))
+        data = collect_cable_info(pdf_paths, max_workers=self.max_workers, progress=self.report_progress,
+                                  cache=self.cache, metrics=self.metrics, page_progress=self.report_page,
+                                  cancel=self.cancel_event)
 
+        # Recorded in the results store in one transaction; the CSV is exported from it
+        save_results(self.output_dir, data)
         self.conversion_complete.emit(data)
         
         
@@ -307,6 +300,15 @@ class FolderBrowserApp(QWidget):
         self.setWindowTitle("POWERCAD-5 Batch Export")
         self.setGeometry(100, 100, 400, 300)  # Increased height to accommodate new label
         self.task_queue = deque()
+        self.artifact_cache = ArtifactCache()
+        self.metrics = MetricsLog()
+        self.stage_text = "Ready"
+        self.file_text = ""
+        self.page_text = ""
+        self.stage_started = time.perf_counter()
+        self.current_thread = None
+        self.resume_export = False
+        self.export_failures = {}
         
         layout = QVBoxLayout()
 
@@ -328,6 +330,29 @@ class FolderBrowserApp(QWidget):
         output_layout.addWidget(self.output_edit)
         output_layout.addWidget(self.output_button)
         
+        reports_layout = QHBoxLayout()
+        self.reports_label = QLabel("Reports:")
+        self.reports_edit = QLineEdit(DEFAULT_REPORT)
+        self.reports_edit.setToolTip("Comma-separated PowerCad reports to export from each project, as named in "
+                                     "the Reports dialog")
+        reports_layout.addWidget(self.reports_label)
+        reports_layout.addWidget(self.reports_edit)
+
+        renderer_layout = QHBoxLayout()
+        self.renderer_label = QLabel("Renderer:")
+        self.renderer_combo = QComboBox()
+        self.renderer_combo.addItems(RENDERERS)
+        if not pdfium_available():
+            # pdfium needs the optional pypdfium2 package
+            self.renderer_combo.model().item(RENDERERS.index('pdfium')).setEnabled(False)
+        renderer = os.environ.get(RENDERER_ENV)
+        self.renderer_combo.setCurrentText(renderer if renderer in RENDERERS else DEFAULT_RENDERER)
+        self.renderer_combo.setToolTip("How PDF pages are rasterized for Word: pdftoppm runs once per PDF, "
+                                       "pdfium renders inside the worker processes (needs pypdfium2)")
+        renderer_layout.addWidget(self.renderer_label)
+        renderer_layout.addWidget(self.renderer_combo)
+        renderer_layout.addStretch()
+
         checkbox_layout = QHBoxLayout()
         self.process_files_checkbox = QCheckBox("PCAD Batch Export")
         self.convert_pdfs_checkbox = QCheckBox("Convert PDFs to Word")
@@ -342,15 +367,23 @@ class FolderBrowserApp(QWidget):
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
 
+        button_layout = QHBoxLayout()
         self.process_button = QPushButton("Execute")
         self.process_button.clicked.connect(self.process_files)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        button_layout.addWidget(self.process_button)
+        button_layout.addWidget(self.cancel_button)
 
         layout.addLayout(input_layout)
         layout.addLayout(output_layout)
+        layout.addLayout(reports_layout)
+        layout.addLayout(renderer_layout)
         layout.addLayout(checkbox_layout)
         layout.addWidget(self.status_label)
         layout.addWidget(self.progress_bar)
-        layout.addWidget(self.process_button)
+        layout.addLayout(button_layout)
 
         self.setLayout(layout)
 
@@ -371,34 +404,58 @@ class FolderBrowserApp(QWidget):
         if output_folder:
             if self.process_files_checkbox.isChecked():
                 pdf_files = [f for f in os.listdir(output_folder) if f.lower().endswith('.pdf')]
+                self.resume_export = False
                 if pdf_files:
                     msg_box = QMessageBox()
                     msg_box.setIcon(QMessageBox.Warning)
                     msg_box.setText("PDF files were found in the output folder.")
-                    msg_box.setInformativeText("Do you want to delete these files before continuing?")
-                    msg_box.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
-                    reply = msg_box.exec()
-
-                    if reply == QMessageBox.Yes:
+                    msg_box.setInformativeText("Resume to export only the projects without a complete PDF, "
+                                               "or delete these files and export everything again.")
+                    resume_button = msg_box.addButton("Resume", QMessageBox.AcceptRole)
+                    delete_button = msg_box.addButton("Delete", QMessageBox.DestructiveRole)
+                    msg_box.addButton(QMessageBox.Cancel)
+                    msg_box.setDefaultButton(resume_button)
+                    msg_box.exec()
+
+                    if msg_box.clickedButton() == resume_button:
+                        self.resume_export = True
+                        print("Resuming export.")
+                    elif msg_box.clickedButton() == delete_button:
                         for pdf_file in pdf_files:
                             os.remove(os.path.normpath(os.path.join(output_folder, pdf_file)))
                         print("Existing PDF files deleted.")
-                    elif reply == QMessageBox.Cancel:
+                    else:
                         print("Operation cancelled.")
                         return
 
             self.progress_bar.setVisible(True)
             self.progress_bar.setValue(0)
             self.process_button.setEnabled(False)
+            self.cancel_button.setEnabled(True)
+
+            # The conversions tell the reports apart by these PDF name
+            # suffixes; set before any pool starts so the workers inherit it
+            os.environ[REPORTS_ENV] = ', '.join(parse_reports(self.reports_edit.text()))
+            os.environ[RENDERER_ENV] = self.renderer_combo.currentText()
 
             # Clear previous task queue and add new tasks
             self.task_queue.clear()
+            self.metrics = MetricsLog(output_folder)
+            self.export_failures = {}
             
-            if input_folder and self.process_files_checkbox.isChecked():
+            exporting = input_folder and self.process_files_checkbox.isChecked()
+            converting = self.convert_pdfs_checkbox.isChecked() or self.covert_info_to_csv_checkbox.isChecked()
+            if exporting and converting:
+                # Convert each PDF while PowerCad is busy exporting the next one
+                self.task_queue.append(self.start_export_and_conversion)
+            elif exporting:
                 self.task_queue.append(self.start_batch_export)
-            if self.convert_pdfs_checkbox.isChecked():
+            # Word and CSV share one read of each PDF when both are wanted
+            elif self.convert_pdfs_checkbox.isChecked() and self.covert_info_to_csv_checkbox.isChecked():
+                self.task_queue.append(self.start_fused_conversion)
+            elif self.convert_pdfs_checkbox.isChecked():
                 self.task_queue.append(self.start_pdf_conversion)
-            if self.covert_info_to_csv_checkbox.isChecked():
+            elif self.covert_info_to_csv_checkbox.isChecked():
                 self.task_queue.append(self.start_csv_conversion)
 
             # Start processing tasks
@@ -411,56 +468,166 @@ class FolderBrowserApp(QWidget):
         else:
             self.finish_processing()
 
-    def start_batch_export(self):
-        self.status_label.setText("Processing PCAD Batch Export...")
-        print(f"Processing files from {self.input_edit.text()} to {self.output_edit.text()}")
-
-        input_files = [f for f in os.listdir(self.input_edit.text()) if f.endswith(".QPJ")]
+    def export_file_lists(self):
+        # Sorted, so PDFs are exported in the order the Word and CSV outputs list them
+        input_files = sorted(f for f in os.listdir(self.input_edit.text()) if f.endswith(".QPJ"))
         input_files = [os.path.normpath(os.path.join(self.input_edit.text(), f)) for f in input_files]
         output_files = [os.path.splitext(os.path.basename(f))[0] for f in input_files]
 
         print(input_files)
         print(output_files)
+        return input_files, output_files
 
-        self.batch_export_thread = BatchExportThread(input_files, output_files, self.output_edit.text())
+    def start_batch_export(self):
+        self.set_stage("Processing PCAD Batch Export...")
+        print(f"Processing files from {self.input_edit.text()} to {self.output_edit.text()}")
+
+        input_files, output_files = self.export_file_lists()
+
+        self.batch_export_thread = BatchExportThread(input_files, output_files, self.output_edit.text(),
+                                                    metrics=self.metrics, resume=self.resume_export,
+                                                    reports=parse_reports(self.reports_edit.text()))
         self.batch_export_thread.progress_update.connect(self.update_progress)
+        self.batch_export_thread.export_failures.connect(self.record_export_failures)
+        self.batch_export_thread.export_instances.connect(self.show_export_instances)
         self.batch_export_thread.export_complete.connect(self.process_next_task)
-        self.batch_export_thread.start()
+        self.start_stage_thread(self.batch_export_thread)
+
+    def start_export_and_conversion(self):
+        self.set_stage("Exporting and converting PDFs...")
+        print(f"Exporting files from {self.input_edit.text()} to {self.output_edit.text()} and converting them")
+
+        input_files, output_files = self.export_file_lists()
+
+        self.export_conversion_thread = ExportAndConvertThread(
+            input_files, output_files, self.output_edit.text(), word=self.convert_pdfs_checkbox.isChecked(),
+            csv=self.covert_info_to_csv_checkbox.isChecked(), cache=self.artifact_cache, metrics=self.metrics,
+            resume=self.resume_export, reports=parse_reports(self.reports_edit.text()))
+        self.export_conversion_thread.progress_update.connect(self.update_progress)
+        self.export_conversion_thread.export_progress.connect(self.update_export_progress)
+        self.export_conversion_thread.export_failures.connect(self.record_export_failures)
+        self.export_conversion_thread.export_instances.connect(self.show_export_instances)
+        self.export_conversion_thread.conversion_complete.connect(self.finish_export_and_conversion)
+        self.start_stage_thread(self.export_conversion_thread)
+
+    def finish_export_and_conversion(self, data):
+        self.process_next_task()
 
     def start_pdf_conversion(self):
-        self.status_label.setText("Converting PDFs to Word...")
+        self.set_stage("Converting PDFs to Word...")
         print(f"Converting PDFs to Word in {self.output_edit.text()}")
         self.progress_bar.setValue(0)
-        self.pdf_conversion_thread = ConvertPDFsThread(self.output_edit.text())
+        self.pdf_conversion_thread = ConvertPDFsThread(self.output_edit.text(), cache=self.artifact_cache,
+                                                       metrics=self.metrics)
         self.pdf_conversion_thread.progress_update.connect(self.update_progress)
         self.pdf_conversion_thread.conversion_complete.connect(self.process_next_task)
-        self.pdf_conversion_thread.start()
+        self.start_stage_thread(self.pdf_conversion_thread)
+
+    def start_fused_conversion(self):
+        self.set_stage("Converting PDFs to Word and CSV...")
+        print(f"Converting PDFs to Word and CSV in {self.output_edit.text()}")
+        self.progress_bar.setValue(0)
+        self.fused_conversion_thread = ConvertFusedThread(self.output_edit.text(), cache=self.artifact_cache,
+                                                          metrics=self.metrics)
+        self.fused_conversion_thread.progress_update.connect(self.update_progress)
+        self.fused_conversion_thread.conversion_complete.connect(self.csv_saved)
+        self.start_stage_thread(self.fused_conversion_thread)
 
     def start_csv_conversion(self):
-        self.status_label.setText("Converting Info to CSV...")
+        self.set_stage("Converting Info to CSV...")
         print(f"Converting Info to CSV in {self.output_edit.text()}")
         self.progress_bar.setValue(0)
-        self.csv_conversion_thread = ConvertToCSVThread(self.output_edit.text(), self.output_edit.text())
+        self.csv_conversion_thread = ConvertToCSVThread(self.output_edit.text(), self.output_edit.text(),
+                                                       cache=self.artifact_cache, metrics=self.metrics)
         self.csv_conversion_thread.progress_update.connect(self.update_progress)
-        self.csv_conversion_thread.conversion_complete.connect(self.save_csv)
-        self.csv_conversion_thread.start()
+        self.csv_conversion_thread.conversion_complete.connect(self.csv_saved)
+        self.start_stage_thread(self.csv_conversion_thread)
 
-    def save_csv(self, data):
-        output_folder = self.output_edit.text()
-        convert_dict_to_csv(data, os.path.normpath(os.path.join(output_folder, '0cable_info.csv')))
+    def csv_saved(self, data):
+        # The stage thread has recorded the results and written 0cable_info.csv
         self.process_next_task()
 
+    def start_stage_thread(self, thread):
+        thread.page_progress.connect(self.update_page)
+        thread.cancelled.connect(self.cancelled_processing)
+        thread.failed.connect(self.failed_processing)
+        self.current_thread = thread
+        thread.start()
+
+    def cancel_processing(self):
+        # Queued stages are dropped; the running one stops after its current file
+        self.task_queue.clear()
+        self.cancel_button.setEnabled(False)
+        if self.current_thread is not None and self.current_thread.isRunning():
+            self.current_thread.cancel()
+            self.set_stage("Cancelling...")
+
+    def cancelled_processing(self):
+        self.current_thread = None
+        self.process_button.setEnabled(True)
+        self.status_label.setText("Cancelled")
+        print("Processing cancelled.")
+
+    def failed_processing(self, error):
+        # The remaining stages are dropped, as on cancel
+        self.task_queue.clear()
+        self.current_thread = None
+        self.process_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.status_label.setText(f"Failed: {error}")
+        print(f"Processing failed: {error}")
+
+    def record_export_failures(self, failures):
+        self.export_failures = failures
+
+    def show_export_instances(self, count):
+        if count > 1:
+            self.stage_text = self.stage_text.rstrip('.') + f" across {count} PowerCad instances..."
+            self.show_status()
+
     def finish_processing(self):
+        self.current_thread = None
         self.progress_bar.setValue(100)
         self.process_button.setEnabled(True)
-        self.status_label.setText("Complete")
+        self.cancel_button.setEnabled(False)
+        if self.export_failures:
+            self.status_label.setText(f"Complete, {len(self.export_failures)} export(s) failed")
+        else:
+            self.status_label.setText("Complete")
         print("All processes completed!")
 
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
+    def set_stage(self, text):
+        self.stage_text = text
+        self.file_text = ""
+        self.page_text = ""
+        self.stage_started = time.perf_counter()
+        self.show_status()
+
+    def show_status(self):
+        self.status_label.setText("\n".join(text for text in (self.stage_text, self.file_text, self.page_text) if text))
+
+    def update_progress(self, done, total):
+        self.progress_bar.setValue(int(done / total * 100))
+        elapsed = time.perf_counter() - self.stage_started
+        rate = done / elapsed if elapsed > 0 else 0
+        self.file_text = f"{done}/{total} files"
+        if rate:
+            eta = int((total - done) / rate)
+            self.file_text += f", {rate:.1f} files/s, ETA {eta // 60}:{eta % 60:02d}"
+        self.show_status()
+
+    def update_export_progress(self, done, total):
+        self.stage_text = self.stage_text.split('...')[0] + f"... exported {done}/{total}"
+        self.show_status()
+
+    def update_page(self, name, page):
+        self.page_text = f"{name}: page {page}"
+        self.show_status()
 
 if __name__ == "__main__":
     multiprocessing.freeze_support()  # Necessary for multiprocessing to work with PyInstaller
+    from qt_material import apply_stylesheet
+
     app = QApplication([])
     window = FolderBrowserApp()
     theme = os.path.normpath(os.path.join(CWD, 'color-theme.xml'))
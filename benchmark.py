@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from layout import LAYOUT_ENV
+from renderers import pdfium_available
+from synthetic_reports import generate_reports
+
+CWD = os.path.normpath(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(CWD, 'benchmark_baseline.json')
+STAGES = ['export', 'export_sharded', 'render', 'render_full', 'render_pdfium', 'csv', 'word', 'fused']
+# Fake PowerCad instances the export_sharded stage spreads the projects over
+EXPORT_INSTANCES = 4
+# Relative slowdown or memory growth against the baseline that counts as a regression
+TOLERANCE = 0.15
+
+
+def peak_rss():
+    # (this process, largest reaped child) peak resident set size in bytes
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        # Pool workers are not visible from here on Windows
+        return counters.PeakWorkingSetSize, None
+
+    import resource
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def run_stage(stage, folder, workers):
+    # Runs in its own process so peak memory belongs to this stage alone
+    pdf_paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.pdf'))
+    template_doc = os.path.join(CWD, 'template.docx')
+    default_doc = os.path.join(CWD, 'default.docx')
+    docx_path = os.path.join(folder, 'concatenated.docx')
+    pages = None
+
+    started = time.perf_counter()
+    if stage in ('export', 'export_sharded'):
+        from powercad import FakePowerCadDriver, export_projects
+
+        # The fake driver's simulated PowerCad latency is the floor; the rest is loop and wait overhead
+        project_folder = os.path.join(folder, 'projects')
+        export_folder = os.path.join(folder, 'exported')
+        os.makedirs(project_folder, exist_ok=True)
+        os.makedirs(export_folder, exist_ok=True)
+        names = [os.path.splitext(os.path.basename(pdf_path))[0] for pdf_path in pdf_paths]
+        projects = [os.path.join(project_folder, name + '.QPJ') for name in names]
+        for project in projects:
+            open(project, 'w').close()
+        started = time.perf_counter()
+        instances = EXPORT_INSTANCES if stage == 'export_sharded' else 1
+        drivers = [FakePowerCadDriver() for _ in range(instances)]
+        failures = export_projects(drivers, projects, names, export_folder)
+        if failures:
+            raise RuntimeError(f"{len(failures)} export(s) failed")
+    elif stage in ('render', 'render_full', 'render_pdfium'):
+        from convert import report_crops
+
+        # render rasterizes only the report window of each page, render_full
+        # whole pages; render_pdfium is render with the in-process renderer
+        pages = 0
+        renderer = 'pdfium' if stage == 'render_pdfium' else 'pdftoppm'
+        for pdf_path in pdf_paths:
+            for _ in report_crops(pdf_path, region=stage != 'render_full', renderer=renderer):
+                pages += 1
+    elif stage == 'csv':
+        from extract import collect_cable_info, convert_dict_to_csv
+
+        convert_dict_to_csv(collect_cable_info(pdf_paths, max_workers=workers),
+                            os.path.join(folder, '0cable_info.csv'))
+    elif stage == 'word':
+        from convert import convert_pdfs_to_word
+
+        convert_pdfs_to_word(pdf_paths, template_doc, default_doc, docx_path, max_workers=workers)
+    elif stage == 'fused':
+        from extract import convert_dict_to_csv
+        from pipeline import convert_pdfs_fused
+
+        convert_dict_to_csv(convert_pdfs_fused(pdf_paths, template_doc, default_doc, docx_path, max_workers=workers),
+                            os.path.join(folder, '0cable_info.csv'))
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    seconds = time.perf_counter() - started
+
+    peak_self, peak_child = peak_rss()
+    return {'seconds': seconds, 'rendered_pages': pages, 'peak_rss': peak_self, 'peak_worker_rss': peak_child}
+
+
+def measure(stage, folder, workers):
+    command = [sys.executable, os.path.abspath(__file__), '--child', stage, folder]
+    if workers:
+        command += ['--workers', str(workers)]
+    # Layouts learned from the synthetic reports stay out of the real ones
+    env = {**os.environ, LAYOUT_ENV: os.path.join(folder, 'layouts.json')}
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"{stage} stage failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for stage, result in results.items():
+        previous = baseline.get(stage)
+        if not previous:
+            continue
+        if result['seconds_per_file'] > previous['seconds_per_file'] * (1 + tolerance):
+            regressions.append(f"{stage}: {result['seconds_per_file']:.4f}s/file vs "
+                               f"{previous['seconds_per_file']:.4f}s/file baseline")
+        if previous.get('peak_rss') and result['peak_rss'] > previous['peak_rss'] * (1 + tolerance):
+            regressions.append(f"{stage}: peak RSS {result['peak_rss'] / 2 ** 20:.0f} MiB vs "
+                               f"{previous['peak_rss'] / 2 ** 20:.0f} MiB baseline")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the conversion stages on synthetic PowerCad reports.")
+    parser.add_argument('--count', type=int, default=40, help="number of synthetic reports")
+    parser.add_argument('--min-pages', type=int, default=2)
+    parser.add_argument('--max-pages', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count - 1)")
+    parser.add_argument('--stages', default=','.join(STAGES), help="comma-separated subset of " + ','.join(STAGES))
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--child', nargs=2, metavar=('STAGE', 'FOLDER'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    os.environ['PATH'] = os.environ['PATH'] + os.pathsep + CWD
+
+    if args.child:
+        print(json.dumps(run_stage(*args.child, args.workers)))
+        return 0
+
+    stages = [stage for stage in args.stages.split(',') if stage]
+    if 'render_pdfium' in stages and not pdfium_available():
+        # It would only time pdftoppm again, under the wrong name
+        print("Skipping render_pdfium: pypdfium2 is not installed")
+        stages.remove('render_pdfium')
+    scenario = f"{args.count} reports x {args.min_pages}-{args.max_pages} pages, workers={args.workers or 'auto'}"
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        reports = generate_reports(folder, args.count, args.min_pages, args.max_pages)
+        total_pages = sum(pages for _, pages in reports)
+        print(f"{scenario}: {total_pages} pages")
+        for stage in stages:
+            result = measure(stage, folder, args.workers)
+            results[stage] = {
+                'seconds': round(result['seconds'], 4),
+                'seconds_per_file': round(result['seconds'] / args.count, 5),
+                'files_per_second': round(args.count / result['seconds'], 3),
+                'pages_per_second': round(total_pages / result['seconds'], 3),
+                'peak_rss': result['peak_rss'],
+                'peak_worker_rss': result['peak_worker_rss'],
+            }
+            worker_rss = result['peak_worker_rss']
+            print(f"  {stage:<14} {result['seconds']:8.2f}s  {results[stage]['files_per_second']:7.2f} files/s  "
+                  f"{results[stage]['pages_per_second']:7.2f} pages/s  "
+                  f"peak {result['peak_rss'] / 2 ** 20:6.0f} MiB"
+                  + (f" (worker {worker_rss / 2 ** 20:.0f} MiB)" if worker_rss else ""))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+
+    if args.save_baseline:
+        baselines[scenario] = {**baselines.get(scenario, {}), **results}
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if scenario not in baselines:
+        print("No baseline for this scenario yet; run with --save-baseline to record one")
+        return 0
+
+    regressions = compare(results, baselines[scenario], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+
+CACHE_DIR = os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~'), 'PCAD Batch Export', 'cache')
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path):
+    with open(path, 'rb') as file:
+        return hashlib.file_digest(file, 'sha256').hexdigest()
+
+
+class ArtifactCache:
+    # Per-PDF artifacts keyed by the PDF's content hash plus the settings that
+    # produced them, so renamed or re-exported but unchanged reports still hit.
+    # Entries are single files; reads refresh mtime and eviction drops the
+    # least recently used entries once the cache grows past max_bytes.
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, digest, kind, settings):
+        # digest is the PDF's file_digest(); kind names the artifact
+        settings = json.dumps(settings, sort_keys=True)
+        return f"{kind}-" + hashlib.sha256(f"{digest}:{kind}:{settings}".encode()).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key[-2:], f"{key}.{extension}")
+
+    def _read(self, key, extension):
+        path = self._path(key, extension)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, key, extension, data):
+        path = self._path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent workers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get_pages(self, key):
+        data = self._read(key, 'zip')
+        if data is None:
+            return None
+        try:
+            with zipfile.ZipFile(BytesIO(data)) as archive:
+                return [archive.read(name) for name in sorted(archive.namelist())]
+        except zipfile.BadZipFile:
+            return None
+
+    def put_pages(self, key, pages):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for i, page in enumerate(pages):
+                archive.writestr(f"page-{i:04d}.png", page)
+        self._write(key, 'zip', buffer.getvalue())
+
+    def get_fields(self, key):
+        data = self._read(key, 'json')
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def put_fields(self, key, fields):
+        self._write(key, 'json', json.dumps(fields).encode())
+
+    def evict(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,282 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+
+from cache import CACHE_DIR, ArtifactCache
+from metrics import METRICS_FILE, MetricsLog
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+CWD = os.path.normpath(os.path.dirname(os.path.abspath(sys.argv[0])))
+
+
+class Reporter:
+    # Human-readable lines by default, or one JSON object per line with --json
+
+    def __init__(self, as_json, stream=sys.stdout):
+        self.as_json = as_json
+        self.stream = stream
+
+    def emit(self, event, message, **fields):
+        if self.as_json:
+            self.stream.write(json.dumps({'event': event, **fields}) + '\n')
+        else:
+            self.stream.write(message + '\n')
+        self.stream.flush()
+
+    def progress(self, stage):
+        def report(done, total):
+            self.emit('progress', f"{stage}: {done}/{total}", stage=stage, done=done, total=total)
+        return report
+
+
+def list_pdfs(folder):
+    pdf_files = sorted(f for f in os.listdir(folder) if f.endswith('.pdf'))
+    return [os.path.join(folder, f) for f in pdf_files]
+
+
+def image_policy(args):
+    from convert import image_policy
+
+    return image_policy(dpi=args.image_dpi, mode=args.image_mode)
+
+
+def run_word(folder, pdf_paths, args, cache, metrics, reporter):
+    from convert import convert_pdfs_to_word
+
+    output_path = os.path.normpath(os.path.join(folder, 'concatenated.docx'))
+    return convert_pdfs_to_word(pdf_paths, os.path.join(CWD, 'template.docx'), os.path.join(CWD, 'default.docx'),
+                                output_path, max_workers=args.workers, progress=reporter.progress('word'),
+                                cache=cache, metrics=metrics, image_policy=image_policy(args),
+                                shard_size=args.shard_size)
+
+
+def save_csv(folder, data, args):
+    from results import CSV_FILE, RESULTS_DB, csv_files, save_results, write_csv
+
+    output_path = os.path.normpath(os.path.join(folder, CSV_FILE))
+    if args.no_results:
+        write_csv(data, output_path)
+    else:
+        save_results(folder, data, args.results_db or RESULTS_DB, args.project)
+    return csv_files(data, output_path)
+
+
+def run_csv(folder, pdf_paths, args, cache, metrics, reporter):
+    from extract import collect_cable_info
+
+    data = collect_cable_info(pdf_paths, max_workers=args.workers, progress=reporter.progress('csv'), cache=cache,
+                              metrics=metrics)
+    return save_csv(folder, data, args)
+
+
+def run_fused(folder, pdf_paths, args, cache, metrics, reporter):
+    from concat import report_files
+    from pipeline import convert_pdfs_fused
+    from reports import DEFAULT_REPORT, report_of
+
+    docx_path = os.path.normpath(os.path.join(folder, 'concatenated.docx'))
+    data = convert_pdfs_fused(pdf_paths, os.path.join(CWD, 'template.docx'), os.path.join(CWD, 'default.docx'),
+                              docx_path, max_workers=args.workers, progress=reporter.progress('word+csv'),
+                              cache=cache, metrics=metrics, image_policy=image_policy(args),
+                              shard_size=args.shard_size)
+    reports = dict.fromkeys([DEFAULT_REPORT] + [report_of(pdf_path) for pdf_path in pdf_paths])
+    return report_files(docx_path, reports) + save_csv(folder, data, args)
+
+
+def run_watch(folder, args, cache, metrics, reporter):
+    from results import RESULTS_DB
+    from watch import FolderWatcher
+
+    def events(kind, **fields):
+        if kind == 'published':
+            message = f"watch: {fields['files']} PDF(s) -> {', '.join(fields['outputs'])}"
+        elif kind == 'failed':
+            message = f"watch: {fields['pdf']} failed: {fields['error']}"
+        else:
+            message = f"watch: {kind} {fields['pdf']}"
+        reporter.emit(kind, message, stage='watch', **fields)
+
+    watcher = FolderWatcher(folder, os.path.join(CWD, 'template.docx'), os.path.join(CWD, 'default.docx'),
+                            word=args.word, csv=args.csv, settle=args.settle, max_workers=args.workers, cache=cache,
+                            metrics=metrics, image_policy=image_policy(args),
+                            results_db=None if args.no_results else args.results_db or RESULTS_DB,
+                            project=args.project, events=events)
+    reporter.emit('start', f"watch: watching {folder}, Ctrl+C to stop", stage='watch', folder=folder)
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    reporter.emit('stopped', "watch: stopped", stage='watch')
+    return EXIT_OK
+
+
+def queue_events(reporter, stage):
+    def events(kind, **fields):
+        if kind == 'queued':
+            message = f"{stage}: queued {fields['files']} PDF(s)"
+        elif kind == 'waiting':
+            message = f"{stage}: waiting for the workers, {fields['done']}/{fields['total']} done"
+        elif kind == 'failed':
+            message = f"{stage}: {fields['pdf']} failed: {fields['error']}"
+        else:
+            message = f"{stage}: {kind} {fields['pdf']}"
+        reporter.emit(kind, message, stage=stage, **fields)
+    return events
+
+
+def run_coordinate(folder, pdf_paths, args, cache, metrics, reporter):
+    from results import RESULTS_DB
+    from shared_queue import coordinate
+
+    # The queue lists the folder's PDFs itself, so the workers see the same ones
+    outputs, failures = coordinate(folder, os.path.join(CWD, 'template.docx'), os.path.join(CWD, 'default.docx'),
+                                   word=args.word, csv=args.csv, work=not args.no_work, max_workers=args.workers,
+                                   cache=cache, metrics=metrics, image_policy=image_policy(args),
+                                   results_db=None if args.no_results else args.results_db or RESULTS_DB,
+                                   project=args.project, shard_size=args.shard_size, lease_seconds=args.lease,
+                                   interval=args.interval, events=queue_events(reporter, 'coordinate'))
+    for name, error in failures.items():
+        reporter.emit('failed', f"coordinate: {name} failed: {error}", stage='coordinate', pdf=name, error=error)
+    return outputs
+
+
+def run_worker(folder, args, cache, metrics, reporter):
+    from shared_queue import run_worker
+
+    stage = 'worker'
+    reporter.emit('start', f"{stage}: working on the queue in {folder}", stage=stage, folder=folder)
+    started = time.perf_counter()
+    try:
+        converted = run_worker(folder, os.path.join(CWD, 'template.docx'), max_workers=args.workers, cache=cache,
+                               metrics=metrics, image_policy=image_policy(args), lease_seconds=args.lease,
+                               interval=args.interval, events=queue_events(reporter, stage))
+    except KeyboardInterrupt:
+        reporter.emit('stopped', f"{stage}: stopped", stage=stage)
+        return EXIT_OK
+    except Exception as error:
+        reporter.emit('error', f"{stage} failed: {error}", stage=stage, error=str(error), type=type(error).__name__)
+        return EXIT_FAILED
+    elapsed = time.perf_counter() - started
+    reporter.emit('complete', f"{stage}: converted {converted} PDF(s) in {elapsed:.1f}s, queue done", stage=stage,
+                  files=converted, seconds=round(elapsed, 3))
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Convert exported PowerCad report PDFs without the GUI.")
+    parser.add_argument('folder', help="folder containing the exported report PDFs; outputs are written here")
+    parser.add_argument('--word', action='store_true', help="build concatenated.docx")
+    parser.add_argument('--csv', action='store_true', help="build 0cable_info.csv")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count - 1)")
+    parser.add_argument('--image-dpi', type=int, default=None,
+                        help="resolution of page images at their size in Word, 0 keeps the rendered size (default: 200)")
+    parser.add_argument('--image-mode', choices=['rgb', 'grayscale', 'indexed'], default=None,
+                        help="page image colour mode (default: indexed)")
+    parser.add_argument('--shard-size', type=int, default=None, metavar='CABLES',
+                        help="split the Word output into concatenated-001.docx, ... of this many cables each")
+    parser.add_argument('--results-db', default=None, help="results database (default: next to the cache)")
+    parser.add_argument('--project', default=None, help="project name the results are recorded under "
+                                                         "(default: the folder name)")
+    parser.add_argument('--no-results', action='store_true', help="write the CSV without recording the run")
+    parser.add_argument('--reports', default=None,
+                        help="comma-separated reports the export printed, whose PDFs are named \"<cable> [<report>].pdf\" "
+                             "(default: $PCAD_REPORTS, else Earth Fault Loop Impedance alone)")
+    parser.add_argument('--renderer', choices=['pdftoppm', 'pdfium'], default=None,
+                        help="page rasterizer (default: $PCAD_RENDERER, else pdftoppm); pdfium needs pypdfium2")
+    parser.add_argument('--no-cache', action='store_true', help="ignore and do not update the artifact cache")
+    parser.add_argument('--cache-dir', default=None, help="artifact cache location")
+    parser.add_argument('--no-metrics', action='store_true', help=f"do not write {METRICS_FILE}")
+    parser.add_argument('--profile', action='store_true', help="write cProfile stats for each stage")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and update the outputs as PDFs are added, replaced or removed")
+    parser.add_argument('--interval', type=float, default=2,
+                        help="seconds between folder scans with --watch, or queue polls with --coordinate/--worker")
+    parser.add_argument('--settle', type=float, default=5,
+                        help="seconds a PDF must stay unchanged before --watch converts it")
+    parser.add_argument('--coordinate', action='store_true',
+                        help="queue the PDFs for --worker processes on other machines sharing the folder, work on "
+                             "them too and merge the outputs once all are converted")
+    parser.add_argument('--no-work', action='store_true', help="with --coordinate, only wait for the workers and merge")
+    parser.add_argument('--worker', action='store_true',
+                        help="convert PDFs from the folder's --coordinate queue until none are left")
+    parser.add_argument('--lease', type=float, default=120,
+                        help="seconds a worker's claim on a PDF lasts unless renewed (default: 120)")
+    parser.add_argument('--json', action='store_true', help="print JSON lines instead of text")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not (args.word or args.csv or args.worker):
+        parser.error("nothing to do, pass --word and/or --csv")
+    if sum([args.watch, args.coordinate, args.worker]) > 1:
+        parser.error("--watch, --coordinate and --worker cannot be combined")
+    if not os.path.isdir(args.folder):
+        parser.error(f"not a folder: {args.folder}")
+    if args.renderer:
+        from renderers import RENDERER_ENV, pdfium_available
+
+        if args.renderer == 'pdfium' and not pdfium_available():
+            parser.error("--renderer pdfium needs pypdfium2 (pip install pypdfium2)")
+        # Set before the pools start so every worker inherits it
+        os.environ[RENDERER_ENV] = args.renderer
+
+    if args.reports:
+        from reports import REPORTS_ENV, parse_reports
+
+        os.environ[REPORTS_ENV] = ', '.join(parse_reports(args.reports))
+
+    # Add pdftoppm.exe and pdfinfo.exe to the path
+    os.environ['PATH'] = os.environ['PATH'] + os.pathsep + CWD
+    warnings.simplefilter("ignore", UserWarning)
+
+    reporter = Reporter(args.json)
+    cache = None
+    if not args.no_cache:
+        cache = ArtifactCache(args.cache_dir or CACHE_DIR)
+
+    folder = os.path.normpath(args.folder)
+    metrics = MetricsLog(None if args.no_metrics else folder, profile=args.profile or None)
+    if args.watch:
+        return run_watch(folder, args, cache, metrics, reporter)
+    if args.worker:
+        # Other machines' metrics would interleave in the shared folder's file
+        return run_worker(folder, args, cache, MetricsLog(profile=args.profile or None), reporter)
+    pdf_paths = list_pdfs(folder)
+    if args.coordinate:
+        stage, run = 'coordinate', run_coordinate
+    elif args.word and args.csv:
+        stage, run = 'word+csv', run_fused
+    elif args.word:
+        stage, run = 'word', run_word
+    else:
+        stage, run = 'csv', run_csv
+
+    reporter.emit('start', f"{stage}: {len(pdf_paths)} PDF(s) in {folder}", stage=stage, folder=folder,
+                  files=len(pdf_paths))
+    started = time.perf_counter()
+    try:
+        outputs = run(folder, pdf_paths, args, cache, metrics, reporter)
+    except Exception as error:
+        reporter.emit('error', f"{stage} failed: {error}", stage=stage, error=str(error),
+                      type=type(error).__name__)
+        return EXIT_FAILED
+
+    elapsed = time.perf_counter() - started
+    reporter.emit('complete', f"{stage}: done in {elapsed:.1f}s -> {', '.join(outputs)}", stage=stage,
+                  files=len(pdf_paths), outputs=outputs, seconds=round(elapsed, 3))
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import glob
+import hashlib
+import os
+import posixpath
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from docx import Document
+from docx.image.image import Image as DocxImage
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import parse_xml
+from docx.oxml.section import CT_SectPr
+from docxcompose.composer import Composer
+from docxcompose.image import ImageWrapper
+from docxcompose.utils import NS, xpath
+
+from metrics import span
+from reports import DEFAULT_REPORT, report_of, report_output
+
+# Fragment parts every cable shares with the first one when they come from
+# the same template.docx
+SHARED_PARTS = ['word/styles.xml', 'word/numbering.xml', 'word/settings.xml', 'word/footnotes.xml']
+# Body content that needs docxcompose's full merge: relationships other than
+# images, numbering, extra sections, fields and notes
+FULL_MERGE_XPATH = ('.//*[@r:id]|.//*[@r:link]|.//w:numId|.//w:sectPr|.//w:fldSimple|.//w:instrText'
+                    '|.//w:footnoteReference|.//w:endnoteReference|.//dgm:relIds')
+STYLE_XPATH = './/w:tblStyle|.//w:pStyle|.//w:rStyle'
+BLIP_XPATH = './/a:blip[@r:embed]|.//asvg:svgBlip[@r:embed]'
+RELATIONSHIPS_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# Shards are numbered concatenated-001.docx, concatenated-002.docx, ...
+SHARD_DIGITS = 3
+
+
+class ReportComposer(Composer):
+    # docxcompose already stores byte-identical images once, but finds them by
+    # re-hashing every image in the output for each one appended. Keep an index
+    # of the output's images by SHA-1 instead.
+
+    def __init__(self, doc):
+        super().__init__(doc)
+        self.image_parts_by_sha1 = {part.sha1: part for part in self.pkg.image_parts}
+
+    def image_part(self, sha1, image):
+        part = self.image_parts_by_sha1.get(sha1)
+        if part is None:
+            part = self.pkg.image_parts._add_image_part(image)
+            self.image_parts_by_sha1[sha1] = part
+        return part
+
+    def add_images(self, doc, element):
+        for blip in xpath(element, "(.//a:blip|.//asvg:svgBlip)[@r:embed]"):
+            rid = blip.get("{%s}embed" % NS["r"])
+            img_part = doc.part.rels[rid].target_part
+            new_img_part = self.image_part(img_part.sha1, ImageWrapper(img_part))
+
+            blip.set("{%s}embed" % NS["r"], self.doc.part.relate_to(new_img_part, RT.IMAGE))
+
+            rid = blip.get("{%s}link" % NS["r"])
+            if rid:
+                new_rel = self.add_relationship(None, self.doc.part, doc.part.rels[rid])
+                blip.set("{%s}link" % NS["r"], new_rel.rId)
+
+
+class ReportBuilder:
+    # Concatenates cable fragments that all come from template.docx. Appending
+    # with docxcompose re-merges styles and renumbers drawing ids across the
+    # whole output for every cable, which grows with the document. Here only
+    # the first fragment gets that full merge; the others share its styles,
+    # numbering and settings, so their body XML is copied in as-is apart from
+    # style ids and images, and ids are renumbered once on save. A fragment
+    # that does not fit that pattern still gets the full merge.
+
+    def __init__(self, default_path):
+        self.composer = ReportComposer(Document(default_path))
+        self.body = self.composer.doc.element.body
+        self.shared = None
+        # fragment style id -> output style id, for styles the full merge brought in
+        self.style_ids = {}
+        self.cables = 0
+
+    def append(self, fragment):
+        package = zipfile.ZipFile(BytesIO(fragment))
+        shared = self._shared_parts(package)
+        if shared != self.shared or not self._append_fast(package):
+            self._append_full(fragment)
+            self.shared = shared
+        self.cables += 1
+
+    def save(self, path):
+        composer = self.composer
+        composer.renumber_bookmarks()
+        composer.renumber_docpr_ids()
+        composer.renumber_nvpicpr_ids()
+        composer.save(path)
+
+    @staticmethod
+    def _shared_parts(package):
+        names = set(package.namelist())
+        return tuple(hashlib.sha1(package.read(name)).hexdigest() if name in names else None
+                     for name in SHARED_PARTS)
+
+    def _append_full(self, fragment):
+        doc = Document(BytesIO(fragment))
+        used = {element.val for element in xpath(doc.element.body, STYLE_XPATH)}
+        self.composer.append(doc)
+        for style_id in used:
+            self.style_ids[style_id] = self.composer.mapped_style_id(style_id)
+
+    def _append_fast(self, package):
+        document = parse_xml(package.read('word/document.xml'))
+        elements = [element for element in document.body if not isinstance(element, CT_SectPr)]
+        for element in elements:
+            if xpath(element, FULL_MERGE_XPATH):
+                return False
+            if any(style.val not in self.style_ids for style in xpath(element, STYLE_XPATH)):
+                return False
+
+        targets = self._image_targets(package)
+        blips = [blip for element in elements for blip in xpath(element, BLIP_XPATH)]
+        if any(blip.get('{%s}embed' % NS['r']) not in targets for blip in blips):
+            return False
+
+        composer = self.composer
+        sect_pr = self.body.sectPr
+        for element in elements:
+            for style in xpath(element, STYLE_XPATH):
+                style.val = self.style_ids[style.val]
+            for blip in xpath(element, BLIP_XPATH):
+                blob = package.read(targets[blip.get('{%s}embed' % NS['r'])])
+                part = composer.image_part(hashlib.sha1(blob).hexdigest(), DocxImage.from_blob(blob))
+                blip.set('{%s}embed' % NS['r'], composer.doc.part.relate_to(part, RT.IMAGE))
+            if sect_pr is None:
+                self.body.append(element)
+            else:
+                sect_pr.addprevious(element)
+        return True
+
+    @staticmethod
+    def _image_targets(package):
+        # rId -> zip member of every internal image relationship of the body
+        rels = parse_xml(package.read('word/_rels/document.xml.rels'))
+        targets = {}
+        for rel in rels.iter(RELATIONSHIPS_NS + 'Relationship'):
+            if rel.get('Type') == RT.IMAGE and rel.get('TargetMode') != 'External':
+                target = rel.get('Target')
+                if target.startswith('/'):
+                    targets[rel.get('Id')] = target[1:]
+                else:
+                    targets[rel.get('Id')] = posixpath.normpath(posixpath.join('word', target))
+        return targets
+
+
+def shard_path(output_path, index):
+    root, ext = os.path.splitext(output_path)
+    return f"{root}-{index:0{SHARD_DIGITS}d}{ext}"
+
+
+def shard_files(output_path):
+    root, ext = os.path.splitext(output_path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r'-\d{%d}' % SHARD_DIGITS + re.escape(ext) + '$')
+    shards = glob.glob(glob.escape(root) + '-*' + ext)
+    return sorted(path for path in shards if pattern.match(os.path.basename(path)))
+
+
+def report_files(output_path, reports=(DEFAULT_REPORT,)):
+    # The documents a report run wrote for each of `reports`: output_path (or
+    # its report's version of it), or its numbered shards
+    paths = []
+    for report in reports:
+        path = report_output(output_path, report)
+        paths += [path] if os.path.exists(path) else shard_files(path)
+    return paths
+
+
+class ReportWriter:
+    # Writes the concatenated report to output_path or, with shard_size, to
+    # numbered documents of shard_size cables each (concatenated-001.docx,
+    # ...). Each finished shard is saved on a background thread while the
+    # next one is built.
+
+    def __init__(self, default_path, output_path, shard_size=None):
+        self.default_path = default_path
+        self.output_path = output_path
+        self.shard_size = shard_size
+        self.builder = None
+        self.paths = []
+        self.saves = []
+        self.executor = ThreadPoolExecutor() if shard_size else None
+
+    def append(self, fragment, name=None):
+        if self.builder is None:
+            self.builder = ReportBuilder(self.default_path)
+        with span('compose', name):
+            self.builder.append(fragment)
+        if self.shard_size and self.builder.cables >= self.shard_size:
+            self._finish_shard()
+
+    def _finish_shard(self):
+        path = shard_path(self.output_path, len(self.paths) + 1)
+        self.paths.append(path)
+        self.saves.append(self.executor.submit(self._save, self.builder, path))
+        self.builder = None
+
+    @staticmethod
+    def _save(builder, path):
+        with span('save', os.path.basename(path)):
+            builder.save(path)
+
+    def save(self):
+        # Returns the documents written, after removing the outputs of an
+        # earlier run with a different shard size
+        if not self.shard_size:
+            self._save(self.builder or ReportBuilder(self.default_path), self.output_path)
+            self.paths = [self.output_path]
+            stale = shard_files(self.output_path)
+        else:
+            if self.builder is not None or not self.paths:
+                self.builder = self.builder or ReportBuilder(self.default_path)
+                self._finish_shard()
+            try:
+                for future in self.saves:
+                    future.result()
+            finally:
+                self.executor.shutdown()
+            stale = [path for path in shard_files(self.output_path) if path not in self.paths]
+            if os.path.exists(self.output_path):
+                stale.append(self.output_path)
+
+        for path in stale:
+            os.remove(path)
+        return self.paths
+
+
+class ReportSet:
+    # One ReportWriter per report type: fragments are routed by the name of
+    # the PDF they came from, so each report gets its own document ("<output>
+    # [<report>].docx" for all but the default report). The default report's
+    # document is always written, as before.
+
+    def __init__(self, default_path, output_path, shard_size=None):
+        self.default_path = default_path
+        self.output_path = output_path
+        self.shard_size = shard_size
+        self.writers = {}
+
+    def writer(self, report):
+        if report not in self.writers:
+            self.writers[report] = ReportWriter(self.default_path, report_output(self.output_path, report),
+                                                self.shard_size)
+        return self.writers[report]
+
+    def append(self, fragment, name):
+        self.writer(report_of(name)).append(fragment, name)
+
+    def save(self):
+        # Returns the documents written, default report first
+        self.writer(DEFAULT_REPORT)
+        paths = self.writers[DEFAULT_REPORT].save()
+        for report, writer in self.writers.items():
+            if report != DEFAULT_REPORT:
+                paths += writer.save()
+        return paths
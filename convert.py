@@ -0,0 +1,361 @@
+import copy
+import os
+import sys
+from io import BytesIO
+from itertools import chain
+
+from docx import Document
+from docx.shared import Inches
+from docx.enum.style import WD_STYLE_TYPE
+from docx.text.paragraph import Paragraph
+from PIL import Image
+
+from cache import file_digest
+from concat import ReportSet
+from layout import LayoutProfile, LayoutStore
+from metrics import MetricsLog, span, timed_iter
+from parallel import report_page, run_jobs
+from pdf_render import iter_pdf_pages, page_sizes
+from renderers import renderer_name
+from reports import DEFAULT_REPORT, report_of, split_report_name
+from trim import MARGIN_BOTTOM, MARGIN_LEFT, MARGIN_TOP, MIN_CONTENT_HEIGHT, crop_report_page
+
+
+class FragmentTemplate:
+    placeholder = "Cable Name"
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self.document = Document(template_path)
+
+        section = self.document.sections[0]
+        section.page_width = Inches(8.27)
+        section.page_height = Inches(11.69)
+
+        section.left_margin = None
+        section.right_margin = None
+        section.top_margin = None
+        section.bottom_margin = None
+
+        self.document.styles['Normal'].font.name = 'Arial'
+        self.document.styles['Normal'].font.bold = True
+
+        # (child index path from <w:body>, original text) per placeholder paragraph
+        self.placeholders = []
+        body = self.document.element.body
+        for table in self.document.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    for paragraph in cell.paragraphs:
+                        if self.placeholder in paragraph.text:
+                            self._add_comments_style()
+                            paragraph.style = self.document.styles['CommentsStyle']
+                            self.placeholders.append((self._element_path(body, paragraph._p), paragraph.text))
+
+        # Reload the prepared template so no python-docx proxies are cached on
+        # it; those hold sub-elements that deepcopy would detach from the clone.
+        prepared = BytesIO()
+        self.document.save(prepared)
+        prepared.seek(0)
+        self.document = Document(prepared)
+
+    def _add_comments_style(self):
+        if 'CommentsStyle' in [style.name for style in self.document.styles]:
+            return
+        obj_charstyle = self.document.styles.add_style('CommentsStyle', WD_STYLE_TYPE.PARAGRAPH)
+        obj_font = obj_charstyle.font
+        obj_font.bold = True
+        obj_font.name = 'Arial'
+
+    @staticmethod
+    def _element_path(root, element):
+        path = []
+        while element is not root:
+            parent = element.getparent()
+            path.append(parent.index(element))
+            element = parent
+        return tuple(reversed(path))
+
+    def new_document(self, cable_name):
+        document = copy.deepcopy(self.document)
+        body = document.element.body
+        for path, text in self.placeholders:
+            element = body
+            for index in path:
+                element = element[index]
+            Paragraph(element, document).text = text.replace(self.placeholder, cable_name)
+        return document
+
+
+_templates = {}
+
+
+def load_template(template_path):
+    # Parsed once per process (i.e. once per pool worker per run), and again
+    # only if the template file changes on disk
+    key = (template_path, os.path.getmtime(template_path))
+    if key not in _templates:
+        _templates.clear()
+        _templates[key] = FragmentTemplate(template_path)
+    return _templates[key]
+
+
+# Everything that changes the cropped page images; part of the cache key
+PAGE_SETTINGS = {
+    'version': 1,
+    'dpi': 150,
+    'margins': [MARGIN_LEFT, MARGIN_TOP, MARGIN_BOTTOM],
+    'min_height': MIN_CONTENT_HEIGHT,
+    # Rasterize only the report window of each page
+    'region': True,
+}
+
+# A cable's pages share CONTENT_HEIGHT in proportion to their heights and are
+# shown at WIDTH_SCALE of that size
+CONTENT_HEIGHT = Inches(9.5)
+WIDTH_SCALE = 0.85
+
+# How page images are stored in the Word output:
+#   dpi             resample to the size Word displays them at this DPI (0 keeps the rendered size)
+#   mode            'rgb', 'grayscale' or 'indexed' (adaptive palette of `colors`)
+#   compress_level  zlib level for the PNG encoder, 0-9
+IMAGE_POLICY = {
+    'dpi': 200,
+    'mode': 'indexed',
+    'colors': 64,
+    'compress_level': 6,
+}
+IMAGE_MODES = ['rgb', 'grayscale', 'indexed']
+
+
+def image_policy(**overrides):
+    return {**IMAGE_POLICY, **{k: v for k, v in overrides.items() if v is not None}}
+
+
+def display_scale(crops, dpi):
+    # Every page of a cable is displayed at the same pixels-per-inch, so one
+    # factor brings them all to the target DPI. Never upscale.
+    if not dpi or not crops:
+        return 1
+    combined_height = sum(crop.height for crop in crops)
+    return min(1, WIDTH_SCALE * CONTENT_HEIGHT.inches * dpi / combined_height)
+
+
+def encode_page_image(crop, scale, policy):
+    if scale < 1:
+        size = (max(1, round(crop.width * scale)), max(1, round(crop.height * scale)))
+        crop = crop.resize(size, Image.LANCZOS)
+    if policy['mode'] == 'grayscale':
+        crop = crop.convert('L')
+    elif policy['mode'] == 'indexed':
+        crop = crop.quantize(colors=policy['colors'], method=Image.Quantize.FASTOCTREE)
+    image_stream = BytesIO()
+    crop.save(image_stream, format='PNG', compress_level=policy['compress_level'])
+    return image_stream.getvalue()
+
+
+def page_size(source):
+    # The size in points shared by every page, or None (unreadable geometry,
+    # or pages of different sizes)
+    try:
+        sizes = set(page_sizes(source))
+    except Exception:
+        return None
+    if len(sizes) != 1:
+        return None
+    return sizes.pop()
+
+
+# Layout profiles of this process, backed by the file every process shares
+_layouts = LayoutStore()
+
+
+def stored_layout(size, name=None):
+    # The stored layout profile for this PDF's report type and page size;
+    # None if there is none yet or the pages have no single size
+    if size is None:
+        return None
+    return _layouts.get(report_of(name) if name else DEFAULT_REPORT, size, PAGE_SETTINGS['dpi'])
+
+
+def pdf_layout(source, name=None):
+    # (page size, stored profile) of a PDF, read once and handed to
+    # report_crops()
+    size = page_size(source)
+    return size, stored_layout(size, name)
+
+
+def report_crops(source, name=None, region=None, renderer=None, layout=None):
+    # Yields each page cropped to its report content (None for a blank page).
+    # Pages are cropped with the layout profile of their report type: with
+    # region, only its content box (and the edges of the header and footer)
+    # is rasterized, and the first page of each PDF is spot checked against
+    # it. The first PDF of a report type (or one whose first page fails the
+    # check) is rendered in full and the profile learned from its first
+    # page. PDFs with pages of different sizes keep the fixed margins.
+    # `layout` is pdf_layout()'s result when the caller already has it.
+    dpi = PAGE_SETTINGS['dpi']
+    if region is None:
+        region = PAGE_SETTINGS['region']
+    size, profile = layout or pdf_layout(source, name)
+    if size is None:
+        yield from trimmed(full_pages(source, dpi, renderer, name), crop_report_page, name)
+        return
+
+    report = report_of(name) if name else DEFAULT_REPORT
+    if profile is not None and region:
+        pages = timed_iter(iter_pdf_pages(source, dpi=dpi, region=profile.window, renderer=renderer),
+                           'rasterize', name)
+        first = next(pages, None)
+        if first is None:
+            return
+        with span('layout_check', name):
+            fits = profile.check(first)
+        if fits:
+            yield from trimmed(chain([first], pages), lambda image: profile.trim(profile.crop(image, window=True)),
+                               name)
+            return
+        pages.close()
+        print(f"{name}: page layout of the {report} report changed, learning it again", file=sys.stderr)
+        profile = None
+
+    pages = full_pages(source, dpi, renderer, name)
+    first = next(pages, None)
+    if first is None:
+        return
+    if profile is None:
+        with span('layout_learn', name):
+            profile = LayoutProfile.learn(first, report, size, dpi)
+        _layouts.put(profile)
+    yield from trimmed(chain([first], pages), lambda image: profile.trim(profile.crop(image)), name)
+
+
+def full_pages(source, dpi, renderer, name):
+    return timed_iter(iter_pdf_pages(source, dpi=dpi, renderer=renderer), 'rasterize', name)
+
+
+def trimmed(pages, crop, name):
+    for image in pages:
+        with span('trim', name):
+            cropped_image = crop(image)
+        yield cropped_image
+
+
+def render_page_images(source, name=None, policy=None, layout=None):
+    policy = policy or IMAGE_POLICY
+    crops = []
+    for page, cropped_image in enumerate(report_crops(source, name, layout=layout), 1):
+        report_page(name, page)
+        if cropped_image is not None:
+            crops.append(cropped_image)
+
+    # The display size depends on every page of the cable, so encode once all are cropped
+    scale = display_scale(crops, policy['dpi'])
+    page_images = []
+    for crop in crops:
+        with span('encode', name):
+            page_images.append(encode_page_image(crop, scale, policy))
+    return page_images
+
+
+def load_page_images(source, cache=None, digest=None, name=None, policy=None):
+    # source is a PDF path or its bytes; pass the digest if it is already known
+    policy = policy or IMAGE_POLICY
+    if name is None and not isinstance(source, bytes):
+        name = os.path.basename(source)
+    if cache is None:
+        return render_page_images(source, name, policy)
+
+    if digest is None:
+        digest = file_digest(source)
+
+    # The page geometry is read once, for the key and the render
+    size, profile = layout = pdf_layout(source, name)
+
+    def page_key(profile):
+        # Renderers anti-alias differently, so each has its own cached pages
+        return cache.key(digest, 'pages', {**PAGE_SETTINGS, 'renderer': renderer_name(), 'image': policy,
+                                           'layout': profile.key if profile else None})
+
+    page_images = cache.get_pages(page_key(profile))
+    if page_images is None:
+        page_images = render_page_images(source, name, policy, layout)
+        # Under the profile the pages were cropped with, which the render
+        # may have just learned
+        cache.put_pages(page_key(stored_layout(size, name)), page_images)
+    return page_images
+
+
+def cable_name_for(pdf_path):
+    return os.path.splitext(os.path.basename(pdf_path))[0]
+
+
+def build_cable_document(cable_name, page_images, template):
+    # Headed with the cable alone; each report type has its own document
+    document = template.new_document(split_report_name(cable_name)[0])
+
+    page_height = CONTENT_HEIGHT
+    image_sizes = [Image.open(BytesIO(page_image)).size for page_image in page_images]
+
+    max_image_heights = []
+
+    combined_height = 0
+    for _, height in image_sizes:
+        combined_height += height
+
+    for _, height in image_sizes:
+        max_image_heights.append(height / combined_height * page_height)
+
+    paragraph = document.add_paragraph()
+    for j, page_image in enumerate(page_images):
+        width, height = image_sizes[j]
+        image_width = max_image_heights[j] * width / height * WIDTH_SCALE
+
+        run = paragraph.add_run()
+        run.add_picture(BytesIO(page_image), width=image_width)
+
+    return document
+
+
+def document_bytes(document):
+    stream = BytesIO()
+    document.save(stream)
+    return stream.getvalue()
+
+
+def build_cable_fragment(pdf_path, template_path, cache=None, policy=None):
+    # Runs in a pool worker; the finished fragment travels back as .docx bytes
+    page_images = load_page_images(pdf_path, cache, policy=policy)
+    name = os.path.basename(pdf_path)
+    with span('fragment', name):
+        return document_bytes(build_cable_document(cable_name_for(pdf_path), page_images,
+                                                   load_template(template_path)))
+
+
+def convert_pdfs_to_word(pdf_paths, template_path, default_path, output_path, max_workers=None, progress=None,
+                         cache=None, metrics=None, image_policy=None, page_progress=None, cancel=None,
+                         shard_size=None):
+    # Returns the documents written: output_path, or its numbered shards, and
+    # the same for each other report type among the PDFs
+    total_files = len(pdf_paths)
+    metrics = metrics or MetricsLog()
+
+    with metrics.stage('word', files=total_files):
+        report = ReportSet(default_path, output_path, shard_size)
+
+        # Each fragment is appended as soon as it is next in order and dropped
+        # straight after, rather than holding every cable's document until the end.
+        jobs = ((pdf_path, template_path, cache, image_policy) for pdf_path in pdf_paths)
+        job = metrics.instrument(build_cable_fragment, 'word')
+        fragments = run_jobs(job, jobs, total_files, max_workers, window=2, progress=progress,
+                             page_progress=page_progress, cancel=cancel)
+        for i, (fragment, spans) in enumerate(fragments):
+            metrics.write(spans)
+            report.append(fragment, os.path.basename(pdf_paths[i]))
+
+        paths = report.save()
+
+        if cache is not None:
+            cache.evict()
+
+    return paths
@@ -0,0 +1,170 @@
+import os
+import re
+from io import BytesIO
+
+import PyPDF2
+
+from cache import file_digest
+from metrics import MetricsLog, span, timed_iter
+from parallel import report_page, run_jobs
+from reports import DEFAULT_REPORT, report_of
+
+# Bump when FIELD_SPEC or the extraction below changes so cached field dicts are not reused
+PDF_TO_TXT_VERSION = 1
+
+# Each field lists its labels in priority order: a match on an earlier label
+# anywhere in the report beats any match on a later one, e.g. a breaker's
+# "Trip" setting overrides its "Rating".
+FIELD_SPEC = [
+    ("Load Maximum Demand", [r"Load Maximum Demand"]),
+    ("CB Rating", [r"Trip", r"Rating", r"Rating \(In\)"]),
+    ("Current Capacity", [r"Current Capacity"]),
+    ("MAX EF impedence", [r"Max\. Circuit Impedance \(max\. Zint\)"]),
+    ("EF impedence", [r"Earth Fault Loop Impedance \(Zint\)"]),
+]
+
+NUMBER = r"[\d,]+(?:\.\d+)?"
+
+
+class FieldExtractor:
+    # Text carried over between pages so a label split across a page break is
+    # still found; comfortably longer than any "label : value" match.
+    carry = 256
+
+    def __init__(self, spec, required=None):
+        self.fields = [field for field, _ in spec]
+        self.required = set(self.fields if required is None else required)
+        self.groups = {}
+        alternatives = []
+        for i, (field, labels) in enumerate(spec):
+            for priority, label in enumerate(labels):
+                group = f"f{i}_{priority}"
+                self.groups[group] = (field, priority)
+                alternatives.append(rf"(?:{label})\s*:\s*(?P<{group}>{NUMBER})")
+        self.pattern = re.compile("|".join(alternatives))
+
+    def _record(self, match, found):
+        field, priority = self.groups[match.lastgroup]
+        if field not in found or priority < found[field][0]:
+            found[field] = (priority, match.group(match.lastgroup).replace(',', ''))
+
+    def _settled(self, found):
+        # Done once every required field has matched its top-priority label
+        return all(found.get(field, (1,))[0] == 0 for field in self.required)
+
+    def extract(self, page_texts):
+        found = {}
+        tail = ''
+        for page_text in page_texts:
+            text = tail + page_text
+            keep_from = max(0, len(text) - self.carry)
+            for match in self.pattern.finditer(text):
+                if not text[match.end():].strip('0123456789,.'):
+                    # The value may carry on over the page break
+                    keep_from = min(keep_from, match.start())
+                    break
+                self._record(match, found)
+            tail = text[keep_from:]
+            if self._settled(found):
+                break
+
+        for match in self.pattern.finditer(tail):
+            self._record(match, found)
+
+        return {field: found[field][1] for field in self.fields if field in found}
+
+
+REPORT_FIELDS = FieldExtractor(FIELD_SPEC)
+# Report name -> the extractor for its PDFs. A report without one still gets
+# its Word document, but no fields and no CSV.
+REPORT_EXTRACTORS = {
+    DEFAULT_REPORT: REPORT_FIELDS,
+}
+
+
+def convert_dict_to_csv(data, output_file):
+    # 0cable_info.csv without recording the run; see results.save_results()
+    from results import write_csv
+
+    write_csv(data, output_file)
+
+
+def read_fields(file, name=None, report_pages=False, report=DEFAULT_REPORT):
+    extractor = REPORT_EXTRACTORS.get(report)
+    if extractor is None:
+        return {}
+    reader = PyPDF2.PdfReader(file)
+    # Pages are only parsed for text until every field has been found
+    page_texts = timed_iter((page.extract_text() for page in reader.pages), 'pdf_text', name)
+    if report_pages:
+        page_texts = reported_pages(page_texts, name)
+    return extractor.extract(page_texts)
+
+
+def reported_pages(pages, name):
+    for page, item in enumerate(pages, 1):
+        report_page(name, page)
+        yield item
+
+
+def pdf_to_txt(input_path, output_path):
+    basename = os.path.basename(input_path)
+    basename = os.path.splitext(basename)[0]
+    with open(input_path, 'rb') as file:
+        fields = read_fields(file, report=report_of(input_path))
+    return {basename: fields}
+
+
+def load_fields(source, cache=None, digest=None, name=None, report_pages=False):
+    # source is a PDF path or its bytes; pass the digest if it is already known
+    # The report type, and with it the extractor, comes from the PDF's name
+    if name is None and not isinstance(source, bytes):
+        name = os.path.basename(source)
+    report = report_of(name) if name else DEFAULT_REPORT
+    if cache is not None:
+        if digest is None:
+            digest = file_digest(source)
+        settings = {'version': PDF_TO_TXT_VERSION}
+        if report != DEFAULT_REPORT:
+            settings['report'] = report
+        key = cache.key(digest, 'fields', settings)
+        fields = cache.get_fields(key)
+        if fields is not None:
+            return fields
+
+    with span('extract', name):
+        if isinstance(source, bytes):
+            fields = read_fields(BytesIO(source), name, report_pages, report)
+        else:
+            with open(source, 'rb') as file:
+                fields = read_fields(file, name, report_pages, report)
+
+    if cache is not None:
+        cache.put_fields(key, fields)
+    return fields
+
+
+def pdf_to_txt_cached(input_path, output_path, cache=None):
+    basename = os.path.splitext(os.path.basename(input_path))[0]
+    return {basename: load_fields(input_path, cache, report_pages=True)}
+
+
+def collect_cable_info(pdf_paths, max_workers=None, progress=None, cache=None, metrics=None, page_progress=None,
+                       cancel=None):
+    data = {}
+    total_files = len(pdf_paths)
+    metrics = metrics or MetricsLog()
+
+    with metrics.stage('csv', files=total_files):
+        jobs = ((os.path.normpath(pdf_path), os.path.normpath(pdf_path), cache) for pdf_path in pdf_paths)
+        job = metrics.instrument(pdf_to_txt_cached, 'csv')
+        results = run_jobs(job, jobs, total_files, max_workers, window=4, progress=progress,
+                           page_progress=page_progress, cancel=cancel)
+        for temp, spans in results:
+            metrics.write(spans)
+            data.update(temp)
+
+        if cache is not None:
+            cache.evict()
+
+    return data
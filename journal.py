@@ -0,0 +1,94 @@
+import csv
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILE = '0export_journal.jsonl'
+FAILURE_REPORT = '0export_failures.csv'
+
+PENDING = 'pending'
+EXPORTED = 'exported'
+VERIFIED = 'verified'
+FAILED = 'failed'
+
+
+def verify_pdf(path):
+    # Cheap completeness check: a PDF header and an end-of-file marker near
+    # the end, which a truncated or interrupted write will not have
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            head = file.read(5)
+            file.seek(max(0, size - 1024))
+            tail = file.read()
+    except OSError:
+        return False
+    return head == b'%PDF-' and b'%%EOF' in tail
+
+
+class ExportJournal:
+    # Append-only record of each PDF's export state in the output folder. The
+    # last line for a PDF wins, and every line is flushed to disk before the
+    # export moves on, so a crash loses at most the line being written. Safe
+    # to write from the threads of a sharded export.
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, JOURNAL_FILE)
+        self.entries = {}
+        # Set when a crash left the file without its final newline
+        self.torn = False
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                for line in file:
+                    self.torn = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['pdf']] = entry
+
+    def reset(self):
+        self.entries.clear()
+        self.torn = False
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def state(self, pdf_name):
+        entry = self.entries.get(pdf_name)
+        return entry['state'] if entry else None
+
+    def attempts(self, pdf_name):
+        entry = self.entries.get(pdf_name)
+        return entry.get('attempts', 0) if entry else 0
+
+    def write(self, pdf_name, state, **fields):
+        entry = {'pdf': pdf_name, 'state': state, 'attempts': self.attempts(pdf_name),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), **fields}
+        with self.lock, open(self.path, 'a') as file:
+            self.entries[pdf_name] = entry
+            file.write(('\n' if self.torn else '') + json.dumps(entry) + '\n')
+            self.torn = False
+            file.flush()
+            os.fsync(file.fileno())
+
+    def failures(self):
+        return [entry for entry in self.entries.values() if entry['state'] == FAILED]
+
+
+def write_failure_report(folder, failures):
+    # One row per project that still failed after its retries; no file when
+    # everything exported
+    path = os.path.join(folder, FAILURE_REPORT)
+    if not failures:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Project', 'PDF', 'Attempts', 'Error'])
+        for entry in failures:
+            writer.writerow([entry.get('project', ''), entry['pdf'], entry.get('attempts', 0), entry.get('error', '')])
+    return path
@@ -0,0 +1,225 @@
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from cache import CACHE_DIR
+from trim import MARGIN_BOTTOM, MARGIN_LEFT, MARGIN_TOP, MIN_CONTENT_HEIGHT, content_bottom_from_end
+
+LAYOUT_FILE = os.path.join(os.path.dirname(CACHE_DIR), 'layouts.json')
+# Stores the profiles somewhere else, e.g. for the benchmark's synthetic reports
+LAYOUT_ENV = 'PCAD_LAYOUTS'
+# Bump when detection changes so stored profiles are learned again
+LAYOUT_VERSION = 3
+# Grey level (0-255) below which a pixel counts as ink
+INK_LEVEL = 200
+# An ink band at least this share of the page wide and no taller than
+# RULE_HEIGHT points is a ruled line
+RULE_SHARE = 0.5
+RULE_HEIGHT = 4
+# The footer is the ink in the bottom FOOTER_SHARE of the page, below a gap
+# of at least FOOTER_GAP points
+FOOTER_SHARE = 0.15
+FOOTER_GAP = 15
+# Points kept clear between the content box and the header or footer
+PADDING = 8
+# Rows at the top and bottom edge of the content box that must be blank on a
+# page the profile fits
+SPOT_ROWS = 4
+
+
+def ink_rows(pixels):
+    # (first, last + 1, widest ink run) of each band of rows with ink
+    ink = pixels < INK_LEVEL
+    counts = ink.sum(axis=1)
+    bands = []
+    start = None
+    for row, count in enumerate(counts):
+        if count and start is None:
+            start = row
+        elif not count and start is not None:
+            bands.append((start, row, int(counts[start:row].max())))
+            start = None
+    if start is not None:
+        bands.append((start, len(counts), int(counts[start:].max())))
+    return bands
+
+
+class LayoutProfile:
+    # Where the header, content and footer of one report type's pages are,
+    # in pixels at `dpi` for pages of `size` points. Boxes are (x, y, width,
+    # height); `rule` is the (first, last + 1) rows of the line closing the
+    # header. Learned once from a sample page and reused for every later page
+    # of that report, which is only spot checked: the header rule must still
+    # be where it was, with blank rows between it and the content and
+    # between the content and the footer. Only the rows are learned; the
+    # content box spans the full report width inside the fixed side margins,
+    # so a later page with wider content than the sample is not clipped.
+
+    def __init__(self, report, size, dpi, header, content, footer, rule=None, learned=True):
+        self.report = report
+        self.size = tuple(size)
+        self.dpi = dpi
+        self.header = tuple(header)
+        self.content = tuple(content)
+        self.footer = tuple(footer)
+        self.rule = tuple(rule) if rule else None
+        self.learned = learned
+
+    @classmethod
+    def from_margins(cls, report, size, dpi, width, height):
+        # The fixed PowerCad margins, for pages the detection cannot read
+        content = (MARGIN_LEFT, MARGIN_TOP, width - 2 * MARGIN_LEFT, height - MARGIN_TOP - MARGIN_BOTTOM)
+        return cls(report, size, dpi, (0, 0, width, MARGIN_TOP), content,
+                   (0, height - MARGIN_BOTTOM, width, MARGIN_BOTTOM), learned=False)
+
+    @classmethod
+    def learn(cls, image, report, size, dpi):
+        # Detects the boxes on a full page: the header ends with the first
+        # ruled line in the top half, the footer is the ink at the bottom of
+        # the page below a clear gap, and the content is what lies between
+        # them, between the fixed side margins
+        scale = dpi / 72
+        pixels = np.asarray(image.convert('L'))
+        height, width = pixels.shape
+        bands = ink_rows(pixels)
+
+        rule = next((i for i, (start, end, widest) in enumerate(bands)
+                     if start < height / 2 and widest >= RULE_SHARE * width and end - start <= RULE_HEIGHT * scale),
+                    None)
+        if rule is None:
+            return cls.from_margins(report, size, dpi, width, height)
+        header_end = bands[rule][1]
+        following = bands[rule + 1:]
+        # Halfway into the gap under the rule
+        top = (header_end + following[0][0]) // 2 if following else header_end + round(PADDING * scale)
+
+        footer_top = None
+        for i in range(len(bands) - 1, rule, -1):
+            start = bands[i][0]
+            if start < height * (1 - FOOTER_SHARE):
+                break
+            if start - bands[i - 1][1] >= FOOTER_GAP * scale:
+                footer_top = start
+                break
+        if footer_top is None:
+            # Content running into the footer hides the gap; keep the fixed
+            # bottom margin rather than cropping down to the page end
+            footer_top = bottom = height - MARGIN_BOTTOM
+        else:
+            bottom = footer_top - round(PADDING * scale)
+
+        if bottom - top < MIN_CONTENT_HEIGHT or width <= 2 * MARGIN_LEFT:
+            return cls.from_margins(report, size, dpi, width, height)
+        return cls(report, size, dpi, (0, 0, width, header_end),
+                   (MARGIN_LEFT, top, width - 2 * MARGIN_LEFT, bottom - top),
+                   (0, footer_top, width, height - footer_top), bands[rule][:2])
+
+    @property
+    def key(self):
+        # Everything about the profile that changes the crops
+        return [LAYOUT_VERSION, *self.content]
+
+    @property
+    def window(self):
+        # What to rasterize of each page: the content box, extended up to the
+        # header rule and down to the footer so check() can see them
+        x, y, width, height = self.content
+        top = self.rule[0] if self.rule else y
+        bottom = max(y + height, self.footer[1])
+        return x, top, width, bottom - top
+
+    def _blank(self, image, top, bottom):
+        rows = np.asarray(image.crop((0, max(0, top), image.width, min(image.height, bottom))).convert('L'))
+        return not (rows < INK_LEVEL).any()
+
+    def check(self, image):
+        # Cheap spot check of a page rendered to `window`: a few rows rather
+        # than a scan of the page. Header or footer furniture that has moved
+        # or grown fails it.
+        x, y, width, height = self.content
+        top = self.window[1]
+        if self.rule:
+            start, end = self.rule[0] - top, self.rule[1] - top
+            rule = np.asarray(image.crop((0, start, image.width, end)).convert('L')) < INK_LEVEL
+            if rule.size == 0 or rule.sum(axis=1).max() < RULE_SHARE * image.width:
+                return False
+            if not self._blank(image, end, y - top + SPOT_ROWS):
+                return False
+        else:
+            if not self._blank(image, y - top, y - top + SPOT_ROWS):
+                return False
+        bottom = y + height - top
+        return self._blank(image, bottom - SPOT_ROWS, image.height)
+
+    def crop(self, image, window=False):
+        # The content box of a full page, or of a page rendered to `window`
+        x, y, width, height = self.content
+        if window:
+            x, y = 0, y - self.window[1]
+        return image.crop((x, y, min(image.width, x + width), min(image.height, y + height)))
+
+    def trim(self, image):
+        # Cuts the blank space below the content, searching up from the
+        # bottom of the box; the row scan starts at the left margin as before
+        bottom = content_bottom_from_end(image, column_offset=MARGIN_LEFT)
+        if bottom < MIN_CONTENT_HEIGHT:
+            return None
+        return image.crop((0, 0, image.width, bottom))
+
+    def to_dict(self):
+        return {'version': LAYOUT_VERSION, 'report': self.report, 'size': list(self.size), 'dpi': self.dpi,
+                'header': list(self.header), 'content': list(self.content), 'footer': list(self.footer),
+                'rule': list(self.rule) if self.rule else None, 'learned': self.learned}
+
+    @classmethod
+    def from_dict(cls, entry):
+        return cls(entry['report'], entry['size'], entry['dpi'], entry['header'], entry['content'], entry['footer'],
+                   entry.get('rule'), entry.get('learned', True))
+
+
+def profile_id(report, size, dpi):
+    return f"{report}|{size[0]:.2f}x{size[1]:.2f}|{dpi}"
+
+
+class LayoutStore:
+    # Layout profiles by report type, page size and DPI, kept in one JSON
+    # file next to the cache so every run and pool worker shares them. Each
+    # process reads the file again only when it lacks a profile.
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(LAYOUT_ENV) or LAYOUT_FILE
+        self.profiles = {}
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return {key: LayoutProfile.from_dict(entry) for key, entry in entries.items()
+                if entry.get('version') == LAYOUT_VERSION}
+
+    def get(self, report, size, dpi):
+        key = profile_id(report, size, dpi)
+        if key not in self.profiles:
+            self.profiles.update(self._load())
+        return self.profiles.get(key)
+
+    def put(self, profile):
+        self.profiles[profile_id(profile.report, profile.size, profile.dpi)] = profile
+        # Merged with what other processes stored meanwhile; write then rename
+        # so a reader never sees a partial file
+        profiles = {**self._load(), **self.profiles}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump({key: profile.to_dict() for key, profile in profiles.items()}, file, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as error:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            print(f"Could not save page layouts to {self.path}: {error}", file=sys.stderr)
@@ -0,0 +1,118 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+
+METRICS_FILE = '0pipeline_metrics.jsonl'
+# Set to 1 to write cProfile stats for every stage next to the outputs
+PROFILE_ENV = 'PCAD_PROFILE'
+
+# Spans recorded in this process since the last drain()
+_spans = []
+_profilers = {}
+
+
+def record(stage, seconds, file=None, **fields):
+    _spans.append({'stage': stage, 'file': file, 'seconds': round(seconds, 6), 'pid': os.getpid(),
+                   'time': round(time.time(), 3), **fields})
+
+
+@contextmanager
+def span(stage, file=None, **fields):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started, file, **fields)
+
+
+def timed_iter(iterable, stage, file=None):
+    # Times each step of an iterator separately, e.g. one span per rendered page
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record(stage, time.perf_counter() - started, file)
+        yield item
+
+
+def drain():
+    # Leaves spans that other threads append meanwhile for the next drain
+    count = len(_spans)
+    spans = _spans[:count]
+    del _spans[:count]
+    return spans
+
+
+def _profiler(profile_dir, stage):
+    key = (profile_dir, stage)
+    if key not in _profilers:
+        _profilers[key] = cProfile.Profile()
+    return _profilers[key]
+
+
+class Instrumented:
+    # Wraps a pool job so it returns (result, spans) and, when profiling, keeps
+    # one cumulative profile per worker process and stage.
+
+    def __init__(self, fn, stage, profile_dir=None):
+        self.fn = fn
+        self.stage = stage
+        self.profile_dir = profile_dir
+
+    def __call__(self, *args):
+        drain()
+        profiler = _profiler(self.profile_dir, self.stage) if self.profile_dir else None
+        if profiler:
+            profiler.enable()
+        try:
+            result = self.fn(*args)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, f"0profile-{self.stage}-{os.getpid()}.prof"))
+        return result, drain()
+
+
+class MetricsLog:
+    # Appends spans as JSON lines to 0pipeline_metrics.jsonl in the output
+    # folder, tagged with a per-run id. With no folder it only discards them.
+
+    def __init__(self, folder=None, profile=None):
+        if profile is None:
+            profile = os.environ.get(PROFILE_ENV) == '1'
+        self.path = os.path.join(folder, METRICS_FILE) if folder else None
+        self.profile_dir = folder if folder and profile else None
+        self.run = time.strftime('%Y%m%dT%H%M%S') + f"-{os.getpid()}"
+
+    def instrument(self, fn, stage):
+        return Instrumented(fn, stage, self.profile_dir)
+
+    def write(self, spans):
+        if not self.path or not spans:
+            return
+        with open(self.path, 'a') as file:
+            for item in spans:
+                file.write(json.dumps({'run': self.run, **item}) + '\n')
+
+    def flush(self):
+        self.write(drain())
+
+    @contextmanager
+    def stage(self, name, files=None):
+        # Whole-stage span in this process, plus an optional cProfile capture
+        profiler = cProfile.Profile() if self.profile_dir else None
+        if profiler:
+            profiler.enable()
+        try:
+            with span(name, files=files):
+                yield
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, f"0profile-{name}.prof"))
+            self.flush()
@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# Leave a core free for the GUI thread
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+
+class Cancelled(Exception):
+    pass
+
+
+def pool_size(max_workers, total_jobs):
+    return max(1, min(max_workers or DEFAULT_WORKERS, total_jobs))
+
+
+def imap_ordered(executor, fn, jobs, window):
+    # Like executor.map, but only `window` jobs are in flight or waiting to be
+    # collected at any time, so finished results cannot pile up in memory.
+    jobs = iter(jobs)
+    in_flight = deque(executor.submit(fn, *args) for args in islice(jobs, window))
+    try:
+        while in_flight:
+            result = in_flight.popleft().result()
+            for args in islice(jobs, 1):
+                in_flight.append(executor.submit(fn, *args))
+            yield result
+    finally:
+        # Reached early when the consumer stops, e.g. on cancellation
+        for future in in_flight:
+            future.cancel()
+
+
+# Set in pool workers when the caller wants page-level progress
+_page_queue = None
+
+
+def _init_worker(page_queue):
+    global _page_queue
+    _page_queue = page_queue
+
+
+def report_page(name, page):
+    if _page_queue is not None:
+        _page_queue.put((name, page))
+
+
+class PageListener:
+    # Delivers report_page() calls made in pool workers to `callback` on a
+    # background thread that blocks on the queue until the pool is done.
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.queue = multiprocessing.Queue() if callback else None
+        self.thread = None
+
+    def _listen(self):
+        for name, page in iter(self.queue.get, None):
+            self.callback(name, page)
+
+    def __enter__(self):
+        if self.queue is not None:
+            self.thread = threading.Thread(target=self._listen, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+
+
+def run_jobs(fn, jobs, total_jobs, max_workers=None, window=2, progress=None, page_progress=None, cancel=None):
+    # The job runner shared by the conversion stages: yields fn(*args) for each
+    # job in order from a process pool, reports progress(done, total) once the
+    # caller has handled each result, and raises Cancelled between files once
+    # `cancel` (a threading or multiprocessing Event) is set.
+    max_workers = pool_size(max_workers, total_jobs)
+    with PageListener(page_progress) as pages, \
+            ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                initargs=(pages.queue,)) as executor:
+        results = imap_ordered(executor, fn, jobs, window=max_workers * window)
+        try:
+            for done, result in enumerate(results, 1):
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled
+                yield result
+                if progress:
+                    progress(done, total_jobs)
+        finally:
+            # Drop queued jobs before the pool waits for the running ones
+            results.close()
@@ -0,0 +1,176 @@
+import os
+import platform
+import subprocess
+import threading
+from io import BytesIO
+
+import PyPDF2
+from pdf2image import convert_from_bytes, convert_from_path
+from PIL import Image
+
+from renderers import renderer_name
+
+
+def _startupinfo():
+    # Keep pdftoppm from flashing a console window on Windows
+    if platform.system() != "Windows":
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return startupinfo
+
+
+def _read_ppm_header(stream):
+    # Returns (magic, width, height, maxval) or None at end of stream
+    tokens = []
+    token = b''
+    while len(tokens) < 4:
+        char = stream.read(1)
+        if not char:
+            if tokens or token:
+                raise EOFError("Truncated PPM header from pdftoppm")
+            return None
+        if char == b'#' and not token:
+            while char not in (b'\n', b''):
+                char = stream.read(1)
+            continue
+        if char.isspace():
+            if token:
+                tokens.append(token)
+                token = b''
+            continue
+        token += char
+    return tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+
+
+def _iter_ppm_stream(stream):
+    modes = {b'P6': ('RGB', 3), b'P5': ('L', 1)}
+    while True:
+        header = _read_ppm_header(stream)
+        if header is None:
+            return
+        magic, width, height, maxval = header
+        if magic not in modes or maxval != 255:
+            raise ValueError(f"Unsupported PPM output from pdftoppm: {magic!r}")
+        mode, channels = modes[magic]
+        size = width * height * channels
+        data = stream.read(size)
+        if len(data) != size:
+            raise EOFError("Truncated page data from pdftoppm")
+        yield Image.frombytes(mode, (width, height), data)
+
+
+def page_sizes(source):
+    # (width, height) in points of every page as pdftoppm lays it out: the
+    # media box, turned by the page's rotation
+    reader = PyPDF2.PdfReader(BytesIO(source) if isinstance(source, bytes) else source)
+    sizes = []
+    for page in reader.pages:
+        width, height = float(page.mediabox.width), float(page.mediabox.height)
+        if page.get('/Rotate', 0) % 180:
+            width, height = height, width
+        sizes.append((width, height))
+    return sizes
+
+
+def _fallback_pages(source, dpi, region=None):
+    if isinstance(source, bytes):
+        pages = convert_from_bytes(source, dpi=dpi)
+    else:
+        pages = convert_from_path(source, dpi=dpi)
+    if region is None:
+        return pages
+    x, y, width, height = region
+    return [page.crop((x, y, x + width, y + height)) for page in pages]
+
+
+def _feed_stdin(stream, data):
+    try:
+        stream.write(data)
+    except OSError:
+        # pdftoppm gave up early; its exit code tells the story
+        pass
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+
+def iter_pdf_pages(source, dpi=150, region=None, renderer=None):
+    # Yields each page as a PIL image. `source` is a path, or the PDF's bytes
+    # when the caller has already read the file. With region=(x, y, width,
+    # height) in pixels only that window of each page is rasterized.
+    if renderer_name(renderer) == 'pdfium':
+        return _iter_pdfium_pages(source, dpi, region)
+    return _iter_pdftoppm_pages(source, dpi, region)
+
+
+def _iter_pdfium_pages(source, dpi, region):
+    import pypdfium2
+
+    scale = dpi / 72
+    document = pypdfium2.PdfDocument(source)
+    try:
+        for index in range(len(document)):
+            page = document[index]
+            try:
+                crop = (0, 0, 0, 0)
+                if region is not None:
+                    # pdfium crops in points from each edge, from the bottom left
+                    x, y, width, height = region
+                    page_width, page_height = page.get_size()
+                    crop = (x / scale, max(0, page_height - (y + height) / scale),
+                            max(0, page_width - (x + width) / scale), y / scale)
+                image = page.render(scale=scale, crop=crop, rev_byteorder=True).to_pil()
+            finally:
+                page.close()
+            if region is not None and (image.width > region[2] or image.height > region[3]):
+                image = image.crop((0, 0, min(image.width, region[2]), min(image.height, region[3])))
+            yield image
+    finally:
+        document.close()
+
+
+def _iter_pdftoppm_pages(source, dpi, region):
+    # One pdftoppm run per PDF: pages are streamed back over stdout as a
+    # sequence of PPM images and yielded as soon as each one is complete,
+    # so the page count falls out of the render itself.
+    from_bytes = isinstance(source, bytes)
+    name = '<bytes>' if from_bytes else source
+    command = ['pdftoppm', '-r', str(dpi)]
+    if region is not None:
+        command += ['-x', str(region[0]), '-y', str(region[1]), '-W', str(region[2]), '-H', str(region[3])]
+    command.append('-' if from_bytes else source)
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE if from_bytes else None,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   startupinfo=_startupinfo())
+    except OSError:
+        yield from _fallback_pages(source, dpi, region)
+        return
+
+    if from_bytes:
+        # Fed from a thread so a large PDF cannot deadlock against page output
+        feeder = threading.Thread(target=_feed_stdin, args=(process.stdin, source), daemon=True)
+        feeder.start()
+
+    pages = 0
+    try:
+        for image in _iter_ppm_stream(process.stdout):
+            pages += 1
+            yield image
+        returncode = process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        if from_bytes:
+            feeder.join()
+
+    if returncode != 0:
+        if pages:
+            raise RuntimeError(f"pdftoppm failed on {name} after {pages} page(s)")
+        # Nothing rendered, let pdf2image have a go and surface its error
+        yield from _fallback_pages(source, dpi, region)
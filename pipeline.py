@@ -0,0 +1,135 @@
+import os
+
+from cache import bytes_digest
+from concat import ReportSet
+from convert import (build_cable_document, build_cable_fragment, cable_name_for, document_bytes, load_page_images,
+                     load_template)
+from extract import load_fields, pdf_to_txt_cached
+from metrics import MetricsLog, span
+from parallel import run_jobs
+
+
+def process_cable(pdf_path, template_path, cache=None, policy=None):
+    # A single read of the PDF feeds the text extractor, the renderer and
+    # the cache key, instead of each stage opening the file on its own
+    with span('read', os.path.basename(pdf_path)), open(pdf_path, 'rb') as file:
+        data = file.read()
+    digest = bytes_digest(data) if cache is not None else None
+
+    cable_name = cable_name_for(pdf_path)
+    name = os.path.basename(pdf_path)
+    fields = load_fields(data, cache, digest, name)
+    page_images = load_page_images(data, cache, digest, name, policy)
+    with span('fragment', name):
+        fragment = document_bytes(build_cable_document(cable_name, page_images, load_template(template_path)))
+    return fragment, {cable_name: fields}
+
+
+def convert_pdfs_fused(pdf_paths, template_path, default_path, output_path, max_workers=None, progress=None,
+                       cache=None, metrics=None, image_policy=None, page_progress=None, cancel=None,
+                       shard_size=None):
+    total_files = len(pdf_paths)
+    metrics = metrics or MetricsLog()
+    data = {}
+
+    with metrics.stage('fused', files=total_files):
+        report = ReportSet(default_path, output_path, shard_size)
+
+        jobs = ((pdf_path, template_path, cache, image_policy) for pdf_path in pdf_paths)
+        job = metrics.instrument(process_cable, 'fused')
+        results = run_jobs(job, jobs, total_files, max_workers, window=2, progress=progress,
+                           page_progress=page_progress, cancel=cancel)
+        for i, ((fragment, record), spans) in enumerate(results):
+            metrics.write(spans)
+            report.append(fragment, os.path.basename(pdf_paths[i]))
+            data.update(record)
+
+        report.save()
+
+        if cache is not None:
+            cache.evict()
+
+    return data
+
+
+def convert_exported_pdf(pdf_path, template_path, cache=None, policy=None, word=True, csv=True):
+    # (fragment, {cable: fields}) with None for the output that is not wanted
+    if word and csv:
+        return process_cable(pdf_path, template_path, cache, policy)
+    if word:
+        return build_cable_fragment(pdf_path, template_path, cache, policy), None
+    return None, pdf_to_txt_cached(pdf_path, pdf_path, cache)
+
+
+def convert_pdfs_pipelined(exported, pdf_paths, template_path, default_path, output_path=None, csv=True,
+                           max_workers=None, progress=None, cache=None, metrics=None, image_policy=None,
+                           page_progress=None, cancel=None, shard_size=None):
+    # Converts PDFs while the export is still producing them. `exported`
+    # yields (pdf path, None) as each PDF is saved, or (pdf path, error) once
+    # its export has failed for good, blocking until the next one is;
+    # `pdf_paths` lists every PDF that may arrive, in output order. Results are
+    # composed in that order as soon as no earlier PDF is outstanding, and
+    # PDFs that never arrive (failed exports) are left out. Writes the Word
+    # document when output_path is given and returns the CSV data.
+    order = {os.path.normcase(pdf_path): i for i, pdf_path in enumerate(pdf_paths)}
+    metrics = metrics or MetricsLog()
+    report = None
+    data = {}
+    arrived = []
+    # output position -> (pdf_path, fragment, record), until everything before it is composed
+    ready = {}
+    # output positions whose export failed, which nothing waits for
+    failed = set()
+    next_index = 0
+
+    def position(pdf_path):
+        return order.setdefault(os.path.normcase(pdf_path), len(order))
+
+    def jobs():
+        for pdf_path, error in exported:
+            if error is not None:
+                # Frees the PDFs held up behind it now rather than at the end
+                failed.add(position(pdf_path))
+                compose()
+                continue
+            arrived.append(pdf_path)
+            yield pdf_path, template_path, cache, image_policy, output_path is not None, csv
+
+    def compose():
+        # Adds the results that no longer wait for an earlier PDF
+        nonlocal next_index
+        while next_index in ready or next_index in failed:
+            if next_index in ready:
+                add(*ready.pop(next_index))
+            next_index += 1
+
+    def add(pdf_path, fragment, record):
+        if fragment is not None:
+            report.append(fragment, os.path.basename(pdf_path))
+        if record is not None:
+            data.update(record)
+
+    with metrics.stage('pipelined', files=len(pdf_paths)):
+        if output_path is not None:
+            report = ReportSet(default_path, output_path, shard_size)
+
+        job = metrics.instrument(convert_exported_pdf, 'pipelined')
+        results = run_jobs(job, jobs(), len(pdf_paths), max_workers, window=2, progress=progress,
+                           page_progress=page_progress, cancel=cancel)
+        for i, ((fragment, record), spans) in enumerate(results):
+            metrics.write(spans)
+            pdf_path = arrived[i]
+            ready[position(pdf_path)] = (pdf_path, fragment, record)
+            compose()
+
+        # Whatever is left was waiting behind a PDF that never arrived
+        for index in sorted(ready):
+            add(*ready[index])
+
+        if report is not None:
+            report.save()
+
+        if cache is not None:
+            cache.evict()
+
+    return data
@@ -0,0 +1,594 @@
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from collections import deque
+
+from journal import EXPORTED, FAILED, PENDING, VERIFIED, ExportJournal, verify_pdf, write_failure_report
+from metrics import MetricsLog, record
+from reports import DEFAULT_REPORT, report_file_name
+
+MAIN_TITLE = "PowerCad-5 - Version*"
+LOAD_TITLE = "Load Project File"
+REPORTS_TITLE = "PowerCad-5 Reports"
+PRINT_TITLE = "Print"
+SAVE_TITLE = "Save Print Output As"
+
+# Seconds to wait for a dialog, for a project to finish loading, and for the
+# report PDF to be written
+DIALOG_TIMEOUT = 10
+LOAD_TIMEOUT = 120
+SAVE_TIMEOUT = 120
+POLL_INTERVAL = 0.05
+# Further passes over the projects that failed, after the first pass
+RETRIES = 2
+# Failed projects in a row after which an instance is dropped from a
+# multi-instance export, while other instances are still working
+SHARD_FAILURE_LIMIT = 3
+
+
+class PowerCadError(Exception):
+    pass
+
+
+class PowerCadTimeout(PowerCadError):
+    pass
+
+
+class PowerCadUnavailable(PowerCadError):
+    # No PowerCad-5 instance could export anything; `failures` holds
+    # {project path: error} for the projects that were still to export
+    def __init__(self, message, failures):
+        super().__init__(message)
+        self.failures = failures
+
+
+def wait_until(condition, timeout, what, interval=POLL_INTERVAL):
+    deadline = time.monotonic() + timeout
+    while True:
+        result = condition()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise PowerCadTimeout(f"Timed out after {timeout}s waiting for {what}")
+        time.sleep(min(interval, remaining))
+
+
+def wait_for_file(path, timeout):
+    # Written and no longer growing
+    sizes = []
+
+    def written():
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        sizes.append(size)
+        return size > 0 and sizes[-2:] == [size, size]
+
+    wait_until(written, timeout, f"{os.path.basename(path)} to be written")
+
+
+def powercad_instances():
+    # Process ids of the running PowerCad-5 main windows
+    from pywinauto import findwindows
+
+    return sorted({element.process_id for element in findwindows.find_elements(title_re=MAIN_TITLE)})
+
+
+def default_drivers():
+    # One driver per running PowerCad-5, so opening more instances (or
+    # sessions) shards the export across them; a single driver that waits for
+    # PowerCad when none can be found yet
+    try:
+        processes = powercad_instances()
+    except Exception:
+        processes = []
+    return [PowerCadDriver(process=process) for process in processes] or [PowerCadDriver()]
+
+
+class PowerCadDriver:
+    # Drives a running PowerCad-5 through pywinauto. One connection is kept
+    # for the whole run, and every step waits for the window it needs instead
+    # of sleeping for a fixed time. With `process` the driver is bound to that
+    # instance; otherwise it connects to whichever main window it finds.
+
+    def __init__(self, timeout=DIALOG_TIMEOUT, load_timeout=LOAD_TIMEOUT, save_timeout=SAVE_TIMEOUT, process=None):
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self.save_timeout = save_timeout
+        self.process = process
+        self.app = None
+
+    def connect(self):
+        # Any failure, including missing automation packages, is a
+        # PowerCadError so a sharded export drops this instance and reports
+        # its projects as failed
+        initialized = False
+        try:
+            import pythoncom
+            import pywinauto
+
+            # Per thread: each instance of a sharded export is driven from its own
+            pythoncom.CoInitialize()
+            initialized = True
+            application = pywinauto.application.Application()
+            if self.process is None:
+                self.app = application.connect(title_re=MAIN_TITLE, timeout=self.timeout)
+            else:
+                self.app = application.connect(process=self.process, timeout=self.timeout)
+        except Exception as error:
+            if initialized:
+                pythoncom.CoUninitialize()
+            raise PowerCadError(f"Could not connect to PowerCad-5: {error}") from error
+
+    def close(self):
+        import pythoncom
+
+        self.app = None
+        pythoncom.CoUninitialize()
+
+    def _window(self, title, timeout=None):
+        window = self.app.window(title_re=title)
+        window.wait('ready', timeout=timeout or self.timeout)
+        return window
+
+    def _gone(self, window, timeout=None):
+        window.wait_not('exists', timeout=timeout or self.timeout)
+
+    def export_reports(self, project_path, pdf_paths):
+        # Opens the project once and prints each report in pdf_paths
+        # ({report: pdf path}, in order) to its PDF
+        from pywinauto.findwindows import ElementNotFoundError
+        from pywinauto.timings import TimeoutError as WaitTimeout
+
+        try:
+            self._export_reports(project_path, pdf_paths)
+        except WaitTimeout as error:
+            raise PowerCadTimeout(f"{os.path.basename(project_path)}: {error}") from error
+        except ElementNotFoundError as error:
+            raise PowerCadError(f"{os.path.basename(project_path)}: window not found: {error}") from error
+
+    def _export_reports(self, project_path, pdf_paths):
+        window = self._window(MAIN_TITLE)
+        window.menu_item(u'&File->&Open Project...\tCtrl+O').select()
+
+        dialog = self._window(LOAD_TITLE)
+        dialog['Edit'].set_text(project_path)
+        dialog['&Open'].click()
+        self._gone(dialog)
+
+        # The project is loaded once PowerCad is responsive and idle again
+        window = self._window(MAIN_TITLE, self.load_timeout)
+        self.app.wait_cpu_usage_lower(threshold=5, timeout=self.load_timeout)
+        window.menu_item(u'&View->Local Mode').select()
+        window.menu_item(u'&File->&Print...').select()
+
+        reports = self._window(REPORTS_TITLE)
+        for report, pdf_path in pdf_paths.items():
+            reports[report].click()
+            reports['Print...'].click()
+
+            dialog = self._window(PRINT_TITLE)
+            dialog['OK'].click()
+
+            dialog = self._window(SAVE_TITLE)
+            dialog['Toolbar4'].click()
+            # PowerCad adds the .pdf extension itself
+            dialog['Edit'].set_text(os.path.splitext(pdf_path)[0])
+            dialog['&Save'].click()
+            self._gone(dialog)
+            wait_for_file(pdf_path, self.save_timeout)
+            if len(pdf_paths) > 1:
+                # Clears the report again if the list is made of check boxes,
+                # so the next one prints on its own
+                reports[report].click()
+            reports = self._window(REPORTS_TITLE)
+
+        reports["Close"].click()
+        self._gone(reports)
+
+    def recover(self):
+        # Dismiss whatever dialog a failed export left open
+        for title in (SAVE_TITLE, PRINT_TITLE, LOAD_TITLE, REPORTS_TITLE):
+            try:
+                window = self.app.window(title_re=title)
+                if window.exists(timeout=0):
+                    window.close()
+            except Exception:
+                pass
+
+
+# Seconds each simulated step of the fake driver takes
+FAKE_LATENCY = {
+    'connect': 0.05,
+    'open_dialog': 0.01,
+    'load': 0.15,
+    'reports_dialog': 0.02,
+    'print_dialog': 0.01,
+    'save_dialog': 0.01,
+    'write': 0.05,
+    'close': 0.01,
+}
+# Fine enough that polling adds little to the simulated latency
+FAKE_POLL_INTERVAL = 0.002
+
+
+class FakePowerCadDriver:
+    # In-process stand-in for PowerCad-5: walks the same dialog sequence with
+    # simulated latency, waits on it through the same wait_until() as the real
+    # driver, and writes a synthetic report PDF.
+    #   latency   step -> seconds, or a callable (step, project name) -> seconds
+    #   failures  project name -> step whose window never appears (a hang), or
+    #             'corrupt' to write truncated PDFs; a list scripts one entry
+    #             per attempt, e.g. ['load', None] hangs once then succeeds.
+    #             "<project> [<report>]" scripts the print_dialog, save_dialog,
+    #             write or 'corrupt' of that one report.
+    #   attempts  project name -> attempts so far; share one dict between
+    #             the fakes of a sharded export so scripts count across them
+    #   connect_error  fail connect() the way an unreachable instance does
+
+    def __init__(self, latency=None, failures=None, timeout=DIALOG_TIMEOUT, load_timeout=LOAD_TIMEOUT,
+                 save_timeout=SAVE_TIMEOUT, attempts=None, connect_error=False):
+        self.latency = latency or FAKE_LATENCY
+        self.failures = failures or {}
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self.save_timeout = save_timeout
+        self.connect_error = connect_error
+        self.windows = {}
+        self.connected = False
+        self.project = None
+        self.report = None
+        self.attempts = {} if attempts is None else attempts
+
+    def _failure(self, key=None):
+        failure = self.failures.get(key or self.project)
+        if isinstance(failure, (list, tuple)):
+            attempt = self.attempts[self.project] - 1
+            failure = failure[attempt] if attempt < len(failure) else None
+        return failure
+
+    def _failures(self):
+        failures = [self._failure()]
+        if self.report is not None:
+            failures.append(self._failure(f"{self.project} [{self.report}]"))
+        return failures
+
+    def _delay(self, step):
+        if step in self._failures():
+            return math.inf
+        if callable(self.latency):
+            return self.latency(step, self.project)
+        return self.latency.get(step, 0)
+
+    def _show(self, title, step):
+        self.windows[title] = time.monotonic() + self._delay(step)
+
+    def _wait(self, title, timeout=None):
+        wait_until(lambda: time.monotonic() >= self.windows.get(title, math.inf), timeout or self.timeout,
+                   f"{title!r} ({self.project})", interval=FAKE_POLL_INTERVAL)
+
+    def _step(self, title, step, timeout=None):
+        self._show(title, step)
+        self._wait(title, timeout)
+        self.windows.pop(title, None)
+
+    def connect(self):
+        if self.connect_error:
+            raise PowerCadError("Could not connect to PowerCad-5: no such instance")
+        self._step(MAIN_TITLE, 'connect')
+        self.connected = True
+
+    def close(self):
+        self.connected = False
+        self.windows.clear()
+
+    def export_reports(self, project_path, pdf_paths):
+        from synthetic_reports import report_pages, write_pdf
+
+        if not self.connected:
+            raise PowerCadError("Not connected to PowerCad-5")
+        self.project = os.path.splitext(os.path.basename(project_path))[0]
+        self.report = None
+        self.attempts[self.project] = self.attempts.get(self.project, 0) + 1
+        if not os.path.exists(project_path):
+            raise PowerCadError(f"Project not found: {project_path}")
+
+        self._step(LOAD_TITLE, 'open_dialog')
+        self._step(MAIN_TITLE, 'load', self.load_timeout)
+        self._show(REPORTS_TITLE, 'reports_dialog')
+        self._wait(REPORTS_TITLE)
+        for report, pdf_path in pdf_paths.items():
+            self.report = report
+            self._step(PRINT_TITLE, 'print_dialog')
+            self._step(SAVE_TITLE, 'save_dialog')
+            self._step(pdf_path, 'write', self.save_timeout)
+
+            rng = random.Random(zlib.crc32(self.project.encode()))
+            write_pdf(pdf_path, report_pages(self.project, rng.randint(2, 6), rng, report))
+            if 'corrupt' in self._failures():
+                with open(pdf_path, 'r+b') as file:
+                    file.truncate(os.path.getsize(pdf_path) // 2)
+        self.report = None
+        # Closing the reports dialog hands control back to the main window
+        self.windows.pop(REPORTS_TITLE, None)
+        self._step(MAIN_TITLE, 'close')
+
+    def recover(self):
+        self.windows.clear()
+
+
+def export_report_checked(driver, journal, project_path, pdf_paths):
+    # One attempt at one project: it is opened once and each report in
+    # pdf_paths ({report: pdf path}) printed, every PDF journalled as pending
+    # -> exported -> verified, or failed. Returns {report: error} for the
+    # reports that failed, empty on success.
+    for pdf_path in pdf_paths.values():
+        name = os.path.basename(pdf_path)
+        journal.write(name, PENDING, project=project_path, attempts=journal.attempts(name) + 1)
+        if os.path.exists(pdf_path):
+            # Left by an earlier attempt; it must not pass for this one's
+            os.remove(pdf_path)
+    started = time.perf_counter()
+    error = None
+    try:
+        driver.export_reports(project_path, pdf_paths)
+    except PowerCadError as exc:
+        error = str(exc)
+        print(f"Export failed: {error}")
+
+    failures = {}
+    for report, pdf_path in pdf_paths.items():
+        name = os.path.basename(pdf_path)
+        size = os.path.getsize(pdf_path) if os.path.exists(pdf_path) else 0
+        if error is None or size:
+            journal.write(name, EXPORTED, project=project_path, size=size)
+        if verify_pdf(pdf_path):
+            # Kept even when a later report of the same project failed
+            journal.write(name, VERIFIED, project=project_path, size=size)
+            continue
+        if error is None:
+            print(f"Export failed: {name} is missing or not a complete PDF")
+        failures[report] = error or f"{name} is missing or not a complete PDF"
+        journal.write(name, FAILED, project=project_path, error=failures[report])
+    if failures:
+        driver.recover()
+
+    if len(pdf_paths) == 1:
+        name = os.path.basename(next(iter(pdf_paths.values())))
+    else:
+        name = os.path.basename(project_path)
+    if failures:
+        record('powercad_export', time.perf_counter() - started, name, error='; '.join(failures.values()))
+    else:
+        record('powercad_export', time.perf_counter() - started, name)
+    return failures
+
+
+class ShardedExport:
+    # Runs an export across one or more drivers, each on its own thread and
+    # bound to its own PowerCad instance. Projects wait in one shared queue
+    # and every instance takes the next one as soon as it is free, so the load
+    # balances itself around slow projects and slow instances. A failed
+    # project goes to the back of the queue and is retried, up to `retries`
+    # more times, on whichever instance is free first. An instance that cannot
+    # connect, or fails SHARD_FAILURE_LIMIT projects in a row while others
+    # keep working, is dropped and the others carry on without it.
+
+    def __init__(self, drivers, journal, total_files, done=0, progress=None, cancel=None, metrics=None,
+                 retries=RETRIES, exported=None, failed=None):
+        self.drivers = drivers
+        self.journal = journal
+        self.total_files = total_files
+        self.done = done
+        self.progress = progress
+        self.cancel = cancel
+        self.metrics = metrics or MetricsLog()
+        self.retries = retries
+        self.exported = exported
+        self.failed = failed
+        self.condition = threading.Condition()
+        # (project path, {report: pdf path}, attempt) in the order they are handed out
+        self.jobs = deque()
+        self.in_hand = 0
+        self.retry_pass = 0
+        self.failures = {}
+        # instance -> {project path: error} for the attempts that failed on it
+        self.shard_failures = {index: {} for index in range(len(drivers))}
+        # instance -> exported PDF count, and why a dropped instance stopped
+        self.shard_exported = {index: 0 for index in range(len(drivers))}
+        self.shard_errors = {}
+
+    def run(self, jobs):
+        # Returns {project path: error} for the projects that still failed
+        self.jobs.extend((project_path, pdf_paths, 0) for project_path, pdf_paths in jobs)
+        if len(self.drivers) == 1:
+            self._shard(0, self.drivers[0])
+        else:
+            threads = [threading.Thread(target=self._shard, args=(index, driver), name=f"powercad-{index + 1}")
+                       for index, driver in enumerate(self.drivers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        if len(self.shard_errors) == len(self.drivers) and not any(self.shard_exported.values()):
+            # No instance got anywhere, e.g. PowerCad is not running
+            error = '; '.join(dict.fromkeys(self.shard_errors.values()))
+            failures = {**self.failures, **{project_path: error for project_path, _, _ in self.jobs}}
+            self._given_up(failures)
+            raise PowerCadUnavailable(error, failures)
+        if not self._cancelled():
+            # Left behind by instances that were all dropped
+            reasons = '; '.join(dict.fromkeys(self.shard_errors.values()))
+            for project_path, _, _ in self.jobs:
+                self.failures.setdefault(project_path, f"No PowerCad-5 instance left to export it ({reasons})")
+            self._given_up(self.failures)
+        if len(self.drivers) > 1:
+            for index in range(len(self.drivers)):
+                print(f"PowerCad instance {index + 1}: {self.shard_exported[index]} exported, "
+                      f"{len(self.shard_failures[index])} failed attempt(s)"
+                      + (f", stopped: {self.shard_errors[index]}" if index in self.shard_errors else ""))
+        return self.failures
+
+    def _cancelled(self):
+        return self.cancel is not None and self.cancel.is_set()
+
+    def _shard(self, index, driver):
+        try:
+            driver.connect()
+        except PowerCadError as error:
+            print(f"PowerCad instance {index + 1}: {error}")
+            self._drop(index, str(error))
+            return
+        try:
+            failed_in_a_row = 0
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                project_path, pdf_paths, _ = job
+                try:
+                    failed = export_report_checked(driver, self.journal, project_path, pdf_paths)
+                except Exception as error:
+                    # The automation itself broke; another instance gets the project
+                    self._requeue(job)
+                    self._drop(index, f"{type(error).__name__}: {error}")
+                    return
+                failed_in_a_row = failed_in_a_row + 1 if failed else 0
+                self._finished(index, job, failed)
+                if failed_in_a_row >= SHARD_FAILURE_LIMIT and self._others_working(index):
+                    self._drop(index, f"{failed_in_a_row} exports in a row failed")
+                    return
+        finally:
+            driver.close()
+
+    def _next_job(self):
+        # The next project, waiting while other instances still hold projects
+        # that may come back for a retry; None once there is nothing left
+        with self.condition:
+            while not self.jobs and self.in_hand and not self._cancelled():
+                # The cancel event cannot notify, so look again now and then
+                self.condition.wait(0.1)
+            if not self.jobs or self._cancelled():
+                return None
+            job = self.jobs.popleft()
+            attempt = job[2]
+            if attempt > self.retry_pass:
+                self.retry_pass = attempt
+                retrying = 1 + sum(1 for queued in self.jobs if queued[2] == attempt)
+                print(f"Retrying {retrying} failed export(s), attempt {attempt + 1} of {self.retries + 1}")
+            self.in_hand += 1
+            return job
+
+    def _finished(self, index, job, failed):
+        # failed is {report: error}; only those reports are tried again
+        project_path, pdf_paths, attempt = job
+        with self.condition:
+            self.in_hand -= 1
+            if failed:
+                error = '; '.join(dict.fromkeys(failed.values()))
+                self.shard_failures[index][project_path] = error
+                self.failures[project_path] = error
+                if attempt < self.retries:
+                    retry = {report: pdf_paths[report] for report in failed}
+                    self.jobs.append((project_path, retry, attempt + 1))
+                elif self.failed:
+                    for report, report_error in failed.items():
+                        self.failed(pdf_paths[report], report_error)
+            else:
+                self.failures.pop(project_path, None)
+            for report, pdf_path in pdf_paths.items():
+                if report not in failed:
+                    self.shard_exported[index] += 1
+                    if self.exported:
+                        self.exported(pdf_path)
+
+            # Retries happen after the first pass, once every file has been handed out
+            if attempt == 0:
+                self.done += 1
+                if self.progress:
+                    self.progress(self.done, self.total_files)
+            self.metrics.flush()
+            self.condition.notify_all()
+
+    def _given_up(self, failures):
+        # Reports failed() for the PDFs of the jobs no instance will take now
+        if self.failed:
+            for project_path, pdf_paths, _ in self.jobs:
+                for pdf_path in pdf_paths.values():
+                    self.failed(pdf_path, failures[project_path])
+
+    def _requeue(self, job):
+        with self.condition:
+            self.in_hand -= 1
+            self.jobs.appendleft(job)
+            self.condition.notify_all()
+
+    def _drop(self, index, error):
+        with self.condition:
+            self.shard_errors[index] = error
+            self.condition.notify_all()
+
+    def _others_working(self, index):
+        with self.condition:
+            return len(self.shard_errors) + 1 < len(self.drivers)
+
+
+def export_projects(driver, input_files, output_files, output_folder, progress=None, cancel=None, metrics=None,
+                    resume=False, retries=RETRIES, exported=None, reports=None, failed=None):
+    # Exports each project's reports and returns {project path: error} for
+    # the ones that still failed after `retries` further passes. Every report
+    # in `reports` (default: the Earth Fault Loop Impedance report alone) is
+    # printed while the project is open, to output_folder/<output name>.pdf
+    # for the default report and "<output name> [<report>].pdf" for the
+    # others. `driver` is one driver or a list of them, one per PowerCad
+    # instance, to shard the export across (see ShardedExport). With resume,
+    # reports whose PDF is already there and complete are skipped, and so are
+    # projects with all of them. exported(pdf_path) is called for each PDF as
+    # soon as it is verified (or found complete when resuming), and
+    # failed(pdf_path, error) once a PDF will not be exported (its last
+    # attempt failed, or no instance is left to take it); they and progress,
+    # which counts projects, are never called from two instances at once.
+    drivers = list(driver) if isinstance(driver, (list, tuple)) else [driver]
+    reports = reports or [DEFAULT_REPORT]
+    metrics = metrics or MetricsLog()
+    journal = ExportJournal(output_folder)
+    if not resume:
+        journal.reset()
+    total_files = len(input_files)
+
+    jobs = []
+    for project_path, output_name in zip(input_files, output_files):
+        pdf_paths = {}
+        for report in reports:
+            pdf_path = os.path.normpath(os.path.join(output_folder, report_file_name(output_name, report) + '.pdf'))
+            name = os.path.basename(pdf_path)
+            if resume and verify_pdf(pdf_path):
+                if journal.state(name) != VERIFIED:
+                    journal.write(name, VERIFIED, project=project_path, size=os.path.getsize(pdf_path))
+                if exported:
+                    exported(pdf_path)
+                continue
+            pdf_paths[report] = pdf_path
+        if pdf_paths:
+            jobs.append((project_path, pdf_paths))
+
+    done = total_files - len(jobs)
+    if done:
+        print(f"Resuming: {done} of {total_files} project(s) already exported")
+        if progress:
+            progress(done, total_files)
+
+    export = ShardedExport(drivers, journal, total_files, done, progress, cancel, metrics, retries, exported,
+                           failed)
+    try:
+        if not jobs:
+            # Everything was exported already; PowerCad is not needed
+            return {}
+        return export.run(jobs)
+    finally:
+        report = write_failure_report(output_folder, journal.failures())
+        if report:
+            print(f"{len(journal.failures())} export(s) failed, see {report}")
@@ -0,0 +1,39 @@
+import os
+import sys
+from importlib.util import find_spec
+
+# How report pages are rasterized, set with the PCAD_RENDERER environment
+# variable (inherited by the pool workers):
+#   pdftoppm  poppler's pdftoppm, one run per PDF with pages streamed over a pipe
+#   pdfium    pypdfium2 inside the worker process (optional dependency); the
+#             long-lived pool workers keep the library loaded across files and
+#             page bitmaps are handed over in memory
+# Kept apart from pdf_render so the GUI and CLI can offer the choice without
+# loading the rendering libraries.
+RENDERERS = ['pdftoppm', 'pdfium']
+DEFAULT_RENDERER = 'pdftoppm'
+RENDERER_ENV = 'PCAD_RENDERER'
+# Set once this process has said that pdfium is not available
+_fallback_reported = False
+
+
+def pdfium_available():
+    # Whether pypdfium2 is installed, without importing it
+    return find_spec('pypdfium2') is not None
+
+
+def renderer_name(renderer=None):
+    # The renderer that will be used: `renderer`, else the configured one;
+    # pdfium falls back to pdftoppm, with a warning, when pypdfium2 is not
+    # installed
+    global _fallback_reported
+    renderer = renderer or os.environ.get(RENDERER_ENV) or DEFAULT_RENDERER
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer {renderer!r}, expected one of: {', '.join(RENDERERS)}")
+    if renderer == 'pdfium' and not pdfium_available():
+        if not _fallback_reported:
+            print("The pdfium renderer needs pypdfium2, which is not installed; rendering with pdftoppm instead",
+                  file=sys.stderr)
+            _fallback_reported = True
+        return DEFAULT_RENDERER
+    return renderer
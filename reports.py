@@ -0,0 +1,58 @@
+import os
+import re
+
+# The report the tool has always exported. Its PDFs keep the plain <cable>.pdf
+# name, and it is the one recorded in 0cable_info.csv and the results store.
+DEFAULT_REPORT = "Earth Fault Loop Impedance"
+# Any other report is saved as "<cable> [<report>].pdf" next to it, and its
+# outputs get the same suffix, e.g. "concatenated [Voltage Drop].docx"
+REPORT_NAME = re.compile(r'^(.*) \[([^\[\]]+)\]$')
+# The reports the export prints, comma-separated, set from the GUI's Reports
+# field or the CLI's --reports and inherited by the pool workers. Only these
+# are read back from a name's suffix; any other bracketed suffix, e.g.
+# "CB-1 [spare]", is part of the cable name.
+REPORTS_ENV = 'PCAD_REPORTS'
+
+
+def report_file_name(name, report):
+    return name if report == DEFAULT_REPORT else f"{name} [{report}]"
+
+
+def configured_reports():
+    return parse_reports(os.environ.get(REPORTS_ENV, ''))
+
+
+def split_report_name(name, reports=None):
+    # (cable or output name, report) for a file name without its extension;
+    # `reports` defaults to the configured ones
+    match = REPORT_NAME.match(name)
+    reports = configured_reports() if reports is None else reports
+    if match is None or match.group(2) == DEFAULT_REPORT or match.group(2) not in reports:
+        return name, DEFAULT_REPORT
+    return match.group(1), match.group(2)
+
+
+def report_of(path):
+    return split_report_name(os.path.splitext(os.path.basename(path))[0])[1]
+
+
+def report_output(path, report):
+    # Where `report`'s version of an output file goes
+    root, ext = os.path.splitext(path)
+    return report_file_name(root, report) + ext
+
+
+def split_reports(data):
+    # {cable: fields} over every report -> {report: {cable: fields}}, keeping
+    # the order; the default report is always there, even when empty
+    reports = {DEFAULT_REPORT: {}}
+    for name, fields in data.items():
+        cable, report = split_report_name(name)
+        reports.setdefault(report, {})[cable] = fields
+    return reports
+
+
+def parse_reports(text):
+    # "Earth Fault Loop Impedance, Voltage Drop" -> list of report names
+    reports = [report.strip() for report in text.split(',') if report.strip()]
+    return list(dict.fromkeys(reports)) or [DEFAULT_REPORT]
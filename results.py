@@ -0,0 +1,252 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+from cache import CACHE_DIR
+from reports import DEFAULT_REPORT, report_output, split_reports
+
+RESULTS_DB = os.path.join(os.path.dirname(CACHE_DIR), 'results.sqlite')
+CSV_FILE = '0cable_info.csv'
+
+# Extracted field -> column. Values are stored as the report printed them so
+# the CSV export reproduces them exactly.
+FIELD_COLUMNS = [
+    ('Load Maximum Demand', 'load_max_demand'),
+    ('CB Rating', 'cb_rating'),
+    ('Current Capacity', 'current_capacity'),
+    ('MAX EF impedence', 'max_ef_impedance'),
+    ('EF impedence', 'ef_impedance'),
+]
+COLUMNS = [column for _, column in FIELD_COLUMNS]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    started TEXT NOT NULL,
+    cables INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_project ON runs (project, id);
+
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    project TEXT NOT NULL,
+    cable TEXT NOT NULL,
+    load_max_demand TEXT,
+    cb_rating TEXT,
+    current_capacity TEXT,
+    max_ef_impedance TEXT,
+    ef_impedance TEXT,
+    -- 1 pass, 0 fail, NULL when either impedance is missing
+    passed INTEGER,
+    -- max_ef_impedance - ef_impedance, in ohms
+    margin REAL,
+    PRIMARY KEY (run, cable)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_cable ON results (cable, run);
+CREATE INDEX IF NOT EXISTS results_project ON results (project, run);
+CREATE INDEX IF NOT EXISTS results_passed ON results (passed, run);
+"""
+
+
+def result_text(row):
+    return '' if row is None or row['passed'] is None else 'Pass' if row['passed'] else 'Fail'
+
+
+class ResultsStore:
+    # Cable check results of every CSV run, so failures and changes can be
+    # queried across runs and project revisions. A run is one project folder
+    # converted once; `project` defaults to the folder's name.
+
+    def __init__(self, path=RESULTS_DB):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        if path != ':memory:':
+            # Readers (e.g. a query while the GUI writes) do not block the writer
+            self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, folder, data, project=None):
+        # data is {cable: {field: value}} in output order. One transaction
+        # for the whole run; pass/fail and margin are computed in one pass
+        # over its rows afterwards. Returns the run id.
+        folder = os.path.normpath(folder)
+        project = project or os.path.basename(folder)
+        with self.connection:
+            run = self.connection.execute(
+                'INSERT INTO runs (project, folder, started, cables) VALUES (?, ?, ?, ?)',
+                (project, folder, time.strftime('%Y-%m-%dT%H:%M:%S'), len(data))).lastrowid
+            rows = ((run, position, project, cable, *(values.get(field) for field, _ in FIELD_COLUMNS))
+                    for position, (cable, values) in enumerate(data.items()))
+            self.connection.executemany(
+                f"INSERT INTO results (run, position, project, cable, {', '.join(COLUMNS)}) "
+                f"VALUES (?, ?, ?, ?, {', '.join('?' * len(COLUMNS))})", rows)
+            self.connection.execute(
+                'UPDATE results SET margin = CAST(max_ef_impedance AS REAL) - CAST(ef_impedance AS REAL), '
+                'passed = CAST(max_ef_impedance AS REAL) > CAST(ef_impedance AS REAL) '
+                'WHERE run = ? AND max_ef_impedance IS NOT NULL AND ef_impedance IS NOT NULL', (run,))
+        return run
+
+    def latest_run(self, project=None):
+        if project is None:
+            row = self.connection.execute('SELECT MAX(id) FROM runs').fetchone()
+        else:
+            row = self.connection.execute('SELECT MAX(id) FROM runs WHERE project = ?', (project,)).fetchone()
+        return row[0]
+
+    def results(self, run):
+        return self.connection.execute('SELECT * FROM results WHERE run = ? ORDER BY position', (run,)).fetchall()
+
+    def export_csv(self, run, output_file):
+        # 0cable_info.csv is this view of one run
+        with open(output_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Cable'] + [field for field, _ in FIELD_COLUMNS] + ['Result'])
+            for row in self.results(run):
+                writer.writerow([row['cable']] + [row[column] or '' for column in COLUMNS] + [result_text(row)])
+
+    def failing(self, runs=10, project=None):
+        # Failing cables in the last `runs` runs, newest first
+        recent = 'SELECT id FROM runs' + (' WHERE project = ?' if project else '') + ' ORDER BY id DESC LIMIT ?'
+        params = ([project] if project else []) + [runs]
+        return self.connection.execute(
+            'SELECT results.*, runs.started, runs.folder FROM results JOIN runs ON runs.id = results.run '
+            f'WHERE results.passed = 0 AND results.run IN ({recent}) '
+            'ORDER BY results.run DESC, results.position', params).fetchall()
+
+    def history(self, cable, project=None):
+        query = ('SELECT results.*, runs.started, runs.folder FROM results JOIN runs ON runs.id = results.run '
+                 'WHERE results.cable = ?')
+        params = [cable]
+        if project:
+            query += ' AND results.project = ?'
+            params.append(project)
+        return self.connection.execute(query + ' ORDER BY results.run', params).fetchall()
+
+    def changes(self, run):
+        # (cable, previous row or None, row or None) for every cable that was
+        # added, removed or changed since the project's previous run
+        project = self.connection.execute('SELECT project FROM runs WHERE id = ?', (run,)).fetchone()
+        if project is None:
+            return []
+        previous = self.connection.execute('SELECT MAX(id) FROM runs WHERE project = ? AND id < ?',
+                                           (project[0], run)).fetchone()[0]
+        before = {row['cable']: row for row in self.results(previous)} if previous else {}
+        after = {row['cable']: row for row in self.results(run)}
+        compared = COLUMNS + ['passed']
+        changes = []
+        for cable in list(after) + [cable for cable in before if cable not in after]:
+            old, new = before.get(cable), after.get(cable)
+            if old is None or new is None or any(old[column] != new[column] for column in compared):
+                changes.append((cable, old, new))
+        return changes
+
+
+def save_results(folder, data, db=RESULTS_DB, project=None):
+    # Records the run in the results store and writes 0cable_info.csv from it.
+    # The CSV is still written, from a throwaway store, if the database cannot
+    # be used (e.g. locked by another program). Other report types in `data`
+    # get their own CSV (see write_report_csvs).
+    output_file = os.path.normpath(os.path.join(folder, CSV_FILE))
+    write_report_csvs(data, output_file)
+    data = split_reports(data)[DEFAULT_REPORT]
+    try:
+        with closing(ResultsStore(db)) as store:
+            run = store.add_run(folder, data, project)
+            store.export_csv(run, output_file)
+            return run
+    except sqlite3.Error as error:
+        print(f"Could not record results in {db}: {error}", file=sys.stderr)
+    write_csv(data, output_file)
+    return None
+
+
+def write_csv(data, output_file):
+    write_report_csvs(data, output_file)
+    data = split_reports(data)[DEFAULT_REPORT]
+    with closing(ResultsStore(':memory:')) as store:
+        store.export_csv(store.add_run(os.path.dirname(output_file) or '.', data), output_file)
+
+
+def report_csvs(data, output_file):
+    # (report, path, extractor) for each report other than the default one
+    # in `data` that has an extractor, and so its own CSV next to output_file
+    from extract import REPORT_EXTRACTORS
+
+    return [(report, report_output(output_file, report), REPORT_EXTRACTORS[report])
+            for report in split_reports(data) if report != DEFAULT_REPORT and report in REPORT_EXTRACTORS]
+
+
+def csv_files(data, output_file):
+    # Every CSV save_results() or write_csv() writes for `data`
+    return [output_file] + [path for _, path, _ in report_csvs(data, output_file)]
+
+
+def write_report_csvs(data, output_file):
+    # One column per field of the report's extractor
+    reports = split_reports(data)
+    for report, path, extractor in report_csvs(data, output_file):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Cable'] + extractor.fields)
+            for cable, fields in reports[report].items():
+                writer.writerow([cable] + [fields.get(field, '') for field in extractor.fields])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the cable check results recorded by earlier runs.")
+    parser.add_argument('--db', default=RESULTS_DB, help="results database")
+    commands = parser.add_subparsers(dest='command', required=True)
+    failing = commands.add_parser('failing', help="failing cables in the most recent runs")
+    failing.add_argument('--runs', type=int, default=10)
+    failing.add_argument('--project')
+    history = commands.add_parser('history', help="one cable's results in every run")
+    history.add_argument('cable')
+    history.add_argument('--project')
+    changes = commands.add_parser('changes', help="cables that changed since the project's previous run")
+    changes.add_argument('--project')
+    changes.add_argument('--run', type=int, help="run id (default: the latest)")
+    export = commands.add_parser('export', help="write a run as 0cable_info.csv")
+    export.add_argument('run', type=int)
+    export.add_argument('output')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        parser.error(f"no results database at {args.db}")
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    with closing(ResultsStore(args.db)) as store:
+        if args.command == 'failing':
+            writer.writerow(['Run', 'Started', 'Project', 'Cable', 'MAX EF impedence', 'EF impedence', 'Margin'])
+            for row in store.failing(args.runs, args.project):
+                writer.writerow([row['run'], row['started'], row['project'], row['cable'], row['max_ef_impedance'],
+                                 row['ef_impedance'], round(row['margin'], 6)])
+        elif args.command == 'history':
+            writer.writerow(['Run', 'Started', 'Project'] + [field for field, _ in FIELD_COLUMNS] + ['Result'])
+            for row in store.history(args.cable, args.project):
+                writer.writerow([row['run'], row['started'], row['project']]
+                                + [row[column] for column in COLUMNS] + [result_text(row)])
+        elif args.command == 'changes':
+            run = args.run or store.latest_run(args.project)
+            writer.writerow(['Cable', 'Change', 'Before', 'After'])
+            for cable, old, new in store.changes(run) if run else []:
+                change = 'added' if old is None else 'removed' if new is None else 'changed'
+                writer.writerow([cable, change, result_text(old), result_text(new)])
+        else:
+            store.export_csv(args.run, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
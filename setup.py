@@ -5,6 +5,7 @@ APP_NAME = "PCAD Batch Export"
 APP_VERSION = "0.3.6"
 APP_DESCRIPTION = "Batch export tool for PCAD files."
 TARGET_EXE = "PCAD_Batch_Export.exe"
+CLI_TARGET_EXE = "PCAD_Batch_Export_CLI.exe"
 BUILD_DIR = "dist/PCAD_Batch_Export"
 UPGRADE_CODE = "{3F582720-2F2C-4F29-95F9-50EF86BE5671}"
 TARGET_DIR = r"[ProgramFilesFolder]\\PCAD Batch Export"
@@ -16,9 +17,13 @@ PACKAGES = [
     "time",
     "re",
     "warnings",
+    "argparse",
+    "json",
+    "concurrent.futures",
     "PyPDF2",
     "pdf2image",
     "PIL",
+    "numpy",
     "io",
     "docx",
     "docxcompose",
@@ -165,7 +170,11 @@ executables = [
         "batch_export.py",
         # base=base,
         target_name=TARGET_EXE,
-    )
+    ),
+    Executable(
+        "cli.py",
+        target_name=CLI_TARGET_EXE,
+    ),
 ]
 
 setup(
@@ -0,0 +1,341 @@
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from concat import ReportSet
+from convert import cable_name_for
+from metrics import MetricsLog
+from parallel import Cancelled, run_jobs
+from reports import REPORTS_ENV, configured_reports
+from results import CSV_FILE, RESULTS_DB, csv_files, save_results, write_csv
+from watch import convert_watched_pdf
+
+QUEUE_DIR = '0queue'
+JOB_FILE = 'job.json'
+# Seconds a claim lasts unless renewed. Workers renew theirs every third of
+# that while converting, so a claim only runs out when its worker died or lost
+# the share. The machines' clocks must agree to well within it.
+LEASE_SECONDS = 120
+POLL_INTERVAL = 2
+
+
+def write_json(path, data):
+    # Write then rename so other machines never read a partial file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(data, file)
+    os.replace(temp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SharedQueue:
+    # A job folder worked on by several machines at once, needing nothing but
+    # the shared filesystem. The coordinator lists the PDFs in
+    # 0queue/job.json; workers claim them with lease files and leave each
+    # PDF's Word fragment and CSV fields in 0queue/results, which the
+    # coordinator merges in job order.
+    #
+    # A claim is the exclusive creation of leases/<pdf>.<n>.lease. An expired
+    # claim is taken over by creating generation n + 1, which only one worker
+    # can do, so no lease is ever renamed or overwritten by anyone but its
+    # holder. Results are kept per PDF signature like the watch state, so a
+    # rerun only converts PDFs that were added or replaced.
+
+    def __init__(self, folder, worker=None, lease_seconds=LEASE_SECONDS):
+        self.folder = os.path.normpath(folder)
+        self.worker = worker or worker_id()
+        self.lease_seconds = lease_seconds
+        self.queue_dir = os.path.join(self.folder, QUEUE_DIR)
+        self.lease_dir = os.path.join(self.queue_dir, 'leases')
+        self.result_dir = os.path.join(self.queue_dir, 'results')
+        self.job_path = os.path.join(self.queue_dir, JOB_FILE)
+        # lease path -> (pdf name, generation) of the claims this worker holds
+        self.held = {}
+        self.lock = threading.Lock()
+
+    def create(self, word=True, csv=True):
+        # Queues every PDF in the folder, in output order, with the report
+        # types the workers are to tell apart by name
+        os.makedirs(self.lease_dir, exist_ok=True)
+        os.makedirs(self.result_dir, exist_ok=True)
+        job = {'word': word, 'csv': csv, 'reports': configured_reports(),
+               'files': sorted(f for f in os.listdir(self.folder) if f.endswith('.pdf'))}
+        write_json(self.job_path, job)
+        return job
+
+    def job(self):
+        return read_json(self.job_path)
+
+    def _result_path(self, name, ext='.json'):
+        return os.path.join(self.result_dir, os.path.splitext(name)[0] + ext)
+
+    def _lease_path(self, name, generation):
+        return os.path.join(self.lease_dir, f"{name}.{generation}.lease")
+
+    def _pdf_stats(self):
+        with os.scandir(self.folder) as entries:
+            return {entry.name: entry.stat() for entry in entries if entry.name.endswith('.pdf') and entry.is_file()}
+
+    def _current(self, name, stat, job):
+        # The stored result of a PDF if it is for the PDF as it is now and has
+        # the outputs the job wants, else None
+        result = read_json(self._result_path(name))
+        if result is None or [result['size'], result['mtime_ns']] != [stat.st_size, stat.st_mtime_ns]:
+            return None
+        if (job['word'] and not result['word']) or (job['csv'] and not result['csv']):
+            return None
+        return result
+
+    def results(self, job):
+        # pdf name -> current result, in job order, for the PDFs that have one.
+        # One listing of each folder; only existing results are read.
+        stats = self._pdf_stats()
+        stored = set(os.listdir(self.result_dir))
+        results = {}
+        for name in job['files']:
+            if name in stats and os.path.splitext(name)[0] + '.json' in stored:
+                result = self._current(name, stats[name], job)
+                if result is not None:
+                    results[name] = result
+        return results
+
+    def outstanding(self, job):
+        # PDFs of the job that still exist and have no current result
+        stats = self._pdf_stats()
+        results = self.results(job)
+        return [name for name in job['files'] if name in stats and name not in results]
+
+    def leases(self):
+        # pdf name -> highest lease generation on the share
+        current = {}
+        for entry in os.listdir(self.lease_dir):
+            if not entry.endswith('.lease'):
+                continue
+            name, _, generation = entry[:-len('.lease')].rpartition('.')
+            if generation.isdigit():
+                current[name] = max(current.get(name, -1), int(generation))
+        return current
+
+    def _lease(self):
+        return {'worker': self.worker, 'expires': time.time() + self.lease_seconds}
+
+    def _expired(self, name, generation):
+        path = self._lease_path(name, generation)
+        lease = read_json(path)
+        if lease is not None:
+            return lease['expires'] < time.time()
+        try:
+            # Just created and not written yet, or its worker died in between
+            return os.path.getmtime(path) + self.lease_seconds < time.time()
+        except OSError:
+            # Released meanwhile
+            return True
+
+    def claim(self, name, generation=-1):
+        # `generation` is the highest lease of the PDF on the share, -1 for
+        # none. Returns whether this worker now holds the PDF.
+        if generation >= 0 and not self._expired(name, generation):
+            return False
+        path = self._lease_path(name, generation + 1)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as file:
+            json.dump(self._lease(), file)
+        with self.lock:
+            self.held[path] = (name, generation + 1)
+        # The claims this one replaces
+        for old in range(generation + 1):
+            try:
+                os.remove(self._lease_path(name, old))
+            except OSError:
+                pass
+        return True
+
+    def release(self, name):
+        with self.lock:
+            paths = [path for path, (held, _) in self.held.items() if held == name]
+            for path in paths:
+                del self.held[path]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def release_all(self):
+        for name in {name for name, _ in list(self.held.values())}:
+            self.release(name)
+
+    def renew(self):
+        with self.lock:
+            held = dict(self.held)
+        for path, (name, generation) in held.items():
+            if os.path.exists(self._lease_path(name, generation + 1)):
+                # Taken over after this worker let it expire; its result is
+                # still saved, and is the same as the new holder's
+                with self.lock:
+                    self.held.pop(path, None)
+                continue
+            try:
+                write_json(path, self._lease())
+            except OSError as error:
+                print(f"Could not renew the claim on {name}: {error}", file=sys.stderr)
+
+    def heartbeat(self, stop):
+        # Thread target: renews the held claims until `stop` is set
+        while not stop.wait(self.lease_seconds / 3):
+            self.renew()
+
+    def save(self, name, signature, job, fragment, fields, error):
+        # The fragment first, so a result never points at a missing one
+        if fragment is not None:
+            fd, temp_path = tempfile.mkstemp(dir=self.result_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(fragment)
+            os.replace(temp_path, self._result_path(name, '.docx'))
+        size, mtime_ns = signature
+        write_json(self._result_path(name), {'pdf': name, 'size': size, 'mtime_ns': mtime_ns, 'word': job['word'],
+                                             'csv': job['csv'], 'fields': fields, 'error': error,
+                                             'worker': self.worker})
+
+    def work(self, job, template_path, max_workers=None, cache=None, metrics=None, image_policy=None, cancel=None,
+             events=None):
+        # One pass over the job: converts every outstanding PDF this worker
+        # can claim. Returns the number converted here.
+        metrics = metrics or MetricsLog()
+        events = events or (lambda kind, **fields: None)
+        names = self.outstanding(job)
+        if not names:
+            return 0
+        leases = self.leases()
+        # The coordinator's reports, inherited by this pass's pool
+        os.environ[REPORTS_ENV] = ', '.join(job.get('reports') or configured_reports())
+        # (name, signature) of each claimed PDF, in the order it went to the pool
+        claimed = []
+
+        def jobs():
+            for name in names:
+                pdf_path = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(pdf_path)
+                except OSError:
+                    # Removed since the job was queued
+                    continue
+                if not self.claim(name, leases.get(name, -1)):
+                    continue
+                if self._current(name, stat, job) is not None:
+                    # Finished by another worker since the pass started
+                    self.release(name)
+                    continue
+                claimed.append((name, (stat.st_size, stat.st_mtime_ns)))
+                yield pdf_path, template_path, cache, image_policy, job['word'], job['csv']
+
+        with metrics.stage('worker', files=len(names)):
+            fn = metrics.instrument(convert_watched_pdf, 'worker')
+            try:
+                results = run_jobs(fn, jobs(), len(names), max_workers, window=1, cancel=cancel)
+                for i, (((fragment, record), error), spans) in enumerate(results):
+                    metrics.write(spans)
+                    name, signature = claimed[i]
+                    fields = record[cable_name_for(name)] if record is not None else None
+                    self.save(name, signature, job, fragment, fields, error)
+                    self.release(name)
+                    if error is None:
+                        events('processed', pdf=name)
+                    else:
+                        events('failed', pdf=name, error=error)
+            finally:
+                # Claims of PDFs the pool never finished, e.g. on cancellation
+                self.release_all()
+        return len(claimed)
+
+    def merge(self, job, default_path, results_db=RESULTS_DB, project=None, shard_size=None):
+        # Builds concatenated.docx and 0cable_info.csv from the results, in
+        # job order. Returns (outputs, {pdf name: error} of failed PDFs).
+        results = self.results(job)
+        failures = {name: result['error'] for name, result in results.items() if result['error'] is not None}
+        names = [name for name in results if name not in failures]
+        outputs = []
+        if job['csv']:
+            data = {cable_name_for(name): results[name]['fields'] for name in names}
+            if results_db:
+                save_results(self.folder, data, results_db, project)
+            else:
+                write_csv(data, os.path.join(self.folder, CSV_FILE))
+            outputs += csv_files(data, os.path.join(self.folder, CSV_FILE))
+        if job['word']:
+            report = ReportSet(default_path, os.path.join(self.folder, 'concatenated.docx'), shard_size)
+            for name in names:
+                with open(self._result_path(name, '.docx'), 'rb') as file:
+                    report.append(file.read(), name)
+            outputs += report.save()
+        return outputs, failures
+
+
+def run_worker(folder, template_path, max_workers=None, cache=None, metrics=None, image_policy=None,
+               lease_seconds=LEASE_SECONDS, interval=POLL_INTERVAL, stop=None, events=None):
+    # Works on the folder's queue until every PDF in it has a result, waiting
+    # for the coordinator to queue the job and for PDFs other workers hold.
+    # Returns the number of PDFs converted here; raises Cancelled once `stop`
+    # (an Event) is set.
+    queue = SharedQueue(folder, lease_seconds=lease_seconds)
+    stop = stop or threading.Event()
+    finished = threading.Event()
+    threading.Thread(target=queue.heartbeat, args=(finished,), daemon=True).start()
+    converted = 0
+    try:
+        while True:
+            job = queue.job()
+            if job is not None:
+                done = queue.work(job, template_path, max_workers, cache, metrics, image_policy, stop, events)
+                converted += done
+                if done:
+                    continue
+                if not queue.outstanding(job):
+                    return converted
+            if stop.wait(interval):
+                raise Cancelled
+    finally:
+        finished.set()
+
+
+def coordinate(folder, template_path, default_path, word=True, csv=True, work=True, max_workers=None, cache=None,
+               metrics=None, image_policy=None, results_db=RESULTS_DB, project=None, shard_size=None,
+               lease_seconds=LEASE_SECONDS, interval=POLL_INTERVAL, stop=None, events=None):
+    # Queues the folder's PDFs, works on them alongside the other machines'
+    # workers (unless `work` is False), waits for the rest and merges the
+    # outputs. Returns (outputs, failures) as SharedQueue.merge does.
+    queue = SharedQueue(folder, lease_seconds=lease_seconds)
+    stop = stop or threading.Event()
+    events = events or (lambda kind, **fields: None)
+    job = queue.create(word, csv)
+    events('queued', files=len(job['files']))
+    if work:
+        run_worker(folder, template_path, max_workers, cache, metrics, image_policy, lease_seconds, interval, stop,
+                   events)
+    else:
+        while True:
+            outstanding = len(queue.outstanding(job))
+            if not outstanding:
+                break
+            events('waiting', done=len(job['files']) - outstanding, total=len(job['files']))
+            if stop.wait(interval):
+                raise Cancelled
+    return queue.merge(job, default_path, results_db, project, shard_size)
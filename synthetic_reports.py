@@ -0,0 +1,129 @@
+import argparse
+import os
+import random
+
+# A4 in points
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+LINE_HEIGHT = 13
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _text(x, y, size, text):
+    return f"BT /F1 {size} Tf {x:.2f} {y:.2f} Td ({_escape(text)}) Tj ET"
+
+
+def _rule(y, width=0.8):
+    return f"{width} w 40 {y:.2f} m {PAGE_WIDTH - 40:.2f} {y:.2f} l S"
+
+
+def write_pdf(path, pages):
+    # Minimal PDF 1.4 writer: each page is a list of content stream operators
+    # drawn with Helvetica, which every renderer and text extractor knows.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for operators in pages:
+        stream = "\n".join(operators).encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+                       % (PAGE_WIDTH, PAGE_HEIGHT, len(objects)))
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, 'wb') as file:
+        file.write(output)
+
+
+def cable_fields(rng):
+    demand = rng.uniform(5, 2500)
+    rating = rng.choice([16, 20, 32, 40, 63, 80, 100, 125, 160, 250, 400, 630])
+    max_impedance = rng.uniform(0.05, 2.5)
+    # Roughly one cable in ten fails its earth fault loop check
+    impedance = max_impedance * (rng.uniform(1.01, 1.3) if rng.random() < 0.1 else rng.uniform(0.2, 0.95))
+    return {
+        "Load Maximum Demand": f"{demand:,.1f}",
+        "Rating": str(rating),
+        "Current Capacity": str(int(rating * rng.uniform(1.1, 1.6))),
+        "Max. Circuit Impedance (max. Zint)": f"{max_impedance:.3f}",
+        "Earth Fault Loop Impedance (Zint)": f"{impedance:.3f}",
+    }
+
+
+def report_pages(cable_name, page_count, rng, report="Earth Fault Loop Impedance"):
+    fields = cable_fields(rng)
+    labelled = [f"{label} : {value}" for label, value in fields.items()]
+    pages = []
+    for page_number in range(1, page_count + 1):
+        # Page furniture that the Word stage crops away
+        operators = [
+            _text(50, PAGE_HEIGHT - 60, 14, f"PowerCad-5 Report - {report}"),
+            _text(50, PAGE_HEIGHT - 80, 9, f"Project: SYNTHETIC    Cable: {cable_name}"),
+            _text(50, PAGE_HEIGHT - 95, 9, "Standard: AS/NZS 3000 / AS/NZS 3008.1.1"),
+            _rule(PAGE_HEIGHT - 180),
+            _text(50, 20, 8, f"Page {page_number} of {page_count}"),
+        ]
+        lines = rng.randint(10, 45) if page_number < page_count else rng.randint(5, 30)
+        if page_number == 1:
+            # The impedance result is the last field on the report, usually on a later page
+            body = labelled[:-1] if page_count > 1 else labelled
+        elif page_number == page_count:
+            body = labelled[-1:]
+        else:
+            body = []
+        body = body + [f"Segment {page_number}.{i}: {rng.uniform(0, 1000):.2f} m, "
+                       f"R {rng.uniform(0, 5):.4f} Ohm, X {rng.uniform(0, 1):.4f} Ohm"
+                       for i in range(lines - len(body))]
+
+        y = PAGE_HEIGHT - 200
+        for line in body:
+            operators.append(_text(60, y, 10, line))
+            y -= LINE_HEIGHT
+        operators.append(_rule(y + LINE_HEIGHT - 4))
+        pages.append(operators)
+    return pages
+
+
+def generate_reports(folder, count, min_pages=2, max_pages=6, seed=0):
+    # Returns [(pdf_path, page_count)] for `count` synthetic reports
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    reports = []
+    for i in range(count):
+        cable_name = f"SYN-{i:04d}"
+        page_count = rng.randint(min_pages, max_pages)
+        path = os.path.join(folder, f"{cable_name}.pdf")
+        write_pdf(path, report_pages(cable_name, page_count, rng))
+        reports.append((path, page_count))
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic PowerCad-style Earth Fault Loop Impedance reports.")
+    parser.add_argument('folder')
+    parser.add_argument('--count', type=int, default=50)
+    parser.add_argument('--min-pages', type=int, default=2)
+    parser.add_argument('--max-pages', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    reports = generate_reports(args.folder, args.count, args.min_pages, args.max_pages, args.seed)
+    print(f"Wrote {len(reports)} report(s), {sum(pages for _, pages in reports)} page(s) to {args.folder}")
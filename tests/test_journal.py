@@ -0,0 +1,113 @@
+import csv
+import json
+
+from journal import EXPORTED, FAILED, JOURNAL_FILE, PENDING, VERIFIED, ExportJournal, verify_pdf
+from powercad import FAKE_LATENCY, FakePowerCadDriver, export_projects, export_report_checked
+
+FAST = {step: 0.001 for step in FAKE_LATENCY}
+
+
+def fake_driver(**kwargs):
+    return FakePowerCadDriver(latency=FAST, timeout=0.05, load_timeout=0.05, save_timeout=0.05, **kwargs)
+
+
+def projects(folder, names):
+    (folder / 'out').mkdir(exist_ok=True)
+    paths = []
+    for name in names:
+        (folder / f"{name}.pcd").write_bytes(b'')
+        paths.append(str(folder / f"{name}.pcd"))
+    return paths, list(names), str(folder / 'out')
+
+
+def states(folder, pdf_name):
+    with open(folder / 'out' / JOURNAL_FILE) as file:
+        return [entry['state'] for entry in map(json.loads, file) if entry['pdf'] == pdf_name]
+
+
+def export_one(tmp_path, failures=None):
+    (project,), _, output = projects(tmp_path, ['A'])
+    driver = fake_driver(failures=failures)
+    driver.connect()
+    journal = ExportJournal(output)
+    return export_report_checked(driver, journal, project, {'Earth Fault Loop Impedance': f"{output}/A.pdf"})
+
+
+def test_journal_records_a_verified_export(tmp_path):
+    assert export_one(tmp_path) == {}
+    assert states(tmp_path, 'A.pdf') == [PENDING, EXPORTED, VERIFIED]
+    assert verify_pdf(tmp_path / 'out' / 'A.pdf')
+
+
+def test_journal_records_an_incomplete_pdf(tmp_path):
+    failed = export_one(tmp_path, {'A': 'corrupt'})
+    assert failed == {'Earth Fault Loop Impedance': 'A.pdf is missing or not a complete PDF'}
+    assert states(tmp_path, 'A.pdf') == [PENDING, EXPORTED, FAILED]
+
+
+def test_journal_records_a_hang(tmp_path):
+    failed = export_one(tmp_path, {'A': 'load'})
+    assert 'Timed out' in failed['Earth Fault Loop Impedance']
+    # Nothing was written, so it never counted as exported
+    assert states(tmp_path, 'A.pdf') == [PENDING, FAILED]
+
+
+def test_journal_reloads_the_last_state_of_each_pdf(tmp_path):
+    journal = ExportJournal(str(tmp_path))
+    journal.write('A.pdf', PENDING, attempts=1)
+    journal.write('A.pdf', VERIFIED)
+    journal.write('B.pdf', PENDING, attempts=2)
+    # A crash in the middle of a line
+    with open(tmp_path / JOURNAL_FILE, 'a') as file:
+        file.write('{"pdf": "B.pdf", "sta')
+    reloaded = ExportJournal(str(tmp_path))
+    assert (reloaded.state('A.pdf'), reloaded.attempts('A.pdf')) == (VERIFIED, 1)
+    assert (reloaded.state('B.pdf'), reloaded.attempts('B.pdf')) == (PENDING, 2)
+    reloaded.write('B.pdf', FAILED, error='hung')
+    assert ExportJournal(str(tmp_path)).state('B.pdf') == FAILED
+
+
+def test_retries_are_bounded(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, ['A', 'B', 'C'])
+    attempts = {}
+    failures = export_projects(fake_driver(failures={'B': 'corrupt', 'C': ['load', None]}, attempts=attempts),
+                               inputs, outputs, folder, retries=2)
+    assert failures == {inputs[1]: 'B.pdf is missing or not a complete PDF'}
+    # B on the first pass and both retries; C failed once and then exported
+    assert attempts == {'A': 1, 'B': 3, 'C': 2}
+    journal = ExportJournal(folder)
+    assert [(journal.state(name), journal.attempts(name)) for name in ('A.pdf', 'B.pdf', 'C.pdf')] == \
+        [(VERIFIED, 1), (FAILED, 3), (VERIFIED, 2)]
+
+
+def test_failure_report_lists_projects_that_still_failed(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, ['A', 'B', 'C'])
+    export_projects(fake_driver(failures={'A': 'load', 'C': 'corrupt'}), inputs, outputs, folder, retries=1)
+    with open(tmp_path / 'out' / '0export_failures.csv', newline='') as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ['Project', 'PDF', 'Attempts', 'Error']
+    assert sorted(row[:3] for row in rows[1:]) == [[inputs[0], 'A.pdf', '2'], [inputs[2], 'C.pdf', '2']]
+    errors = {row[1]: row[3] for row in rows[1:]}
+    assert 'Timed out' in errors['A.pdf']
+    assert errors['C.pdf'] == 'C.pdf is missing or not a complete PDF'
+
+    # Gone once a resumed run exports them
+    assert export_projects(fake_driver(), inputs, outputs, folder, resume=True) == {}
+    assert not (tmp_path / 'out' / '0export_failures.csv').exists()
+
+
+def test_resume_skips_verified_pdfs(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, ['A', 'B', 'C'])
+    export_projects(fake_driver(failures={'B': 'corrupt'}), inputs, outputs, folder, retries=0)
+
+    attempts = {}
+    exported = []
+    progress = []
+    failures = export_projects(fake_driver(attempts=attempts), inputs, outputs, folder, resume=True,
+                               exported=exported.append, progress=lambda done, total: progress.append(done))
+    assert failures == {}
+    assert attempts == {'B': 1}
+    assert sorted(exported) == sorted(f"{folder}/{name}.pdf" for name in ('A', 'B', 'C'))
+    # The skipped projects count as done straight away
+    assert progress == [2, 3]
+    assert ExportJournal(folder).state('B.pdf') == VERIFIED
@@ -0,0 +1,94 @@
+from PIL import Image, ImageDraw
+
+from layout import LayoutProfile, LayoutStore
+from trim import MARGIN_BOTTOM, MARGIN_LEFT, MARGIN_TOP, crop_report_page
+
+# An A4 page at 150 dpi, laid out like a PowerCad report
+SIZE = (595.28, 841.89)
+DPI = 150
+WIDTH, HEIGHT = 1241, 1754
+RULE = 374
+
+
+def report_page(content_right, shift=0):
+    # Header text closed by a ruled line, a table as wide as content_right,
+    # and a page footer
+    image = Image.new('RGB', (WIDTH, HEIGHT), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 120 + shift, 700, 160 + shift), fill='black')
+    draw.rectangle((83, RULE + shift, 1157, RULE + 2 + shift), fill='black')
+    for row in range(6):
+        top = 410 + shift + row * 40
+        draw.rectangle((100, top, content_right, top + 20), fill='black')
+    draw.rectangle((100, 1700, 400, 1720), fill='black')
+    return image
+
+
+def window_render(profile, image):
+    # What the renderer returns for a page when asked for profile.window
+    x, y, width, height = profile.window
+    return image.crop((x, y, x + width, y + height))
+
+
+def learn(image):
+    return LayoutProfile.learn(image, 'Earth Fault Loop Impedance', SIZE, DPI)
+
+
+def test_learns_boxes():
+    profile = learn(report_page(400))
+    assert profile.learned
+    assert profile.rule == (RULE, RULE + 3)
+    x, y, width, height = profile.content
+    assert (x, width) == (MARGIN_LEFT, WIDTH - 2 * MARGIN_LEFT)
+    assert RULE + 3 < y < 410
+    assert 410 + 5 * 40 + 20 < y + height < 1700
+
+
+def test_wider_page_than_sample_is_not_clipped():
+    # Learned from a narrow table, applied to a page whose table runs to the
+    # right margin: the crop keeps the full report width, as the fixed
+    # margins do
+    profile = learn(report_page(400))
+    wide = report_page(1150)
+    assert profile.check(window_render(profile, wide))
+    cropped = profile.trim(profile.crop(window_render(profile, wide), window=True))
+    assert cropped.width == crop_report_page(wide).width
+    # The right end of the table is still there
+    assert cropped.getpixel((1150 - MARGIN_LEFT - 1, 410 + 10 - profile.content[1])) == (0, 0, 0)
+
+
+def test_full_page_and_window_crops_agree():
+    profile = learn(report_page(400))
+    wide = report_page(1150)
+    full = profile.trim(profile.crop(wide))
+    window = profile.trim(profile.crop(window_render(profile, wide), window=True))
+    assert full.tobytes() == window.tobytes()
+
+
+def test_moved_header_fails_check():
+    profile = learn(report_page(400))
+    assert not profile.check(window_render(profile, report_page(400, shift=62)))
+
+
+def test_store_round_trip(tmp_path):
+    path = tmp_path / 'layouts.json'
+    profile = learn(report_page(400))
+    LayoutStore(str(path)).put(profile)
+    stored = LayoutStore(str(path)).get(profile.report, profile.size, profile.dpi)
+    assert stored.to_dict() == profile.to_dict()
+
+
+def test_content_into_footer_keeps_bottom_margin():
+    # A sample page whose table runs to just above "Page n of m" hides the
+    # footer gap: the profile stops at the fixed bottom margin instead of
+    # taking in the footer
+    dense = report_page(400)
+    ImageDraw.Draw(dense).rectangle((100, 650, 1100, 1690), fill='black')
+    profile = learn(dense)
+    x, y, width, height = profile.content
+    assert y + height == HEIGHT - MARGIN_BOTTOM
+    assert profile.window[1] + profile.window[3] == HEIGHT - MARGIN_BOTTOM
+    page = report_page(400)
+    assert profile.check(window_render(profile, page))
+    cropped = profile.trim(profile.crop(window_render(profile, page), window=True))
+    assert cropped.height == crop_report_page(page).height - (y - MARGIN_TOP)
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pdf_render
+import renderers
+from renderers import DEFAULT_RENDERER, RENDERER_ENV, renderer_name
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def pdfium(monkeypatch):
+    # Sets whether pypdfium2 counts as installed, with the fallback warning not yet given
+    monkeypatch.delenv(RENDERER_ENV, raising=False)
+    monkeypatch.setattr(renderers, '_fallback_reported', False)
+
+    def installed(available):
+        monkeypatch.setattr(renderers, 'pdfium_available', lambda: available)
+    return installed
+
+
+def test_configured_renderer(pdfium, monkeypatch):
+    pdfium(True)
+    assert renderer_name() == DEFAULT_RENDERER == 'pdftoppm'
+    monkeypatch.setenv(RENDERER_ENV, 'pdfium')
+    assert renderer_name() == 'pdfium'
+    # An explicit choice wins over the environment
+    assert renderer_name('pdftoppm') == 'pdftoppm'
+
+
+def test_unknown_renderer(pdfium):
+    with pytest.raises(ValueError, match='ghostscript'):
+        renderer_name('ghostscript')
+
+
+def test_pdfium_falls_back_with_one_warning(pdfium, monkeypatch, capsys):
+    pdfium(False)
+    monkeypatch.setenv(RENDERER_ENV, 'pdfium')
+    assert renderer_name() == 'pdftoppm'
+    assert renderer_name('pdfium') == 'pdftoppm'
+    captured = capsys.readouterr()
+    # stdout carries the CLI's --json events
+    assert captured.out == ''
+    assert captured.err.count('pypdfium2') == 1
+
+
+def test_pages_go_to_the_selected_renderer(pdfium, monkeypatch):
+    monkeypatch.setattr(pdf_render, '_iter_pdfium_pages', lambda source, dpi, region: 'pdfium')
+    monkeypatch.setattr(pdf_render, '_iter_pdftoppm_pages', lambda source, dpi, region: 'pdftoppm')
+    pdfium(True)
+    assert pdf_render.iter_pdf_pages('a.pdf', renderer='pdfium') == 'pdfium'
+    assert pdf_render.iter_pdf_pages('a.pdf') == 'pdftoppm'
+    pdfium(False)
+    assert pdf_render.iter_pdf_pages('a.pdf', renderer='pdfium') == 'pdftoppm'
+
+
+def loaded_modules(statement):
+    # Modules loaded by `statement` in a fresh interpreter
+    code = f"import sys; {statement}; print(' '.join(sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True,
+                            env={**os.environ, 'QT_QPA_PLATFORM': 'offscreen'})
+    return set(result.stdout.split())
+
+
+def test_availability_check_does_not_import_pypdfium2():
+    assert 'pypdfium2' not in loaded_modules('import renderers; renderers.pdfium_available()')
+
+
+def test_gui_does_not_load_the_renderers():
+    pytest.importorskip('PySide6')
+    modules = loaded_modules('import batch_export; from PySide6.QtWidgets import QApplication; '
+                             'app = QApplication([]); batch_export.FolderBrowserApp()')
+    assert not modules & {'PIL', 'pdf2image', 'PyPDF2', 'pypdfium2', 'pdf_render'}
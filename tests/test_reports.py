@@ -0,0 +1,88 @@
+import csv
+import os
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+from concat import ReportSet
+from reports import (DEFAULT_REPORT, REPORTS_ENV, parse_reports, report_file_name, report_of, report_output,
+                     split_report_name, split_reports)
+from results import write_csv
+
+DEFAULT_DOC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'default.docx')
+REPORTS = f"{DEFAULT_REPORT}, Voltage Drop"
+
+
+@pytest.fixture(autouse=True)
+def configured(monkeypatch):
+    monkeypatch.setenv(REPORTS_ENV, REPORTS)
+
+
+def test_configured_suffix_names_the_report():
+    assert split_report_name('CB-1 [Voltage Drop]') == ('CB-1', 'Voltage Drop')
+    assert report_of('/out/CB-1 [Voltage Drop].pdf') == 'Voltage Drop'
+    assert split_report_name('CB-1') == ('CB-1', DEFAULT_REPORT)
+
+
+@pytest.mark.parametrize('name', ['CB-1 [spare]', 'CB-1 [voltage drop]', 'CB-1[Voltage Drop]',
+                                  f"CB-1 [{DEFAULT_REPORT}]", 'CB-1 [Voltage Drop] old', 'CB [1] [spare]'])
+def test_other_suffixes_are_part_of_the_cable(name):
+    assert split_report_name(name) == (name, DEFAULT_REPORT)
+
+
+def test_reports_default_to_the_environment(monkeypatch):
+    assert split_report_name('CB-1 [Voltage Drop]', reports=[DEFAULT_REPORT]) == \
+        ('CB-1 [Voltage Drop]', DEFAULT_REPORT)
+    monkeypatch.delenv(REPORTS_ENV)
+    # Nothing configured: only the default report
+    assert split_report_name('CB-1 [Voltage Drop]') == ('CB-1 [Voltage Drop]', DEFAULT_REPORT)
+    assert split_report_name('CB-1 [spare]', reports=['spare']) == ('CB-1', 'spare')
+
+
+def test_names_round_trip():
+    assert parse_reports(f" Voltage Drop,{DEFAULT_REPORT}, Voltage Drop ,") == ['Voltage Drop', DEFAULT_REPORT]
+    assert parse_reports('') == [DEFAULT_REPORT]
+    for report in parse_reports(REPORTS):
+        assert split_report_name(report_file_name('CB-1 [spare]', report)) == ('CB-1 [spare]', report)
+    assert report_output('/out/concatenated.docx', 'Voltage Drop') == '/out/concatenated [Voltage Drop].docx'
+    assert report_output('/out/concatenated.docx', DEFAULT_REPORT) == '/out/concatenated.docx'
+
+
+def test_data_is_split_by_report():
+    data = {'CB-1': {'a': 1}, 'CB-1 [Voltage Drop]': {'b': 2}, 'CB-1 [spare]': {'c': 3}}
+    assert split_reports(data) == {
+        DEFAULT_REPORT: {'CB-1': {'a': 1}, 'CB-1 [spare]': {'c': 3}},
+        'Voltage Drop': {'CB-1': {'b': 2}},
+    }
+    assert split_reports({}) == {DEFAULT_REPORT: {}}
+
+
+def fragment(text):
+    document = Document()
+    document.add_paragraph(text)
+    stream = BytesIO()
+    document.save(stream)
+    return stream.getvalue()
+
+
+def cables(path):
+    return [paragraph.text for paragraph in Document(path).paragraphs if paragraph.text.startswith('cable ')]
+
+
+def test_fragments_go_to_their_report_document(tmp_path):
+    output = str(tmp_path / 'concatenated.docx')
+    report = ReportSet(DEFAULT_DOC, output)
+    for name in ['CB-1.pdf', 'CB-1 [Voltage Drop].pdf', 'CB-1 [spare].pdf', 'CB-2 [Voltage Drop].pdf']:
+        report.append(fragment(f"cable {name}"), name)
+    voltage_drop = str(tmp_path / 'concatenated [Voltage Drop].docx')
+    assert report.save() == [output, voltage_drop]
+    assert cables(output) == ['cable CB-1.pdf', 'cable CB-1 [spare].pdf']
+    assert cables(voltage_drop) == ['cable CB-1 [Voltage Drop].pdf', 'cable CB-2 [Voltage Drop].pdf']
+
+
+def test_csv_keeps_unconfigured_suffixes(tmp_path):
+    output = tmp_path / '0cable_info.csv'
+    write_csv({'CB-1': {}, 'CB-1 [Voltage Drop]': {}, 'CB-1 [spare]': {}}, str(output))
+    with open(output, newline='') as file:
+        assert [row[0] for row in list(csv.reader(file))[1:]] == ['CB-1', 'CB-1 [spare]']
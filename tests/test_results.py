@@ -0,0 +1,85 @@
+import csv
+
+from results import CSV_FILE, ResultsStore, save_results, write_csv
+
+DATA = {
+    'CB-1': {'Load Maximum Demand': '10', 'CB Rating': '16', 'Current Capacity': '24',
+             'MAX EF impedence': '2.87', 'EF impedence': '0.52'},
+    'CB-2': {'Load Maximum Demand': '32', 'CB Rating': '40', 'Current Capacity': '41',
+             'MAX EF impedence': '0.5', 'EF impedence': '1.25'},
+    # Values are kept as the report printed them, however they read
+    'CB-10': {'Load Maximum Demand': '', 'CB Rating': '6', 'MAX EF impedence': '7.67'},
+}
+
+
+def read_rows(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_run_keeps_order_and_grades_results(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    run = store.add_run(str(tmp_path / 'Project A'), DATA)
+    rows = store.results(run)
+    assert [row['cable'] for row in rows] == ['CB-1', 'CB-2', 'CB-10']
+    assert [row['passed'] for row in rows] == [1, 0, None]
+    assert round(rows[0]['margin'], 6) == 2.35
+    assert rows[2]['margin'] is None
+    assert rows[0]['project'] == 'Project A'
+    assert store.latest_run('Project A') == run
+    store.close()
+
+
+def test_queries_across_runs(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.sqlite'))
+    first = store.add_run(str(tmp_path / 'A'), DATA)
+    changed = {'CB-1': {**DATA['CB-1'], 'EF impedence': '3.1'}, 'CB-2': DATA['CB-2'], 'CB-3': DATA['CB-1']}
+    second = store.add_run(str(tmp_path / 'A'), changed)
+    store.add_run(str(tmp_path / 'B'), DATA)
+
+    assert [(row['run'], row['cable']) for row in store.failing(project='A')] == \
+        [(second, 'CB-1'), (second, 'CB-2'), (first, 'CB-2')]
+    assert [(row['run'], row['passed']) for row in store.history('CB-1', 'A')] == [(first, 1), (second, 0)]
+    changes = {cable: (old is not None, new is not None) for cable, old, new in store.changes(second)}
+    assert changes == {'CB-1': (True, True), 'CB-3': (False, True), 'CB-10': (True, False)}
+    assert store.changes(first) == [(cable, None, row) for cable, row in
+                                    zip(DATA, store.results(first))]
+    store.close()
+
+
+def test_write_csv_round_trip(tmp_path):
+    output = tmp_path / CSV_FILE
+    write_csv(DATA, str(output))
+    rows = read_rows(output)
+    assert rows[0] == ['Cable', 'Load Maximum Demand', 'CB Rating', 'Current Capacity', 'MAX EF impedence',
+                       'EF impedence', 'Result']
+    assert rows[1:] == [
+        ['CB-1', '10', '16', '24', '2.87', '0.52', 'Pass'],
+        ['CB-2', '32', '40', '41', '0.5', '1.25', 'Fail'],
+        ['CB-10', '', '6', '', '7.67', '', ''],
+    ]
+
+
+def test_saved_run_exports_the_same_csv(tmp_path):
+    db = str(tmp_path / 'results.sqlite')
+    folder = tmp_path / 'Project'
+    folder.mkdir()
+    run = save_results(str(folder), DATA, db)
+    write_csv(DATA, str(tmp_path / 'expected.csv'))
+    assert read_rows(folder / CSV_FILE) == read_rows(tmp_path / 'expected.csv')
+
+    store = ResultsStore(db)
+    store.export_csv(run, str(tmp_path / 'exported.csv'))
+    assert read_rows(tmp_path / 'exported.csv') == read_rows(tmp_path / 'expected.csv')
+    store.close()
+
+
+def test_unusable_database_still_writes_csv(tmp_path, capsys):
+    folder = tmp_path / 'Project'
+    folder.mkdir()
+    # A folder where the database file should be
+    assert save_results(str(folder), DATA, str(tmp_path)) is None
+    assert [row[0] for row in read_rows(folder / CSV_FILE)[1:]] == list(DATA)
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'Could not record results' in captured.err
@@ -0,0 +1,91 @@
+import pytest
+
+from journal import ExportJournal
+from powercad import (FAKE_LATENCY, FakePowerCadDriver, PowerCadDriver, PowerCadUnavailable, ShardedExport,
+                      export_projects)
+
+LATENCY = {**{step: 0.001 for step in FAKE_LATENCY}, 'load': 0.02}
+
+
+def fake_driver(**kwargs):
+    return FakePowerCadDriver(latency=LATENCY, timeout=0.05, load_timeout=0.05, save_timeout=0.05, **kwargs)
+
+
+def projects(folder, count):
+    (folder / 'out').mkdir(exist_ok=True)
+    names = [f"P{i}" for i in range(count)]
+    for name in names:
+        (folder / f"{name}.pcd").write_bytes(b'')
+    return [str(folder / f"{name}.pcd") for name in names], names, str(folder / 'out')
+
+
+def test_projects_are_shared_between_instances(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, 12)
+    # One attempts dict per instance records which projects it exported
+    handled = [{}, {}, {}]
+    exported = []
+    failures = export_projects([fake_driver(attempts=attempts) for attempts in handled], inputs, outputs, folder,
+                               exported=exported.append)
+    assert failures == {}
+    assert len(exported) == 12
+    names = [name for attempts in handled for name in attempts]
+    assert sorted(names) == sorted(outputs)
+    assert all(handled)
+
+
+def test_unreachable_instance_is_dropped(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, 6)
+    handled = {}
+    failures = export_projects([fake_driver(connect_error=True), fake_driver(attempts=handled)], inputs, outputs,
+                               folder)
+    assert failures == {}
+    assert sorted(handled) == sorted(outputs)
+
+
+def test_broken_instance_hands_its_project_on(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, 6)
+    broken = fake_driver()
+
+    def export_reports(project_path, pdf_paths):
+        raise RuntimeError("automation broke")
+
+    broken.export_reports = export_reports
+    handled = {}
+    assert export_projects([broken, fake_driver(attempts=handled)], inputs, outputs, folder) == {}
+    assert sorted(handled) == sorted(outputs)
+
+
+def test_no_reachable_instance_fails_only_what_was_left(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, 3)
+    export_projects(fake_driver(), inputs[:1], outputs[:1], folder)
+    with pytest.raises(PowerCadUnavailable) as raised:
+        export_projects([fake_driver(connect_error=True), fake_driver(connect_error=True)], inputs, outputs, folder,
+                        resume=True)
+    assert sorted(raised.value.failures) == inputs[1:]
+
+
+def test_missing_automation_packages_drop_the_instance(tmp_path):
+    # Without pywinauto (or without PowerCad running) connect() fails with a
+    # PowerCadError, which the export reports instead of dying
+    inputs, outputs, folder = projects(tmp_path, 2)
+    with pytest.raises(PowerCadUnavailable) as raised:
+        export_projects(PowerCadDriver(timeout=0.1), inputs, outputs, folder)
+    assert sorted(raised.value.failures) == inputs
+
+
+def test_shard_failures_are_merged(tmp_path):
+    inputs, outputs, folder = projects(tmp_path, 8)
+    jobs = [(project, {'Earth Fault Loop Impedance': f"{folder}/{name}.pdf"}) for project, name in zip(inputs, outputs)]
+    scripted = {'P1': 'corrupt', 'P4': 'load', 'P6': 'corrupt'}
+    failed = []
+    export = ShardedExport([fake_driver(failures=scripted), fake_driver(failures=scripted)], ExportJournal(folder),
+                           len(jobs), retries=0, failed=lambda pdf_path, error: failed.append(pdf_path))
+    failures = export.run(jobs)
+
+    assert sorted(failures) == [inputs[1], inputs[4], inputs[6]]
+    assert failures[inputs[1]] == 'P1.pdf is missing or not a complete PDF'
+    assert 'Timed out' in failures[inputs[4]]
+    # Whichever instance each failure happened on, all of them are returned
+    merged = {project: error for shard in export.shard_failures.values() for project, error in shard.items()}
+    assert merged == failures
+    assert sorted(failed) == [f"{folder}/{name}.pdf" for name in ('P1', 'P4', 'P6')]
@@ -0,0 +1,126 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+from io import BytesIO
+
+from docx import Document
+
+from shared_queue import SharedQueue, coordinate, read_json
+
+DEFAULT_DOC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'default.docx')
+
+
+def make_job(folder, count=20, csv_output=True, word=False):
+    # A queued folder of empty stand-in PDFs; nothing here converts them
+    for i in range(count):
+        (folder / f"C-{i:02}.pdf").write_bytes(b'%PDF-1.4\n' + bytes(i))
+    return SharedQueue(str(folder), worker='coordinator').create(word=word, csv=csv_output)
+
+
+def claim_all(folder, worker, start, claims):
+    # One worker process: claims what it can of the job, like a work() pass
+    queue = SharedQueue(folder, worker=worker)
+    start.wait()
+    leases = queue.leases()
+    claims.put((worker, [name for name in queue.job()['files'] if queue.claim(name, leases.get(name, -1))]))
+
+
+def test_concurrent_workers_claim_disjoint_pdfs(tmp_path):
+    job = make_job(tmp_path, 40)
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    claims = context.Queue()
+    workers = [context.Process(target=claim_all, args=(str(tmp_path), f"w{i}", start, claims)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    claimed = dict(claims.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join()
+
+    names = [name for held in claimed.values() for name in held]
+    assert sorted(names) == job['files']
+    # Every PDF has exactly one lease, written by the worker that holds it
+    leases = SharedQueue(str(tmp_path)).leases()
+    assert leases == {name: 0 for name in job['files']}
+    for worker, held in claimed.items():
+        for name in held:
+            assert read_json(tmp_path / '0queue' / 'leases' / f"{name}.0.lease")['worker'] == worker
+
+
+def expire(queue, name, generation):
+    path = queue._lease_path(name, generation)
+    with open(path) as file:
+        lease = json.load(file)
+    lease['expires'] = time.time() - 1
+    with open(path, 'w') as file:
+        json.dump(lease, file)
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    make_job(tmp_path, 1)
+    first = SharedQueue(str(tmp_path), worker='first')
+    second = SharedQueue(str(tmp_path), worker='second')
+    assert first.claim('C-00.pdf')
+    # Held and still fresh
+    assert not second.claim('C-00.pdf', second.leases()['C-00.pdf'])
+    assert not second.claim('C-00.pdf')
+
+    expire(first, 'C-00.pdf', 0)
+    assert second.claim('C-00.pdf', second.leases()['C-00.pdf'])
+    assert second.leases() == {'C-00.pdf': 1}
+    assert read_json(second._lease_path('C-00.pdf', 1))['worker'] == 'second'
+    # A third worker that saw the same expired lease loses the race
+    assert not SharedQueue(str(tmp_path), worker='third').claim('C-00.pdf', 0)
+
+
+def test_stale_worker_does_not_renew_after_takeover(tmp_path):
+    make_job(tmp_path, 1)
+    first = SharedQueue(str(tmp_path), worker='first')
+    second = SharedQueue(str(tmp_path), worker='second')
+    assert first.claim('C-00.pdf')
+    expire(first, 'C-00.pdf', 0)
+    assert second.claim('C-00.pdf', 0)
+    taken = read_json(second._lease_path('C-00.pdf', 1))
+
+    first.renew()
+    assert first.held == {}
+    assert not os.path.exists(first._lease_path('C-00.pdf', 0))
+    assert read_json(second._lease_path('C-00.pdf', 1)) == taken
+    # Releasing what it no longer holds leaves the new claim alone
+    first.release('C-00.pdf')
+    assert second.leases() == {'C-00.pdf': 1}
+
+
+def fragment(text):
+    document = Document()
+    document.add_paragraph(text)
+    stream = BytesIO()
+    document.save(stream)
+    return stream.getvalue()
+
+
+def test_coordinate_merges_in_job_order(tmp_path):
+    job = make_job(tmp_path, 6, word=True)
+    # Results arrive from several workers in reverse order, one of them failed
+    for i, name in reversed(list(enumerate(job['files']))):
+        stat = os.stat(tmp_path / name)
+        queue = SharedQueue(str(tmp_path), worker=f"w{i % 3}")
+        error = 'Broken PDF' if name == 'C-03.pdf' else None
+        queue.save(name, (stat.st_size, stat.st_mtime_ns), job, fragment(f"cable {name}"),
+                   {'EF impedence': str(i)}, error)
+
+    outputs, failures = coordinate(str(tmp_path), None, DEFAULT_DOC, word=True, csv=True, work=False,
+                                   results_db=None, interval=0.01)
+
+    assert failures == {'C-03.pdf': 'Broken PDF'}
+    expected = [name for name in job['files'] if name != 'C-03.pdf']
+    with open(tmp_path / '0cable_info.csv', newline='') as file:
+        cables = [row[0] for row in list(csv.reader(file))[1:]]
+    assert cables == [os.path.splitext(name)[0] for name in expected]
+    assert os.path.join(str(tmp_path), 'concatenated.docx') in outputs
+    text = [paragraph.text for paragraph in Document(tmp_path / 'concatenated.docx').paragraphs
+            if paragraph.text.startswith('cable ')]
+    assert text == [f"cable {name}" for name in expected]
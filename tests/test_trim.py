@@ -0,0 +1,99 @@
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+from trim import MARGIN_BOTTOM, MARGIN_LEFT, MARGIN_TOP, content_bottom, content_bottom_from_end, crop_report_page
+
+# Small enough for the per-row reference loop, big enough for the margins
+WIDTH, HEIGHT = 600, 900
+
+
+def loop_crop_report_page(image):
+    # The per-row loop ConvertPDFsThread used before trim.py, kept verbatim
+    # as the reference
+    left = 170//2
+    top = 782//2
+    right = image.width - left
+    bottom = image.height - 140//2
+
+    image = image.crop((left, top, right, bottom))
+
+    bottom = image.height
+    threshold = sum(sum(pixel) for pixel in image.crop((left, bottom - 1, right, bottom)).getdata())
+
+    bottom -= 1
+    while bottom > 0:
+        pixel_row = image.crop((left, bottom - 1, right, bottom))
+        pixel_sum = sum(sum(pixel) for pixel in pixel_row.getdata())
+
+        if pixel_sum < threshold:
+            break
+
+        bottom -= 1
+    if bottom < 5:
+        return None
+    return image.crop((0, 0, image.width, bottom))
+
+
+def page(draw=None):
+    image = Image.new('RGB', (WIDTH, HEIGHT), 'white')
+    if draw:
+        draw(ImageDraw.Draw(image))
+    return image
+
+
+def noisy_page():
+    image = page()
+    generator = random.Random(7)
+    pixels = image.load()
+    for _ in range(4000):
+        pixels[generator.randrange(WIDTH), generator.randrange(HEIGHT)] = (generator.randrange(256),) * 3
+    return image
+
+
+# Page coordinates of the scanned region: the report region of the page,
+# less the left margin again (the loop's column offset)
+SCAN_LEFT = 2 * MARGIN_LEFT
+REGION_BOTTOM = HEIGHT - MARGIN_BOTTOM
+
+PAGES = {
+    'blank': lambda: page(),
+    'full': lambda: Image.new('RGB', (WIDTH, HEIGHT), 'black'),
+    'text': lambda: page(lambda d: d.rectangle((120, 420, 480, 600), fill='black')),
+    'first_scanned_column': lambda: page(lambda d: d.line((SCAN_LEFT, 450, SCAN_LEFT, 700), fill='black')),
+    'before_scanned_columns': lambda: page(lambda d: d.line((SCAN_LEFT - 1, 450, SCAN_LEFT - 1, 700), fill='black')),
+    'right_edge': lambda: page(lambda d: d.line((WIDTH - MARGIN_LEFT - 1, 450, WIDTH - MARGIN_LEFT - 1, 700),
+                                                fill='black')),
+    'top_row': lambda: page(lambda d: d.line((100, MARGIN_TOP, 500, MARGIN_TOP), fill='black')),
+    'above_min_height': lambda: page(lambda d: d.line((100, MARGIN_TOP + 5, 500, MARGIN_TOP + 5), fill='black')),
+    'last_row_but_one': lambda: page(lambda d: d.line((100, REGION_BOTTOM - 2, 500, REGION_BOTTOM - 2),
+                                                      fill='black')),
+    'last_row': lambda: page(lambda d: d.line((100, REGION_BOTTOM - 1, 500, REGION_BOTTOM - 1), fill='black')),
+    'grey_background': lambda: page(lambda d: d.rectangle((0, 0, WIDTH, HEIGHT), fill=(240, 240, 240))),
+    'noise': noisy_page,
+}
+
+
+# The reference loop's Image.getdata() is deprecated in newer Pillow
+@pytest.mark.filterwarnings('ignore::DeprecationWarning')
+@pytest.mark.parametrize('name', PAGES)
+def test_crop_matches_per_row_loop(name):
+    image = PAGES[name]()
+    expected = loop_crop_report_page(image)
+    cropped = crop_report_page(image)
+    if expected is None:
+        assert cropped is None
+    else:
+        assert cropped is not None
+        assert cropped.size == expected.size
+        assert cropped.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('name', PAGES)
+@pytest.mark.parametrize('block', [1, 7, 128, 10000])
+def test_bottom_up_search_matches_full_scan(name, block):
+    region = PAGES[name]().crop((MARGIN_LEFT, MARGIN_TOP, WIDTH - MARGIN_LEFT, REGION_BOTTOM))
+    assert (content_bottom_from_end(region, column_offset=MARGIN_LEFT, block=block)
+            == content_bottom(region, column_offset=MARGIN_LEFT))
+
@@ -0,0 +1,112 @@
+import os
+import time
+
+from watch import STATE_FILE, FolderWatcher
+
+PDF = b'%PDF-1.4\n1 0 obj\n<<>>\nendobj\ntrailer\n<<>>\n%%EOF\n'
+SETTLE = 0.05
+
+
+def watcher(folder, events=None, **kwargs):
+    return FolderWatcher(str(folder), None, None, settle=SETTLE, events=events, **kwargs)
+
+
+def write(path, data=PDF, mtime_ns=None):
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def settled(watch):
+    time.sleep(SETTLE * 2)
+    return watch.scan()
+
+
+def converted(watch, name, error=None):
+    # What process() records for a converted PDF
+    stat = os.stat(os.path.join(watch.folder, name))
+    watch.files[name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'fields': {}, 'error': error}
+    if watch.word and error is None:
+        os.makedirs(watch.fragment_dir, exist_ok=True)
+        with open(watch._fragment_path(name), 'wb') as file:
+            file.write(b'docx')
+    watch.pending.pop(name, None)
+
+
+def test_new_pdf_waits_to_settle(tmp_path):
+    watch = watcher(tmp_path)
+    write(tmp_path / 'A.pdf')
+    (tmp_path / 'notes.txt').write_text('not a PDF')
+    assert watch.scan() == []
+    # Seen again before the settle time
+    assert watch.scan() == []
+    assert settled(watch) == ['A.pdf']
+
+
+def test_growing_pdf_starts_settling_again(tmp_path):
+    watch = watcher(tmp_path)
+    write(tmp_path / 'A.pdf', PDF[:20], mtime_ns=1_000_000_000)
+    watch.scan()
+    write(tmp_path / 'A.pdf', PDF[:30], mtime_ns=2_000_000_000)
+    time.sleep(SETTLE * 2)
+    # Changed since it was first seen: the wait starts over
+    assert watch.scan() == []
+    # Settled, but without an end-of-file marker it is not complete yet
+    assert settled(watch) == []
+    write(tmp_path / 'A.pdf', mtime_ns=3_000_000_000)
+    watch.scan()
+    assert settled(watch) == ['A.pdf']
+
+
+def test_converted_pdf_is_only_picked_up_when_changed(tmp_path):
+    watch = watcher(tmp_path)
+    write(tmp_path / 'A.pdf', mtime_ns=1_000_000_000)
+    write(tmp_path / 'B.pdf', mtime_ns=1_000_000_000)
+    watch.scan()
+    assert settled(watch) == ['A.pdf', 'B.pdf']
+    converted(watch, 'A.pdf')
+    converted(watch, 'B.pdf', error='Broken PDF')
+    assert settled(watch) == []
+
+    # A replaced PDF is converted again
+    write(tmp_path / 'A.pdf', PDF + b'\n', mtime_ns=2_000_000_000)
+    watch.scan()
+    assert settled(watch) == ['A.pdf']
+
+    # So is one whose Word fragment went missing
+    converted(watch, 'A.pdf')
+    os.remove(watch._fragment_path('A.pdf'))
+    watch.scan()
+    assert settled(watch) == ['A.pdf']
+
+
+def test_removed_pdf_leaves_the_index(tmp_path):
+    events = []
+    watch = watcher(tmp_path, events=lambda kind, **fields: events.append((kind, fields)))
+    write(tmp_path / 'A.pdf')
+    write(tmp_path / 'B.pdf')
+    converted(watch, 'A.pdf')
+    converted(watch, 'B.pdf')
+    fragment = watch._fragment_path('A.pdf')
+
+    os.remove(tmp_path / 'A.pdf')
+    assert watch.scan() == []
+    assert list(watch.files) == ['B.pdf']
+    assert not os.path.exists(fragment)
+    assert events == [('removed', {'pdf': 'A.pdf'})]
+    assert watch.dirty_since is not None
+    # The index on disk is updated straight away, so a restart agrees
+    assert list(watcher(tmp_path).files) == ['B.pdf']
+    assert (tmp_path / STATE_FILE).exists()
+
+
+def test_pdf_removed_while_settling_is_forgotten(tmp_path):
+    watch = watcher(tmp_path)
+    write(tmp_path / 'A.pdf')
+    watch.scan()
+    os.remove(tmp_path / 'A.pdf')
+    assert watch.scan() == []
+    assert watch.pending == {}
+    write(tmp_path / 'A.pdf')
+    # Back again: it has to settle from scratch
+    assert watch.scan() == []
@@ -0,0 +1,62 @@
+import numpy as np
+
+# Page furniture to cut from a 150 dpi PowerCad report render when no layout
+# profile fits the pages (see layout.py)
+MARGIN_LEFT = 170 // 2
+MARGIN_TOP = 782 // 2
+MARGIN_BOTTOM = 140 // 2
+MIN_CONTENT_HEIGHT = 5
+
+
+def row_sums(image, column_offset=0):
+    pixels = np.asarray(image, dtype=np.uint8)
+    pixels = pixels.reshape(pixels.shape[0], pixels.shape[1], -1)
+    return pixels[:, column_offset:, :].sum(axis=(1, 2), dtype=np.int64)
+
+
+def content_bottom(image, column_offset=0):
+    # The last row is taken as the background level; content ends at the
+    # lowest row above it that is darker than that.
+    sums = row_sums(image, column_offset)
+    if sums.size == 0:
+        return 0
+    darker = np.flatnonzero(sums[:-1] < sums[-1])
+    if darker.size == 0:
+        return 0
+    return int(darker[-1]) + 1
+
+
+def content_bottom_from_end(image, column_offset=0, block=128):
+    # Same result as content_bottom(), but converts only `block` rows at a
+    # time from the bottom up and stops at the first one with content, rather
+    # than summing the whole page
+    width, height = image.size
+    if height == 0 or column_offset >= width:
+        return 0
+    background = row_sums(image.crop((column_offset, height - 1, width, height)))[0]
+    end = height - 1
+    while end > 0:
+        start = max(0, end - block)
+        darker = np.flatnonzero(row_sums(image.crop((column_offset, start, width, end))) < background)
+        if darker.size:
+            return start + int(darker[-1]) + 1
+        end = start
+    return 0
+
+
+def crop_report_page(image):
+    left = MARGIN_LEFT
+    top = MARGIN_TOP
+    right = image.width - left
+    bottom = image.height - MARGIN_BOTTOM
+
+    return trim_report_region(image.crop((left, top, right, bottom)))
+
+
+def trim_report_region(image):
+    # Cuts the blank space below the content of a page already cropped to
+    # its report region. The row scan starts at the left margin.
+    bottom = content_bottom(image, column_offset=MARGIN_LEFT)
+    if bottom < MIN_CONTENT_HEIGHT:
+        return None
+    return image.crop((0, 0, image.width, bottom))
@@ -0,0 +1,208 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from concat import ReportSet
+from convert import cable_name_for
+from journal import verify_pdf
+from metrics import MetricsLog
+from parallel import Cancelled, run_jobs
+from pipeline import convert_exported_pdf
+from results import CSV_FILE, RESULTS_DB, csv_files, save_results, write_csv
+
+STATE_FILE = '0watch_state.json'
+FRAGMENT_DIR = '0watch_fragments'
+# Seconds a PDF's size and modification time must stay unchanged before it is
+# taken as fully written
+SETTLE_SECONDS = 5
+SCAN_INTERVAL = 2
+# Outputs wait for the folder to go quiet, but no longer than this while PDFs keep arriving
+PUBLISH_DELAY = 60
+
+
+def convert_watched_pdf(pdf_path, template_path, cache=None, policy=None, word=True, csv=True):
+    # Pool job: one bad PDF is reported instead of stopping the whole batch
+    try:
+        return convert_exported_pdf(pdf_path, template_path, cache, policy, word, csv), None
+    except Exception as error:
+        return (None, None), f"{type(error).__name__}: {error}"
+
+
+class FolderWatcher:
+    # Keeps the Word and CSV outputs of a folder up to date as PDFs are added,
+    # replaced or removed. Each scan is one scandir() compared against a state
+    # index persisted in the folder, so only new or changed PDFs are converted
+    # and a restart picks up where the last run stopped. Converted fields and
+    # Word fragments are kept per PDF, so the outputs are reassembled without
+    # touching the PDFs that did not change.
+
+    def __init__(self, folder, template_path, default_path, word=True, csv=True, settle=SETTLE_SECONDS,
+                 max_workers=None, cache=None, metrics=None, image_policy=None, results_db=RESULTS_DB,
+                 project=None, events=None):
+        self.folder = os.path.normpath(folder)
+        self.template_path = template_path
+        self.default_path = default_path
+        self.word = word
+        self.csv = csv
+        self.settle = settle
+        self.max_workers = max_workers
+        self.cache = cache
+        self.metrics = metrics or MetricsLog()
+        self.image_policy = image_policy
+        self.results_db = results_db
+        self.project = project
+        # events(kind, **fields) hears about processed, failed and removed PDFs and published outputs
+        self.events = events or (lambda kind, **fields: None)
+        self.state_path = os.path.join(self.folder, STATE_FILE)
+        self.fragment_dir = os.path.join(self.folder, FRAGMENT_DIR)
+        # name -> {'size', 'mtime_ns', 'fields', 'error'} of every PDF converted so far
+        self.files = self._load_state()
+        # name -> ((size, mtime_ns), first seen with that signature) while a PDF is being written
+        self.pending = {}
+        self.dirty_since = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if state.get('word') != self.word or state.get('csv') != self.csv:
+            # Converted with other outputs; start over
+            return {}
+        return state.get('files', {})
+
+    def _save_state(self):
+        # Write then rename so a crash leaves the previous index intact
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'word': self.word, 'csv': self.csv, 'files': self.files}, file)
+        os.replace(temp_path, self.state_path)
+
+    def _fragment_path(self, name):
+        return os.path.join(self.fragment_dir, os.path.splitext(name)[0] + '.docx')
+
+    def _converted(self, name, signature):
+        entry = self.files.get(name)
+        if entry is None or (entry['size'], entry['mtime_ns']) != signature:
+            return False
+        return entry.get('error') is not None or not self.word or os.path.exists(self._fragment_path(name))
+
+    def scan(self):
+        # Returns the PDFs that are ready to convert; removed PDFs are dropped
+        # from the index straight away
+        now = time.monotonic()
+        seen = set()
+        ready = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.pdf') or not entry.is_file():
+                    continue
+                seen.add(entry.name)
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self._converted(entry.name, signature):
+                    self.pending.pop(entry.name, None)
+                    continue
+                previous = self.pending.get(entry.name)
+                if previous is None or previous[0] != signature:
+                    self.pending[entry.name] = (signature, now)
+                elif now - previous[1] >= self.settle and verify_pdf(entry.path):
+                    ready.append(entry.name)
+
+        removed = [name for name in self.files if name not in seen]
+        for name in removed:
+            del self.files[name]
+            if os.path.exists(self._fragment_path(name)):
+                os.remove(self._fragment_path(name))
+            self.events('removed', pdf=name)
+        for name in [name for name in self.pending if name not in seen]:
+            del self.pending[name]
+        if removed:
+            self._save_state()
+            self._changed()
+        return sorted(ready)
+
+    def _changed(self):
+        if self.dirty_since is None:
+            self.dirty_since = time.monotonic()
+
+    def process(self, names, cancel=None):
+        signatures = {name: self.pending.pop(name)[0] for name in names}
+        if self.word:
+            os.makedirs(self.fragment_dir, exist_ok=True)
+
+        with self.metrics.stage('watch', files=len(names)):
+            jobs = ((os.path.join(self.folder, name), self.template_path, self.cache, self.image_policy, self.word,
+                     self.csv) for name in names)
+            job = self.metrics.instrument(convert_watched_pdf, 'watch')
+            results = run_jobs(job, jobs, len(names), self.max_workers, window=2, cancel=cancel)
+            for i, (((fragment, record), error), spans) in enumerate(results):
+                self.metrics.write(spans)
+                name = names[i]
+                size, mtime_ns = signatures[name]
+                entry = {'size': size, 'mtime_ns': mtime_ns, 'fields': None, 'error': error}
+                if error is None:
+                    if fragment is not None:
+                        with open(self._fragment_path(name), 'wb') as file:
+                            file.write(fragment)
+                    if record is not None:
+                        entry['fields'] = record[cable_name_for(name)]
+                    self.events('processed', pdf=name)
+                else:
+                    self.events('failed', pdf=name, error=error)
+                self.files[name] = entry
+                # Saved per PDF so an interrupted batch is not converted again
+                self._save_state()
+        self._changed()
+
+    def publish(self):
+        # Rebuilds the outputs from the index and the stored fragments, in
+        # the same file order as the other stages
+        names = sorted(name for name, entry in self.files.items() if entry.get('error') is None)
+        outputs = []
+        if self.csv:
+            data = {cable_name_for(name): self.files[name]['fields'] for name in names}
+            if self.results_db:
+                save_results(self.folder, data, self.results_db, self.project)
+            else:
+                write_csv(data, os.path.join(self.folder, CSV_FILE))
+            outputs += csv_files(data, os.path.join(self.folder, CSV_FILE))
+        if self.word:
+            report = ReportSet(self.default_path, os.path.join(self.folder, 'concatenated.docx'))
+            for name in names:
+                # Missing only while the PDF waits to be converted again
+                if os.path.exists(self._fragment_path(name)):
+                    with open(self._fragment_path(name), 'rb') as file:
+                        report.append(file.read(), name)
+            outputs += report.save()
+        self.metrics.flush()
+        self.dirty_since = None
+        self.events('published', files=len(names), outputs=outputs)
+
+    def poll(self, cancel=None):
+        # One scan, then convert whatever is ready and publish once the folder
+        # has gone quiet (or PUBLISH_DELAY has passed). Returns the number of
+        # PDFs converted.
+        ready = self.scan()
+        if ready:
+            self.process(ready, cancel)
+        if self.dirty_since is not None and (not self.pending or
+                                             time.monotonic() - self.dirty_since >= PUBLISH_DELAY):
+            self.publish()
+        return len(ready)
+
+    def run(self, interval=SCAN_INTERVAL, stop=None):
+        # Until `stop` (an Event) is set
+        stop = stop or threading.Event()
+        if not os.path.exists(self.state_path):
+            # First run in this folder: publish even if it holds no PDFs yet
+            self._changed()
+        while not stop.is_set():
+            try:
+                self.poll(cancel=stop)
+            except Cancelled:
+                break
+            stop.wait(interval)